@@ -0,0 +1,216 @@
+# app/candidates.py
+"""
+Representación compacta de los candidatos de recuperación.
+
+`CandidateSet` guarda solo posiciones de FAQ y arrays de scores (numpy) y
+referencia el store de FAQs del catálogo (la lista `catalog.faqs`) sin copiar
+textos. Cada `Candidate` es una vista liviana (con __slots__) que se comporta
+como un Mapping de solo lectura con las mismas claves que los dicts de antes:
+
+    faq_id, pregunta_faq, respuesta, score, score_dense, score_lex, score_fused
+    (+ score_rerank si el re-ranker lo puntuó)
+
+Los textos se leen del store recién cuando alguien los pide; los dicts se
+materializan solo en el borde de la respuesta (`to_dicts`, `to_jsonable`).
+"""
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+_TEXT_KEYS = ("faq_id", "pregunta_faq", "respuesta")
+_SCORE_KEYS = ("score", "score_dense", "score_lex", "score_fused")
+
+
+class Candidate(Mapping):
+    """Vista de la fila `i` de un CandidateSet."""
+
+    __slots__ = ("_set", "_i")
+
+    def __init__(self, cset: "CandidateSet", i: int):
+        self._set = cset
+        self._i = i
+
+    def __getitem__(self, key: str) -> Any:
+        s, i = self._set, self._i
+        if key in _TEXT_KEYS:
+            return s.store[s.rows[i]][key]
+        if key == "score" or key == "score_dense":
+            return float(s.score_dense[i])
+        if key == "score_lex":
+            return float(s.score_lex[i])
+        if key == "score_fused":
+            return float(s.score_fused[i])
+        if key == "score_rerank" and s.score_rerank is not None and not np.isnan(s.score_rerank[i]):
+            return float(s.score_rerank[i])
+        raise KeyError(key)
+
+    def _keys(self) -> List[str]:
+        keys = list(_TEXT_KEYS + _SCORE_KEYS)
+        s = self._set
+        if s.score_rerank is not None and not np.isnan(s.score_rerank[self._i]):
+            keys.append("score_rerank")
+        return keys
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    @property
+    def row(self) -> int:
+        return int(self._set.rows[self._i])
+
+    def to_dict(self, texts: bool = True) -> Dict[str, Any]:
+        s, i = self._set, self._i
+        faq = s.store[s.rows[i]]
+        dense = s.score_dense[i].item()
+        out = {"faq_id": faq["faq_id"], "pregunta_faq": faq["pregunta_faq"]}
+        if texts:
+            out["respuesta"] = faq["respuesta"]
+        out.update(score=dense, score_dense=dense, score_lex=s.score_lex[i].item(), score_fused=s.score_fused[i].item())
+        if s.score_rerank is not None and not np.isnan(s.score_rerank[i]):
+            out["score_rerank"] = s.score_rerank[i].item()
+        return out
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+class CandidateSet(Sequence):
+    """
+    Ranking de candidatos: `rows[i]` es la posición de la FAQ en `store` y los
+    scores son arrays float64 alineados. Slices y reordenamientos comparten el store.
+    """
+
+    __slots__ = ("store", "rows", "score_dense", "score_lex", "score_fused", "score_rerank")
+
+    def __init__(
+        self,
+        store: Sequence[Dict[str, Any]],
+        rows,
+        score_dense,
+        score_lex=None,
+        score_fused=None,
+        score_rerank=None,
+    ):
+        self.store = store
+        self.rows = np.asarray(rows, dtype=np.int64)
+        n = len(self.rows)
+        self.score_dense = np.asarray(score_dense, dtype=np.float64)
+        self.score_lex = np.zeros(n, dtype=np.float64) if score_lex is None else np.asarray(score_lex, dtype=np.float64)
+        self.score_fused = self.score_dense if score_fused is None else np.asarray(score_fused, dtype=np.float64)
+        self.score_rerank = None if score_rerank is None else np.asarray(score_rerank, dtype=np.float64)
+
+    @classmethod
+    def empty(cls, store: Sequence[Dict[str, Any]] = ()) -> "CandidateSet":
+        return cls(store, [], [])
+
+    @classmethod
+    def from_dicts(cls, dicts: Iterable[Dict[str, Any]]) -> "CandidateSet":
+        """Adapta una lista de dicts (formato anterior) usando la propia lista como store."""
+        if isinstance(dicts, CandidateSet):
+            return dicts
+        store = [d for d in dicts if "respuesta" in d and "pregunta_faq" in d]
+        dense = [_safe(d.get("score_dense", d.get("score", -1))) for d in store]
+        rerank = None
+        if any("score_rerank" in d for d in store):
+            rerank = [d.get("score_rerank", np.nan) for d in store]
+        return cls(
+            store,
+            np.arange(len(store)),
+            dense,
+            [d.get("score_lex", 0.0) for d in store],
+            [d.get("score_fused", dense[i]) for i, d in enumerate(store)],
+            rerank,
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.take(np.arange(len(self.rows))[i])
+        n = len(self.rows)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+        return Candidate(self, i)
+
+    def take(self, order, score_rerank=None) -> "CandidateSet":
+        """Subconjunto/reordenamiento por posiciones; opcionalmente fija score_rerank."""
+        order = np.asarray(order, dtype=np.int64)
+        rerank = score_rerank
+        if rerank is None and self.score_rerank is not None:
+            rerank = self.score_rerank[order]
+        return CandidateSet(
+            self.store,
+            self.rows[order],
+            self.score_dense[order],
+            self.score_lex[order],
+            self.score_fused[order],
+            rerank,
+        )
+
+    def sanitized(self) -> "CandidateSet":
+        """Scores NaN/inf → -1 (mismo criterio que el selector con dicts)."""
+        if np.isfinite(self.score_dense).all():
+            return self
+        out = self.take(np.arange(len(self.rows)))
+        out.score_dense = np.where(np.isfinite(out.score_dense), out.score_dense, -1.0).astype(np.float64)
+        return out
+
+    def faq_ids(self) -> List[str]:
+        return [self.store[r]["faq_id"] for r in self.rows]
+
+    def to_dicts(self, texts: bool = True) -> List[Dict[str, Any]]:
+        """Materializa dicts (con `texts=False` sin la respuesta, p. ej. para logs)."""
+        return [c.to_dict(texts) for c in self]
+
+    def to_score_dicts(self) -> List[Dict[str, Any]]:
+        """Solo faq_id + scores (sin textos): ranking de /chat con verbosity=ids."""
+        ids = self.faq_ids()
+        dense, lex, fused = self.score_dense.tolist(), self.score_lex.tolist(), self.score_fused.tolist()
+        out = [
+            {"faq_id": ids[i], "score_dense": dense[i], "score_lex": lex[i], "score_fused": fused[i]}
+            for i in range(len(ids))
+        ]
+        if self.score_rerank is not None:
+            for d, r in zip(out, self.score_rerank.tolist()):
+                if not np.isnan(r):
+                    d["score_rerank"] = r
+        return out
+
+    def __repr__(self) -> str:
+        return f"CandidateSet({self.to_dicts(texts=False)!r})"
+
+
+def _safe(x: Any) -> float:
+    try:
+        v = float(x)
+    except Exception:
+        return -1.0
+    return v if np.isfinite(v) else -1.0
+
+
+def to_jsonable(obj: Any, texts: bool = True) -> Any:
+    """Convierte CandidateSet/Candidate anidados (ej. meta["ranking"]) a listas/dicts."""
+    # type() y no isinstance(): los chequeos contra ABCs son caros y esto recorre todo meta
+    t = type(obj)
+    if t is dict:
+        return {k: to_jsonable(v, texts) for k, v in obj.items()}
+    if t is CandidateSet:
+        return obj.to_dicts(texts)
+    if t is list:
+        return [to_jsonable(v, texts) for v in obj]
+    if t is Candidate:
+        return obj.to_dict(texts)
+    return obj
+
+
+def as_candidate_set(candidatos: Optional[Iterable[Dict[str, Any]]]) -> CandidateSet:
+    if candidatos is None:
+        return CandidateSet.empty()
+    return CandidateSet.from_dicts(candidatos)
@@ -0,0 +1,187 @@
+# app/catalogs.py
+"""
+Registro de catálogos (multi-tenant / multi-institución) en un solo proceso.
+
+Un único SentenceTransformer (app.retriever.model) atiende a todos los tenants;
+cada tenant aporta su propio bundle índice FAISS + FAQs + TF-IDF + reglas.
+Los bundles se cargan a demanda y se desalojan por LRU cuando la memoria
+estimada supera el presupuesto.
+
+Configuración (CATALOGS_PATH, por defecto data/catalogs.json):
+
+    {
+      "tenants": {
+        "ies":   {"index_path": "models/tenants/ies/embeddings_index.faiss",
+                  "faqs_path": "models/tenants/ies/faqs.pkl",
+                  "rules_path": "data/rerank_rules.json",
+                  "telegram_token_env": "TELEGRAM_BOT_TOKEN_IES"},
+        "otro":  {}
+      }
+    }
+
+Los campos omitidos siguen la convención models/tenants/<tenant>/{embeddings_index.faiss,faqs.pkl}.
+Un tenant vacío/None (o "default") usa el catálogo por defecto de app.retriever.
+
+app.retriever (modelo + índice por defecto) se importa recién al primer `get`:
+los clientes del servicio de recuperación (RETRIEVAL_SOCKET) usan el registro
+solo por la configuración (tokens de Telegram) y no cargan nada.
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from app.rerank_rules import RULES_PATH
+
+if TYPE_CHECKING:
+    from app.retriever import CatalogBundle
+
+CATALOGS_PATH = os.getenv("CATALOGS_PATH", "data/catalogs.json")
+TENANTS_DIR = os.getenv("TENANTS_DIR", "models/tenants")
+CATALOG_MEMORY_BUDGET_MB = float(os.getenv("CATALOG_MEMORY_BUDGET_MB", 2048))
+
+# = app.retriever.FAISS_INDEX_PATH / FAQS_PICKLE_PATH, sin importar el modelo
+DEFAULT_INDEX_PATH = "models/embeddings_index.faiss"
+DEFAULT_FAQS_PATH = "models/faqs.pkl"
+
+_TENANT_RE = re.compile(r"^[\w-]{1,64}$")
+
+
+class UnknownTenantError(KeyError):
+    """El tenant pedido no está configurado ni tiene artefactos en disco."""
+
+
+class CatalogRegistry:
+    def __init__(self, config_path: str = CATALOGS_PATH, budget_mb: float = CATALOG_MEMORY_BUDGET_MB):
+        self.config_path = config_path
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._config: Dict[str, Dict[str, Any]] = self._read_config(config_path)
+        self._loaded: "OrderedDict[str, CatalogBundle]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._stats = {"hits": 0, "loads": 0, "evictions": 0}
+
+    @staticmethod
+    def _read_config(path: str) -> Dict[str, Dict[str, Any]]:
+        p = Path(path)
+        if not p.exists():
+            return {}
+        data = json.loads(p.read_text(encoding="utf-8"))
+        return {str(k): (v or {}) for k, v in (data.get("tenants") or {}).items()}
+
+    def _paths(self, tenant: str) -> Dict[str, str]:
+        conf = self._config.get(tenant, {})
+        base = os.path.join(TENANTS_DIR, tenant)
+        return {
+            "index_path": conf.get("index_path") or os.path.join(base, "embeddings_index.faiss"),
+            "faqs_path": conf.get("faqs_path") or os.path.join(base, "faqs.pkl"),
+            "rules_path": conf.get("rules_path") or RULES_PATH,
+        }
+
+    def _known_paths(self, tenant: str) -> Dict[str, str]:
+        """Rutas de un tenant existente (configurado o con índice en disco); si no, UnknownTenantError."""
+        if not _TENANT_RE.match(tenant):
+            raise UnknownTenantError(tenant)
+        paths = self._paths(tenant)
+        if tenant not in self._config and not os.path.exists(paths["index_path"]):
+            raise UnknownTenantError(tenant)
+        return paths
+
+    def faqs_path(self, tenant: Optional[str] = None) -> str:
+        """Ruta de faqs.pkl del tenant sin cargar el catálogo (ej. para /suggest)."""
+        if not tenant or tenant == "default":
+            return DEFAULT_FAQS_PATH
+        return self._known_paths(tenant)["faqs_path"]
+
+    def index_path(self, tenant: Optional[str] = None) -> str:
+        """Ruta del índice FAISS del tenant sin cargar el catálogo (ej. para calibrar)."""
+        if not tenant or tenant == "default":
+            return DEFAULT_INDEX_PATH
+        return self._known_paths(tenant)["index_path"]
+
+    def tenants(self):
+        return sorted(self._config)
+
+    def tenant_for_token(self, token: str) -> Optional[str]:
+        """Tenant asociado a un token de bot de Telegram (via `telegram_token_env`)."""
+        for tenant, conf in self._config.items():
+            env = conf.get("telegram_token_env")
+            if env and os.getenv(env) == token:
+                return tenant
+        return None
+
+    def telegram_tokens(self) -> Dict[str, str]:
+        """{tenant: token} para los tenants con token de Telegram definido en el entorno."""
+        out = {}
+        for tenant, conf in self._config.items():
+            env = conf.get("telegram_token_env")
+            if env and os.getenv(env):
+                out[tenant] = os.getenv(env)
+        return out
+
+    def get(self, tenant: Optional[str] = None) -> "CatalogBundle":
+        """Devuelve el bundle del tenant, cargándolo si hace falta."""
+        from app.retriever import default_catalog, load_catalog
+
+        if not tenant or tenant == "default":
+            return default_catalog
+
+        with self._lock:
+            bundle = self._loaded.get(tenant)
+            if bundle is not None:
+                self._loaded.move_to_end(tenant)
+                self._stats["hits"] += 1
+                return bundle
+        # Antes de crear su lock de carga: un tenant inexistente no deja estado
+        paths = self._known_paths(tenant)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(tenant, threading.Lock())
+
+        # Carga fuera del lock global: un tenant lento no bloquea a los demás
+        with load_lock:
+            with self._lock:
+                bundle = self._loaded.get(tenant)
+                if bundle is not None:
+                    self._loaded.move_to_end(tenant)
+                    return bundle
+
+            bundle = load_catalog(tenant, paths["index_path"], paths["faqs_path"], paths["rules_path"])
+
+            with self._lock:
+                self._loaded[tenant] = bundle
+                self._sizes[tenant] = bundle.nbytes()
+                self._stats["loads"] += 1
+                self._evict(keep=tenant)
+        return bundle
+
+    def _evict(self, keep: str) -> None:
+        """Desaloja por LRU hasta entrar en el presupuesto (nunca el recién cargado)."""
+        while sum(self._sizes.values()) > self.budget_bytes and len(self._loaded) > 1:
+            victim = next(iter(self._loaded))
+            if victim == keep:
+                self._loaded.move_to_end(victim)
+                victim = next(iter(self._loaded))
+            self._loaded.pop(victim)
+            self._sizes.pop(victim, None)
+            self._load_locks.pop(victim, None)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "loaded": list(self._loaded),
+                "loaded_mb": round(sum(self._sizes.values()) / (1024 * 1024), 2),
+                "budget_mb": round(self.budget_bytes / (1024 * 1024), 2),
+            }
+
+
+registry = CatalogRegistry()
+
+
+def get_catalog(tenant: Optional[str] = None) -> "CatalogBundle":
+    return registry.get(tenant)
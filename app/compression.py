@@ -0,0 +1,97 @@
+# app/compression.py
+"""
+Compresión de respuestas HTTP negociada por Accept-Encoding (br > gzip).
+
+Middleware ASGI para respuestas de un solo bloque (las de la API JSON): si el
+cliente acepta brotli y el paquete `brotli` está instalado se usa `br`; si no,
+gzip (stdlib). Los cuerpos menores a `minimum_size` (p. ej. /chat con
+verbosity=minimal) salen sin comprimir: comprimir unos cientos de bytes cuesta
+más CPU de lo que ahorra en red. Las respuestas en streaming pasan intactas.
+"""
+import gzip
+import os
+from typing import List, Optional
+
+try:
+    import brotli  # opcional: pip install brotli
+    HAS_BROTLI = True
+except Exception:
+    brotli = None
+    HAS_BROTLI = False
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Codificación a usar según el header Accept-Encoding (None = identidad)."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if HAS_BROTLI and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for k, v in scope.get("headers", []):
+            if k == b"accept-encoding":
+                accept = v.decode("latin-1")
+                break
+        encoding = choose_encoding(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            headers: List = list(start["headers"])
+            already = any(k == b"content-encoding" for k, _ in headers)
+            if message.get("more_body") or already or len(body) < self.minimum_size:
+                # streaming, ya codificada o chica: sin tocar
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            body = compress(body, encoding)
+            headers = [(k, v) for k, v in headers if k != b"content-length"]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, wrapped_send)
@@ -1,10 +1,22 @@
 # app/dialogue_manager.py
-from collections import defaultdict, deque
-import re
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from app.query_analysis import analyze_query, content_tokens
 
 # Memoria de usuario: {user_id: deque([(user_msg, bot_msg), ...])}
 user_memory = defaultdict(lambda: deque(maxlen=4))
 
+# Opciones ofrecidas en la última aclaración, por usuario (session_id / chat de Telegram)
+CLARIFY_TTL_S = float(os.getenv("CLARIFY_TTL_S", 900))
+CLARIFY_MAX_SESSIONS = int(os.getenv("CLARIFY_MAX_SESSIONS", 10000))
+# Cobertura mínima de los tokens del mensaje por una opción para elegirla sin ordinal
+CLARIFY_MATCH_MIN = 0.6
+
 def update_memory(user_id, user_msg, bot_msg):
     """
     Guarda el último turno de conversación (entrada del usuario y respuesta del bot)
@@ -23,18 +35,9 @@ def detect_reference(user_msg):
     """
     Detecta si el usuario hace una referencia implícita a una respuesta anterior.
     Ejemplos: "eso", "lo anterior", "repetí", "cuáles eran"
+    Los patrones están precompilados en app.query_analysis (una sola pasada, cacheada).
     """
-    patrones = [
-        r"\beso\b",
-        r"\blo anterior\b",
-        r"\brepet[íi]\b",
-        r"\bcu[aá]les eran\b",
-        r"\bme lo pod[eé]s repetir\b",
-        r"\bla info\b",
-        r"\bese dato\b"
-    ]
-    texto = user_msg.lower()
-    return any(re.search(pat, texto) for pat in patrones)
+    return analyze_query(user_msg).is_reference
 
 
 def reformulate_query(user_msg, memory):
@@ -61,4 +64,133 @@ def handle_input(user_id, user_msg):
         query_reformulada = reformulate_query(user_msg, memoria)
         return query_reformulada, True
     else:
-        return user_msg, False
\ No newline at end of file
+        return user_msg, False
+
+
+# ================= Respuesta a una aclaración =================
+# Tras un tie-break (o un fallback con sugerencias) se guardan las opciones
+# mostradas. Si el siguiente mensaje del mismo usuario es "la primera", "2" o
+# el texto (parcial) de una opción, se responde esa FAQ sin volver a recuperar.
+
+# Tokens (plegados) que se ignoran al buscar un ordinal: "la primera opción por favor"
+_ORDINAL_FILLER = frozenset({
+    "la", "el", "lo", "de", "opcion", "opciones", "numero", "nro", "n", "quiero", "me", "interesa",
+    "por", "favor", "porfa", "esa", "ese", "es", "seria", "y", "pregunta",
+})
+_ORDINALS = {
+    "1": 0, "uno": 0, "primera": 0, "primero": 0, "primer": 0, "1ra": 0, "1era": 0, "1ro": 0, "1ero": 0,
+    "2": 1, "dos": 1, "segunda": 1, "segundo": 1, "2da": 1, "2do": 1,
+    "3": 2, "tres": 2, "tercera": 2, "tercero": 2, "tercer": 2, "3ra": 2, "3era": 2, "3ro": 2,
+    "4": 3, "cuatro": 3, "cuarta": 3, "cuarto": 3,
+    "5": 4, "cinco": 4, "quinta": 4, "quinto": 4,
+    "ultima": -1, "ultimo": -1,
+}
+
+
+@dataclass(frozen=True)
+class PendingClarification:
+    options: Tuple[Tuple[str, str, str], ...]   # (faq_id, pregunta_faq, respuesta) en el orden mostrado
+    option_tokens: Tuple[FrozenSet[str], ...]   # tokens de contenido de cada pregunta
+    tenant: Optional[str]
+    ordinal_ok: bool                            # False si el texto lo redactó el LLM (orden no garantizado)
+    ts: float
+
+
+_pending: "OrderedDict[str, PendingClarification]" = OrderedDict()
+_pending_lock = threading.Lock()
+_clarify_stats = {"offered": 0, "resolved_ordinal": 0, "resolved_fuzzy": 0, "unresolved": 0, "expired": 0}
+
+
+def remember_options(user_id: str, sel: Dict[str, Any], tenant: Optional[str] = None, show_k: int = 3) -> None:
+    """
+    Guarda las opciones que mostró la respuesta `sel` (tie-break o fallback con
+    sugerencias). Cualquier otra respuesta borra las opciones pendientes.
+    """
+    meta = sel.get("meta") or {}
+    ranking = meta.get("ranking")
+    if sel.get("mode") not in ("tie-break", "fallback") or not ranking:
+        with _pending_lock:
+            _pending.pop(user_id, None)
+        return
+    options = tuple((str(c["faq_id"]), c["pregunta_faq"], c["respuesta"]) for c in ranking[:show_k])
+    pending = PendingClarification(
+        options=options,
+        option_tokens=tuple(content_tokens(q) for _, q, _ in options),
+        tenant=tenant,
+        ordinal_ok=not meta.get("used_generator"),
+        ts=time.monotonic(),
+    )
+    with _pending_lock:
+        _pending[user_id] = pending
+        _pending.move_to_end(user_id)
+        while len(_pending) > CLARIFY_MAX_SESSIONS:
+            _pending.popitem(last=False)
+        _clarify_stats["offered"] += 1
+
+
+def _match_ordinal(tokens: Tuple[str, ...], n: int) -> Optional[int]:
+    picks = [_ORDINALS[t] for t in tokens if t in _ORDINALS]
+    if len(picks) != 1 or any(t not in _ORDINALS and t not in _ORDINAL_FILLER for t in tokens):
+        return None
+    i = picks[0] % n if picks[0] < 0 else picks[0]
+    return i if i < n else None
+
+
+def _match_fuzzy(msg_tokens: FrozenSet[str], pending: PendingClarification) -> Optional[int]:
+    if not msg_tokens:
+        return None
+    cover = [len(msg_tokens & opt) / len(msg_tokens) for opt in pending.option_tokens]
+    best = max(range(len(cover)), key=cover.__getitem__)
+    if cover[best] < CLARIFY_MATCH_MIN:
+        return None
+    if cover.count(cover[best]) > 1:
+        # Varias opciones contienen al mensaje: solo vale si es el texto completo de una
+        exact = [i for i, opt in enumerate(pending.option_tokens) if opt == msg_tokens]
+        return exact[0] if len(exact) == 1 else None
+    return best
+
+
+def resolve_clarification(user_id: str, user_msg: str, tenant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Si `user_msg` elige una de las opciones pendientes del usuario (por ordinal o
+    por texto), retorna la respuesta extractiva {mode, answer, meta} de esa FAQ.
+    Retorna None si no hay opciones pendientes o el mensaje es otra consulta;
+    en ambos casos las opciones se consumen (valen solo para el turno siguiente).
+    """
+    with _pending_lock:
+        pending = _pending.pop(user_id, None)
+    if pending is None:
+        return None
+    if time.monotonic() - pending.ts > CLARIFY_TTL_S or pending.tenant != tenant:
+        with _pending_lock:
+            _clarify_stats["expired"] += 1
+        return None
+
+    analysis = analyze_query(user_msg)
+    how = "ordinal"
+    i = _match_ordinal(analysis.tokens, len(pending.options)) if pending.ordinal_ok else None
+    if i is None:
+        how = "fuzzy"
+        i = _match_fuzzy(analysis.content_tokens, pending)
+    with _pending_lock:
+        _clarify_stats["unresolved" if i is None else f"resolved_{how}"] += 1
+    if i is None:
+        return None
+
+    faq_id, pregunta, respuesta = pending.options[i]
+    meta = {
+        "decision": "clarification",
+        "reason": "clarification_reply",
+        "resolved_by": how,
+        "option": i + 1,
+        "faq_id": faq_id,
+        "top1_faq": pregunta,
+    }
+    if tenant:
+        meta["tenant"] = tenant
+    return {"mode": "extractive", "answer": respuesta, "meta": meta}
+
+
+def get_clarify_stats() -> Dict[str, int]:
+    with _pending_lock:
+        return {**_clarify_stats, "pending": len(_pending)}
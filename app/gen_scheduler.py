@@ -0,0 +1,196 @@
+# app/gen_scheduler.py
+"""
+Control de admisión para llamadas al LLM.
+
+Cada backend tiene un pool de concurrencia acotado y una cola de espera con
+prioridad: "clarify" pasa antes que "polish" porque bloquea la conversación.
+Si la cola está llena (o se supera el tiempo máximo de espera) la llamada se
+rechaza y el selector degrada al camino extractivo / desambiguación sin LLM.
+Con la cola llena, un "clarify" desplaza al último "polish" en espera.
+
+Las llamadas de fondo (warm-up, ver app/warmup.py) nunca hacen cola: entran
+solo si quedan GEN_BACKGROUND_LEAVE_FREE lugares libres después de tomar el suyo.
+
+Expone profundidad de cola y histogramas de espera para /metrics.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+GEN_MAX_CONCURRENCY = int(os.getenv("GEN_MAX_CONCURRENCY", 2))   # llamadas simultáneas por backend
+GEN_MAX_QUEUE = int(os.getenv("GEN_MAX_QUEUE", 16))              # esperando turno, por backend
+GEN_MAX_QUEUE_MS = float(os.getenv("GEN_MAX_QUEUE_MS", 2000))    # espera máxima en cola
+# Lugares que una llamada de fondo deja libres para el tráfico real
+GEN_BACKGROUND_LEAVE_FREE = int(os.getenv("GEN_BACKGROUND_LEAVE_FREE", 1))
+
+# Menor = más prioritario
+PRIORITY = {"clarify": 0, "polish": 1}
+
+
+class GenerationRejected(Exception):
+    """La llamada al LLM no fue admitida (cola llena o espera vencida)."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Histogram:
+    """Histograma acumulativo de buckets fijos (estilo Prometheus)."""
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # último = +Inf
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.total += v
+        self.n += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {str(b): c for b, c in zip(self.bounds, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {"buckets": buckets, "count": self.n, "sum": round(self.total, 2)}
+
+
+class PriorityLimiter:
+    """Semáforo con cola de prioridad (FIFO dentro de la misma prioridad)."""
+
+    def __init__(self, name: str, max_concurrency: int = GEN_MAX_CONCURRENCY, max_queue: int = GEN_MAX_QUEUE):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._heap: List[list] = []      # [priority, seq, vivo, motivo_rechazo]
+        self._seq = itertools.count()
+        self._stats = {"admitted": 0, "shed_queue_full": 0, "queue_timeout": 0, "preempted": 0}
+        self.wait_ms = Histogram([1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000])
+        self.depth = Histogram([0, 1, 2, 4, 8, 16, 32, 64])
+
+    def _pop_dead(self) -> None:
+        while self._heap and not self._heap[0][2]:
+            heapq.heappop(self._heap)
+
+    def acquire(self, priority: int, timeout: float) -> float:
+        """
+        Espera turno (como mucho `timeout` segundos). Retorna la espera en ms.
+        Lanza GenerationRejected si la cola está llena o se vence la espera.
+        """
+        t0 = time.monotonic()
+        with self._cond:
+            self._pop_dead()
+            queued = sum(1 for e in self._heap if e[2])
+            self.depth.observe(queued)
+            if self._active < self.max_concurrency and not queued:
+                self._active += 1
+                self._stats["admitted"] += 1
+                self.wait_ms.observe(0.0)
+                return 0.0
+            if queued >= self.max_queue:
+                # Cola llena: un pedido más prioritario desplaza al último de menor prioridad
+                victims = [e for e in self._heap if e[2] and e[0] > priority]
+                if not victims:
+                    self._stats["shed_queue_full"] += 1
+                    raise GenerationRejected("queue_full")
+                victim = max(victims, key=lambda e: (e[0], e[1]))
+                victim[2], victim[3] = False, "preempted"
+                self._stats["preempted"] += 1
+                self._cond.notify_all()
+
+            entry = [priority, next(self._seq), True, None]
+            heapq.heappush(self._heap, entry)
+            deadline = t0 + max(0.0, timeout)
+            while True:
+                if not entry[2]:
+                    raise GenerationRejected(entry[3] or "queue_full")
+                self._pop_dead()
+                if self._heap and self._heap[0] is entry and self._active < self.max_concurrency:
+                    heapq.heappop(self._heap)
+                    self._active += 1
+                    self._stats["admitted"] += 1
+                    waited = (time.monotonic() - t0) * 1000.0
+                    self.wait_ms.observe(waited)
+                    # Puede haber lugar para el siguiente de la cola
+                    self._cond.notify_all()
+                    return waited
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    entry[2], entry[3] = False, "queue_timeout"
+                    self._stats["queue_timeout"] += 1
+                    self._cond.notify_all()
+                    raise GenerationRejected("queue_timeout")
+                self._cond.wait(remaining)
+
+    def try_acquire(self, leave_free: int = 0) -> bool:
+        """Toma un lugar solo si está libre ya mismo (sin hacer cola) y quedan `leave_free` libres."""
+        with self._cond:
+            self._pop_dead()
+            if self._active + leave_free < self.max_concurrency and not any(e[2] for e in self._heap):
+                self._active += 1
+                self._stats["admitted"] += 1
+                return True
+            return False
+
+    def release(self) -> None:
+        with self._cond:
+            self._active = max(0, self._active - 1)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._stats,
+                "active": self._active,
+                "queue_depth": sum(1 for e in self._heap if e[2]),
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "wait_ms": self.wait_ms.snapshot(),
+                "depth_at_arrival": self.depth.snapshot(),
+            }
+
+
+_limiters: Dict[str, PriorityLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(backend: str) -> PriorityLimiter:
+    with _limiters_lock:
+        if backend not in _limiters:
+            _limiters[backend] = PriorityLimiter(backend)
+        return _limiters[backend]
+
+
+def priority_for(mode: str) -> int:
+    return PRIORITY.get(mode, max(PRIORITY.values()))
+
+
+_background = threading.local()
+
+
+@contextmanager
+def background_calls():
+    """Marca las llamadas al LLM del hilo actual como de fondo (ver try_acquire)."""
+    prev = getattr(_background, "on", False)
+    _background.on = True
+    try:
+        yield
+    finally:
+        _background.on = prev
+
+
+def is_background() -> bool:
+    return getattr(_background, "on", False)
+
+
+def get_scheduler_stats() -> Dict[str, Any]:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: lim.stats() for name, lim in limiters.items()}
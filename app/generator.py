@@ -1,6 +1,21 @@
 import os
 import json
-from typing import List, Dict
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, List, Dict, Optional, Tuple
+
+from app.gen_scheduler import (
+    GEN_BACKGROUND_LEAVE_FREE,
+    GEN_MAX_QUEUE_MS,
+    GenerationRejected,
+    get_limiter,
+    is_background,
+    priority_for,
+)
 
 SYSTEM_RULES = """
 Eres un asistente de FAQ institucional. Debes:
@@ -20,53 +35,161 @@ def _debullify(text: str) -> str:
     # Normaliza espacios dobles
     return " ".join(out.split())
 
-def _ctx_to_qa_text(context_pairs: List[Dict], k: int = 3) -> str:
-    return "\n\n".join(
-        f"Q: {c.get('pregunta_faq','')}\nA: {c.get('respuesta','')}"
-        for c in context_pairs[:k]
-        if isinstance(c, dict)
-    ).strip()
+# ================== Armado del prompt ==================
+# El prompt va en dos mensajes: el system es FIJO por modo (reglas + tarea) y el
+# user lleva solo lo variable (contexto, consulta, respuesta base). Así el prefijo
+# tokenizado se repite entre requests y el servidor reutiliza su KV-cache.
+# Presupuesto del prompt completo (tokens estimados) por modo: el contexto se recorta para entrar.
+GEN_PROMPT_BUDGET = {
+    "clarify": int(os.getenv("GEN_PROMPT_BUDGET_CLARIFY", 450)),
+    "polish": int(os.getenv("GEN_PROMPT_BUDGET_POLISH", 600)),
+}
+GEN_CTX_PAIRS = int(os.getenv("GEN_CTX_PAIRS", 3))
+# Recorte de cada respuesta del contexto: en clarify solo importan los títulos
+GEN_CTX_ANSWER_CHARS = {"clarify": 160, "polish": int(os.getenv("GEN_CTX_ANSWER_CHARS", 600))}
+# Estimación barata de tokens (español, tokenizers BPE tipo llama3/gpt-4o)
+GEN_CHARS_PER_TOKEN = float(os.getenv("GEN_CHARS_PER_TOKEN", 3.5))
 
-def build_prompt(query: str, base_answer: str, context_pairs: List[Dict], mode: str) -> str:
-    ctx_str = _ctx_to_qa_text(context_pairs, k=3)
+_MODE_TASKS = {
+    "clarify": (
+        "Tarea (CLARIFY):\n"
+        "1) Redacta UNA sola pregunta breve y natural para desambiguar (NO uses el prefijo 'Pregunta:').\n"
+        "2) A continuación agrega EXACTAMENTE la línea: 'Por favor, respóndeme con alguna de estas opciones:'\n"
+        "3) Luego incluye 2–3 opciones cortas derivadas de los TÍTULOS del contexto, en viñetas con guion (-), una por línea.\n"
+        "4) No agregues encabezados, notas meta ni otro texto.\n"
+        "Devuelve SOLO ese texto final."
+    ),
+    "polish": (
+        "Tarea (POLISH):\n"
+        "Reescribe la 'Respuesta base' en PROSA NATURAL (1 a 2 frases),"
+        " sin agregar información y SIN usar viñetas, guiones, listas ni encabezados."
+        " Evita enumeraciones o bullets (no uses -, •, *)."
+        " Devuelve SOLO el texto final, en un único bloque de prosa."
+    ),
+    # Fallback: tratar como polish mínimo
+    "default": "Tarea: Reescribe la 'Respuesta base' de forma clara y breve.",
+}
 
-    if mode == "clarify":
-        # Formato natural: pregunta breve + línea guía + bullets con guion
-        return (
-            f"{SYSTEM_RULES}\n\n"
-            f"Consulta del usuario:\n{query}\n\n"
-            f"Contexto (pares Q/A):\n{ctx_str}\n\n"
-            "Tarea (CLARIFY):\n"
-            "1) Redacta UNA sola pregunta breve y natural para desambiguar (NO uses el prefijo 'Pregunta:').\n"
-            "2) A continuación agrega EXACTAMENTE la línea: 'Por favor, respóndeme con alguna de estas opciones:'\n"
-            "3) Luego incluye 2–3 opciones cortas derivadas de los TÍTULOS del contexto, en viñetas con guion (-), una por línea.\n"
-            "4) No agregues encabezados, notas meta ni otro texto.\n\n"
-            "Devuelve SOLO ese texto final."
-        )
 
-    if mode == "polish":
-        return (
-            f"{SYSTEM_RULES}\n\n"
-            f"Consulta del usuario:\n{query}\n\n"
-            f"Contexto (pares Q/A):\n{ctx_str}\n\n"
-            "Tarea (POLISH):\n"
-            "Reescribe la 'Respuesta base' en PROSA NATURAL (1 a 2 frases),"
-            " sin agregar información y SIN usar viñetas, guiones, listas ni encabezados."
-            " Evita enumeraciones o bullets (no uses -, •, *)."
-            " Devuelve SOLO el texto final, en un único bloque de prosa.\n\n"
-            f"Respuesta base:\n{base_answer}\n"
-        )
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / GEN_CHARS_PER_TOKEN) + 1 if text else 0
 
-    # Fallback: tratar como polish mínimo
-    return (
-        f"{SYSTEM_RULES}\n\n"
-        f"Consulta del usuario:\n{query}\n\n"
-        f"Contexto (pares Q/A):\n{ctx_str}\n\n"
-        "Tarea: Reescribe la 'Respuesta base' de forma clara y breve.\n\n"
-        f"Respuesta base:\n{base_answer}\n"
+
+def _clip(text: str, max_chars: int) -> str:
+    """Corta en borde de palabra y marca el recorte."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0].rstrip(" ,;:.")
+    return f"{cut}…"
+
+
+def system_prompt(mode: str) -> str:
+    """Mensaje system: reglas + tarea del modo. No depende del request."""
+    return f"{SYSTEM_RULES.strip()}\n\n{_MODE_TASKS.get(mode, _MODE_TASKS['default'])}"
+
+
+@dataclass(frozen=True)
+class PromptParts:
+    system: str
+    user: str
+    mode: str
+    tokens: int          # estimados, system + user
+    ctx_used: int        # pares Q/A que entraron
+    ctx_dropped: int     # descartados por duplicados o por presupuesto
+
+    def messages(self) -> List[Dict[str, str]]:
+        return [{"role": "system", "content": self.system}, {"role": "user", "content": self.user}]
+
+
+def _variable_tail(query: str, base_answer: str, mode: str) -> str:
+    tail = f"Consulta del usuario:\n{query.strip()}"
+    if mode != "clarify":
+        tail += f"\n\nRespuesta base:\n{base_answer.strip()}"
+    return tail
+
+
+def _ctx_limit(mode: str) -> Optional[int]:
+    # En clarify las opciones salen del contexto: el selector ya pasa solo sus show_k
+    return None if mode == "clarify" else GEN_CTX_PAIRS
+
+
+def build_messages(query: str, base_answer: str, context_pairs: Sequence[Mapping], mode: str) -> PromptParts:
+    """
+    Arma (system, user) dentro del presupuesto del modo.
+    - Las reglas van una sola vez, en el system; la tarea del modo también.
+    - El user sigue un orden fijo: contexto, consulta y, en polish, respuesta base.
+    - Contexto: pares sin preguntas repetidas (hasta GEN_CTX_PAIRS en polish); en
+      polish se omite la respuesta que coincide con la base (ya va completa al final).
+    - polish: los pares se agregan en orden de ranking mientras entren; el último
+      puede ir recortado.
+    - clarify: entran TODAS las preguntas (son las opciones a ofrecer) y lo que
+      sobra del presupuesto se reparte entre las respuestas, que se recortan o se
+      omiten. Nunca se descarta un par entero.
+    """
+    system = system_prompt(mode)
+    tail = _variable_tail(query, base_answer, mode)
+    budget = GEN_PROMPT_BUDGET.get(mode, GEN_PROMPT_BUDGET["polish"])
+    header = "Contexto (pares Q/A):\n"
+    room = budget - estimate_tokens(system) - estimate_tokens(tail) - estimate_tokens(header)
+    max_chars = GEN_CTX_ANSWER_CHARS.get(mode, GEN_CTX_ANSWER_CHARS["polish"])
+    base_norm = " ".join(base_answer.split())
+
+    pairs: List[Tuple[str, str]] = []
+    seen = set()
+    candidates = [c for c in context_pairs[:_ctx_limit(mode)] if isinstance(c, Mapping)]
+    for c in candidates:
+        q = (c.get("pregunta_faq") or "").strip()
+        a = " ".join((c.get("respuesta") or "").split())
+        if not q or q.lower() in seen:
+            continue
+        seen.add(q.lower())
+        if mode != "clarify" and a == base_norm:
+            a = "(la respuesta base)"
+        pairs.append((q, a))
+
+    blocks: List[str] = []
+    if mode == "clarify":
+        # Primero se reservan todas las preguntas; cada respuesta toma su parte del resto
+        room -= sum(estimate_tokens(f"Q: {q}") + 1 for q, _ in pairs)
+        for i, (q, a) in enumerate(pairs):
+            block = f"Q: {q}"
+            share = room / (len(pairs) - i)
+            spare = min(max_chars, int((share - 2) * GEN_CHARS_PER_TOKEN))
+            if a and spare >= 40:
+                block += f"\nA: {_clip(a, spare)}"
+                room -= estimate_tokens(block) - estimate_tokens(f"Q: {q}")
+            blocks.append(block)
+    else:
+        for q, a in pairs:
+            block = f"Q: {q}\nA: {_clip(a, max_chars)}" if a else f"Q: {q}"
+            cost = estimate_tokens(block) + 1
+            if cost > room:
+                # Lo que queda alcanza para la pregunta y un trozo de la respuesta
+                spare = int((room - estimate_tokens(f"Q: {q}\nA: ") - 1) * GEN_CHARS_PER_TOKEN)
+                if spare < 40:
+                    break
+                block = f"Q: {q}\nA: {_clip(a, spare)}"
+                cost = estimate_tokens(block) + 1
+            blocks.append(block)
+            room -= cost
+
+    user = (header + "\n\n".join(blocks) + f"\n\n{tail}") if blocks else tail
+    return PromptParts(
+        system=system,
+        user=user,
+        mode=mode,
+        tokens=estimate_tokens(system) + estimate_tokens(user),
+        ctx_used=len(blocks),
+        ctx_dropped=len(candidates) - len(blocks),
     )
 
-def parse_context(context: str) -> List[Dict]:
+def parse_context(context: Any) -> Sequence[Mapping]:
+    """
+    Contexto para el prompt: secuencia de pares {pregunta_faq, respuesta}
+    (lista de dicts o CandidateSet del retriever). Acepta también el JSON de antes.
+    """
+    if isinstance(context, Sequence) and not isinstance(context, (str, bytes)):
+        return context
     try:
         obj = json.loads(context)
         if isinstance(obj, list):
@@ -78,11 +201,22 @@ def parse_context(context: str) -> List[Dict]:
 # ================== Backends ==================
 
 class GeneratorBackend:
-    def rewrite(self, query: str, base_answer: str, context_pairs: List[Dict], mode: str = "polish") -> str:
+    def rewrite(
+        self,
+        query: str,
+        base_answer: str,
+        context_pairs: List[Dict],
+        mode: str = "polish",
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Reescribe/aclara con el LLM. Ante errores LANZA excepción (no la traga):
+        la capa de resiliencia decide el fallback y alimenta el circuit breaker.
+        """
         raise NotImplementedError
 
 class MockBackend(GeneratorBackend):
-    def rewrite(self, query, base_answer, context_pairs, mode="polish") -> str:
+    def rewrite(self, query, base_answer, context_pairs, mode="polish", timeout=None) -> str:
         if mode == "clarify":
             opts = [c.get("pregunta_faq") for c in context_pairs[:3] if "pregunta_faq" in c]
             opt_str = "".join([f"\n- {o}" for o in opts]) if opts else ""
@@ -90,6 +224,14 @@ class MockBackend(GeneratorBackend):
         return base_answer
 
 # ---- OLLAMA (local) ----
+# Ventana de contexto: 0 = la más chica que entra con cualquier modo (presupuesto + salida).
+# Es fija a propósito: Ollama recarga el modelo si cambia num_ctx entre requests.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 0))
+OLLAMA_NUM_CTX_STEP = 256
+# Cuánto queda cargado el modelo (y su KV-cache) sin requests
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+
 class OllamaBackend(GeneratorBackend):
     def __init__(self, model: str = None, host: str = None, temperature: float = 0.2, max_tokens: int = 320):
         self.model = model or os.getenv("OLLAMA_MODEL", "llama3")
@@ -97,40 +239,43 @@ class OllamaBackend(GeneratorBackend):
         self.temperature = float(os.getenv("OLLAMA_TEMPERATURE", temperature))
         self.max_tokens = int(os.getenv("OLLAMA_MAX_TOKENS", max_tokens))
 
-    def rewrite(self, query, base_answer, context_pairs, mode="polish") -> str:
-        import requests
-        prompt = build_prompt(query, base_answer, context_pairs, mode)
+    def num_ctx(self, prompt_tokens: int) -> int:
+        need = max(max(GEN_PROMPT_BUDGET.values()), prompt_tokens) + self.max_tokens
+        if OLLAMA_NUM_CTX:
+            need = max(OLLAMA_NUM_CTX, need)
+        # Solo un prompt fuera de presupuesto (respuesta base enorme) agranda la ventana
+        return -(-need // OLLAMA_NUM_CTX_STEP) * OLLAMA_NUM_CTX_STEP
 
-        payload = {
+    def payload(self, parts: PromptParts, stream: bool = False) -> Dict[str, Any]:
+        return {
             "model": self.model,
-            "messages": [
-                {"role": "system", "content": SYSTEM_RULES},
-                {"role": "user", "content": prompt}
-            ],
+            "messages": parts.messages(),
             "options": {
                 "temperature": self.temperature,
-                "num_ctx": 2048
+                "num_ctx": self.num_ctx(parts.tokens),
+                "num_predict": self.max_tokens,
             },
-            "stream": False
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "stream": stream,
         }
+
+    def rewrite(self, query, base_answer, context_pairs, mode="polish", timeout=None) -> str:
+        import requests
+        payload = self.payload(build_messages(query, base_answer, context_pairs, mode))
         url = f"{self.host}/api/chat"
-        try:
-            r = requests.post(url, json=payload, timeout=120)
-            r.raise_for_status()
-            data = r.json()
-            if isinstance(data, dict):
-                msg = data.get("message", {})
-                content = (msg or {}).get("content", "") or ""
-                content = content.strip()
-                if mode == "polish":
-                    try:
-                        content = _debullify(content)
-                    except Exception:
-                        pass
-        except Exception as e:
-            print(f"[GEN][ollama] error: {e}", flush=True)
-
-        return base_answer or "Pregunta: ¿Podrías aclarar tu consulta?\nOpciones:\n- Opción A\n- Opción B"
+        r = requests.post(url, json=payload, timeout=120 if timeout is None else timeout)
+        r.raise_for_status()
+        data = r.json()
+        content = ""
+        if isinstance(data, dict):
+            msg = data.get("message", {})
+            content = ((msg or {}).get("content", "") or "").strip()
+            if mode == "polish":
+                try:
+                    content = _debullify(content)
+                except Exception:
+                    pass
+        return content or base_answer
 
 # ---- OPENAI (hosted) ----
 class OpenAIBackend(GeneratorBackend):
@@ -141,58 +286,344 @@ class OpenAIBackend(GeneratorBackend):
         self.max_tokens = int(os.getenv("OPENAI_MAX_TOKENS", max_tokens))
         self.api_key = os.getenv("OPENAI_API_KEY")
 
-    def rewrite(self, query, base_answer, context_pairs, mode="polish") -> str:
+    def rewrite(self, query, base_answer, context_pairs, mode="polish", timeout=None) -> str:
         if not self.api_key:
             raise RuntimeError("Falta OPENAI_API_KEY en el entorno.")
 
         # Lazy import: permite usar Ollama sin tener instalado openai
-        try:
-            from openai import OpenAI
-        except Exception as e:
-            print(f"[GEN][openai] import error: {e}", flush=True)
-            return base_answer
+        from openai import OpenAI
 
         client = OpenAI(api_key=self.api_key)
-        prompt = build_prompt(query, base_answer, context_pairs, mode)
+        parts = build_messages(query, base_answer, context_pairs, mode)
 
         # Preferimos chat.completions porque ya lo tenías así; es estable para este caso.
-        try:
-            resp = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": SYSTEM_RULES},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-            text = resp.choices[0].message.content or ""
-            text = text.strip()
-            if mode == "polish":
-                try:
-                    text = _debullify(text)
-                except Exception:
-                    pass
-            return text if text else base_answer
-        except Exception as e:
-            print(f"[GEN][openai] request error: {e}", flush=True)
-            return base_answer
+        resp = client.chat.completions.create(
+            model=self.model,
+            messages=parts.messages(),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            timeout=timeout,
+        )
+        text = resp.choices[0].message.content or ""
+        text = text.strip()
+        if mode == "polish":
+            try:
+                text = _debullify(text)
+            except Exception:
+                pass
+        return text if text else base_answer
 
 # ====== Factory y utilidades ======
 
-def get_backend() -> GeneratorBackend:
-    backend = os.getenv("GEN_BACKEND", "").lower().strip()
-    if backend == "ollama":
+def _make_backend(name: str) -> GeneratorBackend:
+    if name == "ollama":
         return OllamaBackend()
-    if backend == "openai":
+    if name == "openai":
         return OpenAIBackend()
     return MockBackend()
 
+def get_backend() -> GeneratorBackend:
+    return _make_backend(get_backend_name())
+
 def get_backend_name() -> str:
     b = os.getenv("GEN_BACKEND", "").lower().strip()
     return b if b else "mock"
 
-def rewrite_answer(query: str, base_answer: str, context: str = "", mode: str = "polish") -> str:
-    backend = get_backend()
+
+# ================== Resiliencia ==================
+# Latencia objetivo total de /chat; lo que queda al llegar al LLM es su presupuesto.
+CHAT_SLO_MS = float(os.getenv("CHAT_SLO_MS", 8000))
+# Por debajo de este margen ni intentamos llamar al LLM
+GEN_MIN_BUDGET_MS = float(os.getenv("GEN_MIN_BUDGET_MS", 300))
+# Circuit breaker: fallas (o llamadas lentas) consecutivas para abrir, y enfriamiento
+GEN_BREAKER_FAILURES = int(os.getenv("GEN_BREAKER_FAILURES", 3))
+GEN_BREAKER_SLOW_MS = float(os.getenv("GEN_BREAKER_SLOW_MS", 5000))
+GEN_BREAKER_COOLDOWN_S = float(os.getenv("GEN_BREAKER_COOLDOWN_S", 30))
+# Hedging: segundo backend si el primero no respondió en GEN_HEDGE_DELAY_MS
+GEN_HEDGE_BACKEND = os.getenv("GEN_HEDGE_BACKEND", "").lower().strip()
+GEN_HEDGE_DELAY_MS = float(os.getenv("GEN_HEDGE_DELAY_MS", 1500))
+# Caché de reescrituras por (backend, modo, consulta, respuesta base, contexto): la llenan
+# el tráfico y el warm-up (app/warmup.py). 0 = desactivada.
+GEN_CACHE_SIZE = int(os.getenv("GEN_CACHE_SIZE", 2048))
+GEN_CACHE_TTL_S = float(os.getenv("GEN_CACHE_TTL_S", 6 * 3600))
+
+
+class Deadline:
+    """Instante límite de un request; se crea al entrar a /chat y viaja hasta el LLM."""
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+
+    @classmethod
+    def from_slo(cls, slo_ms: Optional[float] = None) -> "Deadline":
+        return cls(CHAT_SLO_MS if slo_ms is None else slo_ms)
+
+    def remaining_ms(self) -> float:
+        return max(0.0, (self.expires_at - time.monotonic()) * 1000.0)
+
+
+class CircuitBreaker:
+    """
+    closed → (N fallas/lentas seguidas) → open → (cooldown) → half_open → 1 prueba
+    - éxito en half_open: vuelve a closed
+    - falla en half_open: vuelve a open
+    """
+
+    def __init__(self, failures: int = GEN_BREAKER_FAILURES, slow_ms: float = GEN_BREAKER_SLOW_MS,
+                 cooldown_s: float = GEN_BREAKER_COOLDOWN_S):
+        self.failures = failures
+        self.slow_ms = slow_ms
+        self.cooldown_s = cooldown_s
+        self._state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                return "half_open"
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self._state = "half_open"
+                self._trial_in_flight = False
+            if self._state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record(self, ok: bool, elapsed_ms: float) -> None:
+        with self._lock:
+            if ok and elapsed_ms <= self.slow_ms:
+                self._state = "closed"
+                self._consecutive = 0
+                self._trial_in_flight = False
+                return
+            self._consecutive += 1
+            if self._state == "half_open" or self._consecutive >= self.failures:
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("GEN_MAX_WORKERS", 8)), thread_name_prefix="gen")
+
+
+_gen_cache: "OrderedDict[tuple, Tuple[float, str]]" = OrderedDict()   # clave -> (vence, texto)
+_gen_cache_lock = threading.Lock()
+_gen_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _gen_cache_key(name: str, query: str, base_answer: str, context_pairs: Sequence[Mapping], mode: str) -> tuple:
+    ctx = tuple(
+        str(c.get("faq_id", c.get("pregunta_faq", "")))
+        for c in context_pairs[:_ctx_limit(mode)]
+        if isinstance(c, Mapping)
+    )
+    return (name, mode, " ".join(query.lower().split()), base_answer, ctx)
+
+
+def _gen_cache_get(keys: Sequence[tuple]) -> Optional[Tuple[tuple, str]]:
+    """Primer (clave, texto) vigente de `keys`; cuenta un solo acierto o fallo."""
+    with _gen_cache_lock:
+        for key in keys:
+            entry = _gen_cache.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del _gen_cache[key]
+                entry = None
+            if entry is not None:
+                _gen_cache.move_to_end(key)
+                _gen_cache_stats["hits"] += 1
+                return key, entry[1]
+        _gen_cache_stats["misses"] += 1
+        return None
+
+
+def _gen_cache_put(key: tuple, text: str) -> None:
+    with _gen_cache_lock:
+        _gen_cache[key] = (time.monotonic() + GEN_CACHE_TTL_S, text)
+        _gen_cache.move_to_end(key)
+        while len(_gen_cache) > GEN_CACHE_SIZE:
+            _gen_cache.popitem(last=False)
+
+
+def get_gen_cache_stats() -> Dict[str, Any]:
+    with _gen_cache_lock:
+        hits, misses, size = _gen_cache_stats["hits"], _gen_cache_stats["misses"], len(_gen_cache)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "size": size, "hit_ratio": round(hits / total, 4) if total else 0.0}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker()
+        return _breakers[name]
+
+
+def get_resilience_stats() -> Dict[str, Any]:
+    with _breakers_lock:
+        names = list(_breakers)
+    return {name: get_breaker(name).state for name in names}
+
+
+def _timed_call(backend: GeneratorBackend, limiter, query, base_answer, context_pairs, mode, timeout):
+    """Ejecuta la llamada y libera el lugar del scheduler al terminar (aunque el caller ya no espere)."""
+    t0 = time.monotonic()
+    try:
+        text = backend.rewrite(query=query, base_answer=base_answer, context_pairs=context_pairs,
+                               mode=mode, timeout=timeout)
+    finally:
+        limiter.release()
+    return text, (time.monotonic() - t0) * 1000.0
+
+
+def _submit_call(name: str, limiter, query, base_answer, context_pairs, mode, timeout):
+    """
+    Lanza la llamada en el pool. El breaker de `name` registra el resultado REAL
+    cuando termina, aunque el request ya haya respondido con el otro backend: si
+    era la prueba de half_open, nunca queda tomada para siempre.
+    """
+    t0 = time.monotonic()
+    fut = _executor.submit(_timed_call, _make_backend(name), limiter, query, base_answer, context_pairs,
+                           mode, timeout)
+
+    def _record(f):
+        try:
+            _, elapsed_ms = f.result()
+        except Exception:
+            get_breaker(name).record(False, (time.monotonic() - t0) * 1000.0)
+        else:
+            get_breaker(name).record(True, elapsed_ms)
+
+    fut.add_done_callback(_record)
+    return fut
+
+
+def rewrite_with_meta(
+    query: str,
+    base_answer: str,
+    context: Any = "",
+    mode: str = "polish",
+    deadline: Optional[Deadline] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Llamada al LLM con presupuesto, circuit breaker, control de admisión
+    (app/gen_scheduler.py: cola con prioridad clarify > polish) y hedging opcional.
+    Las reescrituras exitosas se cachean (GEN_CACHE_SIZE); un acierto no llama al backend.
+    Nunca lanza: ante timeout, error, cola llena o circuito abierto devuelve `base_answer`
+    (vacío en clarify → el selector arma la desambiguación sin LLM).
+    Retorna (texto, info) con backend, estado del breaker, tiempo gastado y, si un
+    backend falló, el último error en info["error"].
+    """
+    t0 = time.monotonic()
+    name = get_backend_name()
     context_pairs = parse_context(context)
-    return backend.rewrite(query=query, base_answer=base_answer, context_pairs=context_pairs, mode=mode)
\ No newline at end of file
+    deadline = deadline or Deadline.from_slo()
+    info: Dict[str, Any] = {"backend": name, "outcome": "ok", "hedged": False, "winner": None}
+
+    def _finish(text: str, outcome: str):
+        info["outcome"] = outcome
+        info["elapsed_ms"] = round((time.monotonic() - t0) * 1000.0, 1)
+        info["breaker"] = get_breaker(name).state if name != "mock" else "n/a"
+        return text, info
+
+    if name == "mock":
+        info["winner"] = name
+        return _finish(get_backend().rewrite(query, base_answer, context_pairs, mode), "ok")
+
+    # Caché por backend que escribió el texto: primero el primario, después el de cobertura
+    if GEN_CACHE_SIZE > 0:
+        writers = [name] + ([GEN_HEDGE_BACKEND] if GEN_HEDGE_BACKEND not in ("", name) else [])
+        cached = _gen_cache_get([_gen_cache_key(w, query, base_answer, context_pairs, mode) for w in writers])
+        if cached is not None:
+            info["winner"], info["cached"] = cached[0][0], True
+            return _finish(cached[1], "ok")
+
+    budget_ms = deadline.remaining_ms()
+    if budget_ms < GEN_MIN_BUDGET_MS:
+        return _finish(base_answer, "no_budget")
+
+    # Turno en la cola del backend (la espera sale del mismo presupuesto)
+    limiter = get_limiter(name)
+    background = is_background()
+    if background:
+        # Warm-up: sin cola y dejando lugares libres para el tráfico real
+        if not limiter.try_acquire(leave_free=GEN_BACKGROUND_LEAVE_FREE):
+            return _finish(base_answer, "shed_background")
+    else:
+        try:
+            queue_s = min(GEN_MAX_QUEUE_MS, budget_ms - GEN_MIN_BUDGET_MS) / 1000.0
+            info["queue_wait_ms"] = round(limiter.acquire(priority_for(mode), queue_s), 1)
+        except GenerationRejected as e:
+            return _finish(base_answer, f"shed_{e.reason}")
+
+    if not get_breaker(name).allow():
+        limiter.release()
+        return _finish(base_answer, "short_circuit")
+
+    futures = {
+        _submit_call(name, limiter, query, base_answer, context_pairs, mode, deadline.remaining_ms() / 1000.0): name
+    }
+    hedge = GEN_HEDGE_BACKEND if GEN_HEDGE_BACKEND and GEN_HEDGE_BACKEND != name and not background else ""
+
+    def _launch_hedge() -> bool:
+        """Segundo backend en paralelo (si hay, si tiene presupuesto y su breaker lo permite)."""
+        if not hedge or info["hedged"] or deadline.remaining_ms() < GEN_MIN_BUDGET_MS:
+            return False
+        hedge_limiter = get_limiter(hedge)
+        if not hedge_limiter.try_acquire():  # la cobertura nunca hace cola
+            return False
+        if not get_breaker(hedge).allow():
+            hedge_limiter.release()
+            return False
+        futures[_submit_call(hedge, hedge_limiter, query, base_answer, context_pairs, mode,
+                             deadline.remaining_ms() / 1000.0)] = hedge
+        info["hedged"] = True
+        return True
+
+    pending = set(futures)
+    if hedge:
+        # Si el primario no contestó en GEN_HEDGE_DELAY_MS, sumamos el segundo backend
+        done, _ = wait(pending, timeout=min(GEN_HEDGE_DELAY_MS, budget_ms) / 1000.0)
+        if not done and _launch_hedge():
+            pending = set(futures)
+
+    while pending:
+        done, pending = wait(pending, timeout=deadline.remaining_ms() / 1000.0, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for fut in done:
+            who = futures[fut]
+            try:
+                text, _ = fut.result()  # el breaker lo registra _submit_call
+            except Exception as e:
+                info["error"] = f"{who}: {type(e).__name__}: {e}"[:300]  # queda en meta y en el log
+                # Falla rápida del primario: probamos enseguida con el backend de cobertura
+                if _launch_hedge():
+                    pending = set(f for f in futures if not f.done())
+                continue
+            info["winner"] = who
+            if GEN_CACHE_SIZE > 0 and text:
+                _gen_cache_put(_gen_cache_key(who, query, base_answer, context_pairs, mode), text)
+            return _finish(text, "ok")
+
+    # Vencido el plazo: lo que sigue colgado lo registra su breaker al terminar (lento = falla)
+    outcome = "timeout" if pending else "error"
+    return _finish(base_answer, outcome)
+
+
+def rewrite_answer(query: str, base_answer: str, context: Any = "", mode: str = "polish",
+                   deadline: Optional[Deadline] = None) -> str:
+    text, _ = rewrite_with_meta(query, base_answer, context=context, mode=mode, deadline=deadline)
+    return text
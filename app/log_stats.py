@@ -0,0 +1,294 @@
+# app/log_stats.py
+"""
+Rollups incrementales de logs/chat_logs.json en SQLite (GET /stats).
+
+El log de chats es append-only; releerlo entero para cada análisis no escala.
+Un procesador lo sigue (tail) desde un offset guardado en la misma base y, por
+bucket de una hora, suma contadores por dimensión:
+
+    mode · decision · tenant · generator (used/unused) · backend · gen_outcome
+    score (best_dense en bins de 0.05, sin atajo exacto) · query (normalizada) · faq (top-1)
+
+Tabla `rollups(bucket, dim, key, count)`. Cada lote de líneas se aplica en una
+transacción junto con el nuevo offset, así un corte a mitad de camino no cuenta
+dos veces, y varios procesos (workers de uvicorn, el bot) pueden correr el
+procesador sobre la misma base: el lock de escritura de SQLite los serializa y
+cada uno lee el offset ya actualizado. Solo se consumen líneas completas; si el
+archivo se rota o trunca (otro inode o más chico que el offset) se vuelve a 0.
+
+Las vistas por ventana (1h, 24h, 7d, all) se recalculan cuando cambió el
+offset guardado (lo haya avanzado este proceso u otro) y al menos una vez por
+bucket, para que 1h y 24h se deslicen aunque no lleguen líneas. `get_stats`
+devuelve la vista ya armada: /stats no escanea logs ni la base.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from app.query_analysis import normalize_text
+from app.response_selector import LOG_PATH
+
+LOG_STATS_ENABLED = os.getenv("LOG_STATS_ENABLED", "1") != "0"
+LOG_STATS_DB = os.getenv("LOG_STATS_DB", "logs/chat_stats.sqlite")
+LOG_STATS_POLL_S = float(os.getenv("LOG_STATS_POLL_S", 5))
+LOG_STATS_RETENTION_DAYS = float(os.getenv("LOG_STATS_RETENTION_DAYS", 90))
+LOG_STATS_TOP = int(os.getenv("LOG_STATS_TOP", 20))        # top consultas / FAQs por ventana
+LOG_STATS_BATCH_BYTES = 8 * 1024 * 1024                    # lectura por transacción
+BUCKET_S = 3600
+
+WINDOWS = {"1h": 3600, "24h": 24 * 3600, "7d": 7 * 24 * 3600, "all": None}
+# Dimensiones con muchas claves: se reportan como top-N
+_TOP_DIMS = ("query", "faq")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    bucket INTEGER NOT NULL,
+    dim    TEXT    NOT NULL,
+    key    TEXT    NOT NULL,
+    count  INTEGER NOT NULL,
+    PRIMARY KEY (bucket, dim, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS offsets (
+    path   TEXT PRIMARY KEY,
+    inode  INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+"""
+
+
+@lru_cache(maxsize=1024)
+def _hour_bucket(prefix: str) -> int:
+    """'2026-10-19T00' → epoch del inicio de la hora (UTC)."""
+    return int(datetime.strptime(prefix, "%Y-%m-%dT%H").replace(tzinfo=timezone.utc).timestamp())
+
+
+def _score_bin(x: Any) -> Optional[str]:
+    try:
+        return f"{math.floor(float(x) * 20) / 20:.2f}"
+    except (TypeError, ValueError):
+        return None
+
+
+def record_keys(rec: Dict[str, Any]):
+    """(dim, key) que aporta una línea del log."""
+    meta = rec.get("meta") or {}
+    yield "mode", str(rec.get("mode") or "?")
+    yield "decision", str(meta.get("decision") or "?")
+    yield "tenant", str(meta.get("tenant") or "default")
+    gen = meta.get("generator") or {}
+    used = bool(meta.get("used_generator") or gen.get("winner"))
+    yield "generator", "used" if used else "unused"
+    backend = gen.get("winner") or gen.get("backend") or meta.get("generator_backend")
+    if backend:
+        yield "backend", str(backend)
+    if gen.get("outcome"):
+        yield "gen_outcome", str(gen["outcome"])
+    # El atajo exacto trae un score sintético (EXACT_MATCH_SCORE): no va al histograma
+    score = None if meta.get("exact_match") else _score_bin(meta.get("best_dense"))
+    if score is not None:
+        yield "score", score
+    query = normalize_text(rec.get("query") or "")
+    if query:
+        yield "query", query[:200]
+    ranking = meta.get("ranking") or []
+    if ranking and isinstance(ranking[0], dict) and ranking[0].get("faq_id") is not None:
+        yield "faq", str(ranking[0]["faq_id"])
+
+
+class LogStats:
+    def __init__(self, db_path: str = LOG_STATS_DB, log_path=LOG_PATH):
+        self.db_path = str(db_path)
+        self.log_path = str(log_path)
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._views: Dict[str, Dict[str, Any]] = {}
+        self._views_mark: Optional[tuple] = None   # (offset guardado, bucket) de la última vista
+        self._stats = {"lines": 0, "bad_lines": 0, "batches": 0, "last_ingest_ms": 0.0, "resets": 0}
+
+    # ----- ingesta -----
+    def ingest(self) -> int:
+        """Procesa las líneas completas nuevas del log. Retorna cuántas se sumaron."""
+        total = 0
+        while True:
+            n, more = self._ingest_batch()
+            total += n
+            if not more:
+                break
+        if total or self._views_mark != self._mark():
+            self.refresh_views()
+        return total
+
+    def _mark(self) -> tuple:
+        with self._lock:
+            row = self._db.execute("SELECT inode, offset FROM offsets WHERE path = ?", (self.log_path,)).fetchone()
+        return (tuple(row) if row else None), int(time.time()) // BUCKET_S
+
+    def _ingest_batch(self):
+        t0 = time.perf_counter()
+        try:
+            st = os.stat(self.log_path)
+        except OSError:
+            return 0, False
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")  # otro proceso con la misma base espera acá
+            try:
+                row = db.execute("SELECT inode, offset FROM offsets WHERE path = ?", (self.log_path,)).fetchone()
+                offset = row[1] if row else 0
+                if row and (row[0] != st.st_ino or st.st_size < offset):
+                    offset = 0  # rotado o truncado
+                    self._stats["resets"] += 1
+                if st.st_size <= offset:
+                    db.execute("COMMIT")
+                    return 0, False
+                with open(self.log_path, "rb") as f:
+                    f.seek(offset)
+                    chunk = f.read(LOG_STATS_BATCH_BYTES)
+                end = chunk.rfind(b"\n") + 1  # solo líneas completas
+                if end == 0:
+                    db.execute("COMMIT")
+                    return 0, False
+
+                counts: Counter = Counter()
+                now_bucket = int(time.time()) // BUCKET_S * BUCKET_S
+                lines = bad = 0
+                for line in chunk[:end].splitlines():
+                    if not line.strip():
+                        continue
+                    try:
+                        rec = json.loads(line)
+                        if not isinstance(rec, dict):
+                            raise ValueError("línea sin objeto JSON")
+                        ts = rec.get("ts") or ""
+                        bucket = _hour_bucket(ts[:13]) if len(ts) >= 13 else now_bucket
+                    except ValueError:
+                        bad += 1
+                        continue
+                    lines += 1
+                    for dim, key in record_keys(rec):
+                        counts[(bucket, dim, key)] += 1
+
+                db.executemany(
+                    "INSERT INTO rollups (bucket, dim, key, count) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (bucket, dim, key) DO UPDATE SET count = count + excluded.count",
+                    [(b, d, k, c) for (b, d, k), c in counts.items()],
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO offsets (path, inode, offset) VALUES (?, ?, ?)",
+                    (self.log_path, st.st_ino, offset + end),
+                )
+                if LOG_STATS_RETENTION_DAYS > 0:
+                    db.execute("DELETE FROM rollups WHERE bucket < ?",
+                               (int(time.time() - LOG_STATS_RETENTION_DAYS * 86400),))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self._stats["lines"] += lines
+            self._stats["bad_lines"] += bad
+            self._stats["batches"] += 1
+            self._stats["last_ingest_ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+            return lines, len(chunk) == LOG_STATS_BATCH_BYTES  # lote lleno: puede haber más
+
+    def rebuild(self) -> int:
+        """Borra rollups y offset y reprocesa el log desde el principio."""
+        with self._lock:
+            self._db.execute("DELETE FROM rollups")
+            self._db.execute("DELETE FROM offsets")
+        return self.ingest()
+
+    # ----- vistas -----
+    def refresh_views(self) -> None:
+        mark = self._mark()
+        now = int(time.time())
+        views = {}
+        with self._lock:
+            for name, span in WINDOWS.items():
+                since = 0 if span is None else (now - span) // BUCKET_S * BUCKET_S
+                rows = self._db.execute(
+                    "SELECT dim, key, SUM(count) FROM rollups WHERE bucket >= ? GROUP BY dim, key", (since,)
+                ).fetchall()
+                per_dim: Dict[str, Counter] = {}
+                for dim, key, c in rows:
+                    per_dim.setdefault(dim, Counter())[key] = c
+                view: Dict[str, Any] = {"window": name, "requests": sum(per_dim.get("mode", {}).values())}
+                for dim, counter in per_dim.items():
+                    if dim in _TOP_DIMS:
+                        view[f"top_{dim}"] = [{"key": k, "count": c} for k, c in counter.most_common(LOG_STATS_TOP)]
+                    elif dim == "score":
+                        view["score_hist"] = dict(sorted(counter.items()))
+                    else:
+                        view[dim] = dict(counter.most_common())
+                views[name] = view
+            series_since = (now - WINDOWS["24h"]) // BUCKET_S * BUCKET_S
+            series = self._db.execute(
+                "SELECT bucket, key, count FROM rollups WHERE dim = 'mode' AND bucket >= ? ORDER BY bucket",
+                (series_since,),
+            ).fetchall()
+        hourly: Dict[int, Dict[str, int]] = {}
+        for bucket, key, c in series:
+            hourly.setdefault(bucket, {})[key] = c
+        timeline = [
+            {"hour": datetime.fromtimestamp(b, timezone.utc).strftime("%Y-%m-%dT%H:00Z"), **modes}
+            for b, modes in hourly.items()
+        ]
+        generated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        for view in views.values():
+            view["generated_at"] = generated_at
+        views["24h"]["hourly"] = timeline
+        self._views = views  # reemplazo atómico: los lectores ven la vista vieja o la nueva
+        self._views_mark = mark
+
+    def get(self, window: str = "24h") -> Optional[Dict[str, Any]]:
+        return self._views.get(window)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+
+# ----- procesador de fondo (uno por proceso) -----
+_instance: Optional[LogStats] = None
+_instance_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+
+def get_log_stats() -> LogStats:
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = LogStats()
+        return _instance
+
+
+def start_log_stats(poll_s: float = LOG_STATS_POLL_S) -> None:
+    """Hilo daemon que sigue el log cada `poll_s` segundos."""
+    global _thread
+    with _instance_lock:
+        if _thread is not None and _thread.is_alive():
+            return
+
+        def _loop():
+            ls = get_log_stats()
+            while True:
+                try:
+                    ls.ingest()
+                except Exception as e:
+                    print(f"[STATS] Error procesando {ls.log_path}: {e}", flush=True)
+                time.sleep(poll_s)
+
+        _thread = threading.Thread(target=_loop, name="log-stats", daemon=True)
+        _thread.start()
+
+
+def get_stats(window: str = "24h") -> Optional[Dict[str, Any]]:
+    return get_log_stats().get(window)
@@ -1,15 +1,74 @@
 # app/main.py
-from fastapi import FastAPI
+import json
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, Literal
+
+try:
+    import orjson
+except Exception:
+    orjson = None
 
 # Integraciones internas
-from app.retriever import encode_query, buscar_similares
-from app.response_selector import seleccionar_respuesta, SelectorConfig
+from app import reranker
+from app.log_stats import LOG_STATS_ENABLED, get_log_stats, start_log_stats
+from app.generator import get_gen_cache_stats, get_resilience_stats
+from app.gen_scheduler import get_scheduler_stats
+from app.candidates import as_candidate_set, to_jsonable
+from app.compression import CompressionMiddleware
+from app.catalogs import UnknownTenantError, registry
+from app.dialogue_manager import get_clarify_stats
+from app.pipeline import inflight, responder_sesion, retrieval_client
+from app.profiling import header_allows
+from app.response_selector import load_selector_config
+from app.retrieval_client import RetrievalError
+from app.rate_limit import RateLimited, client_key, get_rate_limit_stats
+from app.shadow import get_shadow_stats
+from app.suggest import SUGGEST_MAX, get_suggester
+from app.warmup import (
+    WARMUP_BUDGET_S,
+    WARMUP_ON_STARTUP,
+    WARMUP_START_DELAY_S,
+    WARMUP_TOP_N,
+    get_warmup_stats,
+    start_warmup,
+)
+
+# Nivel de detalle de meta por defecto en /chat (minimal | ids | full)
+CHAT_DEFAULT_VERBOSITY = os.getenv("CHAT_DEFAULT_VERBOSITY", "full")
+
+
+class FastJSONResponse(Response):
+    """JSON con orjson (si está instalado); sin pasar por la validación/serialización de Pydantic."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Warm-up de cachés con las consultas frecuentes del historial (en segundo plano:
+    # /health responde enseguida; ver app/warmup.py)
+    if WARMUP_ON_STARTUP:
+        start_warmup(delay_s=WARMUP_START_DELAY_S)
+    # Rollups de logs/chat_logs.json para /stats (ver app/log_stats.py)
+    if LOG_STATS_ENABLED:
+        start_log_stats()
+    yield
+
 
 # -------- FastAPI setup --------
-app = FastAPI(title="IES FAQ Chatbot API", version="0.1")
+app = FastAPI(title="IES FAQ Chatbot API", version="0.1", default_response_class=FastJSONResponse,
+              lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,41 +77,135 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# br/gzip según Accept-Encoding, solo para cuerpos >= COMPRESS_MIN_BYTES (payloads de debug)
+app.add_middleware(CompressionMiddleware)
 
 class ChatRequest(BaseModel):
     query: str
     session_id: Optional[str] = None
     top_k: Optional[int] = 5
     enable_generation: Optional[bool] = True
+    tenant: Optional[str] = None  # catálogo/institución (None = catálogo por defecto)
+    # minimal: solo mode/answer · ids: meta sin textos (ranking = faq_id + scores) · full: todo
+    verbosity: Optional[Literal["minimal", "ids", "full"]] = None
 
 class ChatResponse(BaseModel):
     mode: str
     answer: str
     meta: Dict[str, Any]
 
+class WarmupRequest(BaseModel):
+    # Endpoint sin autenticación que dispara llamadas al LLM: topes = valores de entorno
+    top_n: Optional[int] = Field(None, ge=1, le=max(1, WARMUP_TOP_N))             # None = WARMUP_TOP_N
+    budget_s: Optional[float] = Field(None, gt=0, le=max(1.0, WARMUP_BUDGET_S))   # None = WARMUP_BUDGET_S
+    generation: Optional[bool] = None  # None = WARMUP_GENERATION
+
 @app.get("/health")
 def health():
     return {"status": "ok", "version": app.version}
 
+@app.get("/metrics")
+def metrics():
+    """Contadores internos (single-flight, re-ranker, catálogos, LLM, cachés y warm-up, atajo exacto)."""
+    out = {
+        "generator_breakers": get_resilience_stats(),
+        "generator_queues": get_scheduler_stats(),
+        "generator_cache": get_gen_cache_stats(),
+        "warmup": get_warmup_stats(),
+        "shadow": get_shadow_stats(),
+        "rate_limit": get_rate_limit_stats(),
+        "singleflight": inflight.stats(),
+        "rerank": reranker.get_stats(),
+        "catalogs": registry.stats(),
+        "clarifications": get_clarify_stats(),
+    }
+    if retrieval_client is not None:
+        out["retrieval_client"] = retrieval_client.stats()
+    else:
+        from app.retriever import get_cascade_stats, get_embed_stats, get_exact_stats  # ya cargado por app.pipeline
+        out["exact_fast_path"] = get_exact_stats()
+        out["cascade"] = get_cascade_stats()
+        out["embed_cache"] = get_embed_stats()
+    return out
+
+@app.get("/stats")
+def stats(window: Literal["1h", "24h", "7d", "all"] = "24h"):
+    """Rollups del log de chats por ventana (vista precalculada por el procesador de fondo)."""
+    if not LOG_STATS_ENABLED:
+        raise HTTPException(status_code=404, detail="LOG_STATS_ENABLED=0")
+    view = get_log_stats().get(window)
+    if view is None:
+        raise HTTPException(status_code=503, detail="Rollups todavía no calculados", headers={"Retry-After": "5"})
+    return FastJSONResponse({**view, "processor": get_log_stats().stats()})
+
+@app.post("/warmup", status_code=202)
+def warmup(req: Optional[WarmupRequest] = None):
+    """Lanza el warm-up de cachés en segundo plano (409 si ya hay uno corriendo)."""
+    req = req or WarmupRequest()
+    started = start_warmup(top_n=req.top_n, budget_s=req.budget_s, generation=req.generation)
+    return FastJSONResponse({"started": started, "warmup": get_warmup_stats()},
+                            status_code=202 if started else 409)
+
+@app.get("/suggest")
+def suggest(
+    q: str = Query("", max_length=200),
+    limit: int = Query(5, ge=1, le=SUGGEST_MAX),
+    tenant: Optional[str] = None,
+):
+    """Autocompletado de preguntas mientras se escribe (léxico, sin encoder; ver app/suggest.py)."""
+    try:
+        faqs_path = registry.faqs_path(tenant)
+    except UnknownTenantError:
+        raise HTTPException(status_code=404, detail=f"Tenant desconocido: {tenant}")
+    return {"query": q, "suggestions": get_suggester(faqs_path).suggest(q, limit)}
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    # 1) encode + recuperar (IMPORTANTE: pasar query_text para híbrido)
-    qvec = encode_query(req.query)
-    cands = buscar_similares(qvec, top_k=req.top_k or 5, query_text=req.query)
-
-    # 2) seleccionar (selector ya maneja extractive/generative/tie-break/fallback)
-    cfg = SelectorConfig(
-        tau_high=0.80,
-        tau_low=0.55,          # tu ajuste actual
-        near_tie_delta=0.05,
-        show_k=3
-    )
-
-    sel = seleccionar_respuesta(
-        query=req.query,
-        candidatos=cands,
-        cfg=cfg,
-        enable_generation=bool(req.enable_generation),
-    )
-
-    return ChatResponse(mode=sel["mode"], answer=sel["answer"], meta=sel["meta"])
+def chat(req: ChatRequest, request: Request, x_profile: Optional[str] = Header(None)):
+    # Umbrales del selector (extractive/generative/tie-break/fallback),
+    # calibrados con scripts/calibrate_thresholds.py (ver SELECTOR_CONFIG_PATH)
+    cfg = load_selector_config()
+
+    # encode + recuperar + re-rank + seleccionar (ver app/pipeline.py);
+    # consultas idénticas concurrentes comparten una sola ejecución y, con session_id,
+    # la respuesta a una aclaración previa se resuelve sin recuperar de nuevo
+    try:
+        sel = responder_sesion(
+            req.query,
+            session_id=req.session_id,
+            top_k=req.top_k or 5,
+            enable_generation=bool(req.enable_generation),
+            cfg=cfg,
+            tenant=req.tenant,
+            # X-Profile: <PROFILE_HEADER_TOKEN> → perfil cProfile en logs/profiles/
+            # (ver app/profiling.py); sin token configurado el header se ignora
+            profile=header_allows(x_profile),
+            # presupuesto por session_id y, ampliado, por dirección del cliente (sin
+            # session_id la dirección es el usuario: omitirlo no esquiva el límite)
+            client_key=client_key(request.client.host if request.client else None, request.headers),
+        )
+    except RateLimited as e:
+        retry_after = {"Retry-After": str(int(e.retry_after_s + 0.999))}
+        if e.reason == "queue_timeout":
+            # Sobrecarga del servidor (cola justa llena), no presupuesto del usuario
+            raise HTTPException(status_code=503, detail="Servidor ocupado, reintentar", headers=retry_after)
+        raise HTTPException(status_code=429, detail="Demasiados pedidos", headers=retry_after)
+    except UnknownTenantError:
+        raise HTTPException(status_code=404, detail=f"Tenant desconocido: {req.tenant}")
+    except RetrievalError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    # Borde de la respuesta: recién acá se materializan los candidatos, y solo lo que pide `verbosity`
+    meta = shape_meta(sel["meta"], req.verbosity or CHAT_DEFAULT_VERBOSITY)
+    return FastJSONResponse({"mode": sel["mode"], "answer": sel["answer"], "meta": meta})
+
+
+def shape_meta(meta: Dict[str, Any], verbosity: str) -> Dict[str, Any]:
+    """Recorta meta según el nivel de detalle pedido (ver ChatRequest.verbosity)."""
+    if verbosity == "minimal":
+        return {}
+    if verbosity == "ids":
+        out = to_jsonable({k: v for k, v in meta.items() if k != "ranking"}, texts=False)
+        if meta.get("ranking") is not None:
+            out["ranking"] = as_candidate_set(meta["ranking"]).to_score_dicts()
+        return out
+    return to_jsonable(meta)
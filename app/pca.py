@@ -0,0 +1,62 @@
+# app/pca.py
+"""
+Proyección PCA para la búsqueda densa en dos etapas (app/retriever.py).
+
+Se entrena en el build (scripts/build_index.py --pca-dim) y se guarda como
+`pca.npy` junto al índice: matriz (d, r) float32. Al cargar el catálogo se
+proyectan los vectores del índice y se arma un IndexFlatIP de r dimensiones
+para la etapa gruesa; la etapa fina re-puntúa los candidatos con los vectores
+completos, así score_dense sigue siendo el coseno exacto.
+
+La proyección es sobre los autovectores de XᵀX SIN centrar: lo que se quiere
+conservar es el producto interno q·x (el ranking de FAISS IP). faiss.PCAMatrix
+centra los datos y el término −media·x cambia el orden de los candidatos.
+"""
+import faiss
+import numpy as np
+
+PCA_FILENAME = "pca.npy"
+# Filas usadas para estimar XᵀX (alcanza con una muestra en catálogos grandes)
+PCA_TRAIN_SAMPLE = 50_000
+
+
+def fit_projection(x: np.ndarray, dim: int, sample: int = PCA_TRAIN_SAMPLE, seed: int = 0) -> np.ndarray:
+    """Matriz (d, dim) con los `dim` autovectores principales de XᵀX (sin centrar)."""
+    x = np.asarray(x, dtype=np.float32)
+    if dim <= 0 or dim >= x.shape[1]:
+        raise ValueError(f"dim debe estar entre 1 y {x.shape[1] - 1} (recibido {dim})")
+    if len(x) > sample:
+        x = x[np.random.default_rng(seed).choice(len(x), sample, replace=False)]
+    cov = x.T.astype(np.float64) @ x
+    _, vecs = np.linalg.eigh(cov)  # autovalores ascendentes
+    return np.ascontiguousarray(vecs[:, ::-1][:, :dim], dtype=np.float32)
+
+
+def explained_ratio(x: np.ndarray, proj: np.ndarray) -> float:
+    """Fracción de la energía (‖x‖²) que conserva la proyección."""
+    x = np.asarray(x, dtype=np.float64)
+    p = x @ proj.astype(np.float64)
+    return float((p * p).sum() / max(1e-12, (x * x).sum()))
+
+
+def build_coarse_index(xb: np.ndarray, proj: np.ndarray):
+    """IndexFlatIP sobre los vectores proyectados (etapa gruesa)."""
+    coarse = faiss.IndexFlatIP(proj.shape[1])
+    coarse.add(np.ascontiguousarray(xb @ proj, dtype=np.float32))
+    return coarse
+
+
+def two_stage_search(coarse, proj: np.ndarray, xb: np.ndarray, query_vec: np.ndarray, k: int, width: int):
+    """
+    Top-k por producto interno exacto entre `width` candidatos de la etapa gruesa.
+    Mismo formato que index.search para una consulta: (D, I) de forma (1, k), orden desc.
+    """
+    q = np.ascontiguousarray(query_vec, dtype=np.float32).reshape(1, -1)
+    width = min(max(width, k), coarse.ntotal)
+    _, cand = coarse.search(q @ proj, width)
+    cand = cand[0][cand[0] >= 0]
+    exact = xb[cand] @ q[0]
+    k = min(k, len(cand))
+    top = np.argpartition(-exact, k - 1)[:k] if k < len(cand) else np.arange(len(cand))
+    top = top[np.argsort(-exact[top], kind="stable")]
+    return exact[top].reshape(1, -1), cand[top].reshape(1, -1)
@@ -0,0 +1,182 @@
+# app/pipeline.py
+"""
+Pipeline de respuesta compartido por la API (app/main.py) y el bot de Telegram.
+
+    análisis → encode → recuperación híbrida → re-rank (opcional) → selector
+
+`responder_compartido` agrega single-flight: requests idénticos concurrentes
+comparten una sola ejecución del pipeline (ver app/singleflight.py).
+
+Con RETRIEVAL_SOCKET definido, encode + recuperación se delegan al servicio de
+recuperación (app/retrieval_service.py) y este proceso no carga modelo ni índices.
+
+Con un id de sesión (`responder_sesion`), la respuesta a una aclaración ("la
+primera", "2" o el texto de una opción) se resuelve contra las opciones
+mostradas (app/dialogue_manager.py) sin volver a recuperar ni llamar al LLM.
+
+Cada usuario (session_id / chat) tiene un presupuesto de requests y el pipeline
+se reparte con una cola justa entre usuarios (app/rate_limit.py).
+
+Una muestra de los requests se re-evalúa en segundo plano con configuraciones
+alternativas de recuperación/selector (modo sombra, app/shadow.py).
+
+Los requests perfilados (app/profiling.py) no pasan por single-flight: corren
+su propia ejecución para que el perfil refleje el pipeline completo.
+"""
+import os
+from typing import Any, Dict, Optional
+
+from app.catalogs import get_catalog
+from app.dialogue_manager import remember_options, resolve_clarification
+from app.generator import Deadline
+from app.profiling import run_profiled, wants_profile
+from app.query_analysis import analyze_query
+from app.rate_limit import admit, fair_slot
+from app.reranker import fetch_k, rerank
+from app.shadow import maybe_enqueue as shadow_enqueue
+from app.response_selector import registrar_respuesta, seleccionar_respuesta, SelectorConfig
+from app.singleflight import SingleFlight
+
+# Espera máxima de un request "seguidor" por el resultado del líder
+SINGLEFLIGHT_TIMEOUT_S = float(os.getenv("SINGLEFLIGHT_TIMEOUT_S", 10))
+# Socket del servicio de recuperación (vacío = recuperación en este proceso)
+RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET", "")
+
+if RETRIEVAL_SOCKET:
+    from app.retrieval_client import RetrievalClient
+    retrieval_client: Optional["RetrievalClient"] = RetrievalClient(RETRIEVAL_SOCKET)
+else:
+    from app.retriever import encode_query, buscar_exacta, buscar_similares
+    retrieval_client = None
+
+inflight = SingleFlight()
+
+
+def responder(
+    query: str,
+    top_k: int = 5,
+    enable_generation: bool = True,
+    cfg: Optional[SelectorConfig] = None,
+    tenant: Optional[str] = None,
+    log: bool = True,
+) -> Dict[str, Any]:
+    """
+    Corre el pipeline completo y devuelve {mode, answer, meta} del selector.
+    `tenant` elige el catálogo (app/catalogs.py); None = catálogo por defecto.
+    `log=False` no deja el request en logs/chat_logs.json ni en los contadores de
+    recuperación de /metrics (warm-up).
+    """
+    deadline = Deadline.from_slo()  # presupuesto total del request (CHAT_SLO_MS)
+    analysis = analyze_query(query)  # pistas de la consulta, una sola vez
+
+    # 1) encode + recuperar (IMPORTANTE: pasar query_text para híbrido)
+    if retrieval_client is not None:
+        # un solo viaje al servicio; UnknownTenantError si el tenant no existe
+        cands, exact_match = retrieval_client.buscar(query, top_k=fetch_k(top_k), tenant=tenant,
+                                                     count_stats=log)
+        catalog_name = tenant or "default"
+    else:
+        catalog = get_catalog(tenant)  # UnknownTenantError si no existe
+        # pregunta del catálogo pegada tal cual: top-1 directo, sin encoder
+        cands = buscar_exacta(query, analysis=analysis, catalog=catalog, count_stats=log)
+        exact_match = cands is not None
+        if not exact_match:
+            qvec = encode_query(query)
+            cands = buscar_similares(qvec, top_k=fetch_k(top_k), query_text=query, analysis=analysis,
+                                     catalog=catalog, count_stats=log, tau_high=(cfg or SelectorConfig()).tau_high)
+        catalog_name = catalog.name
+
+    # 2) re-rank con cross-encoder sobre el top-N (si está configurado)
+    cands, rerank_info = rerank(query, cands, top_k=top_k, analysis=analysis, namespace=catalog_name,
+                                selector_cfg=cfg)
+
+    # 3) seleccionar (extractive / generative / tie-break / fallback)
+    sel = seleccionar_respuesta(
+        query=query,
+        candidatos=cands,
+        cfg=cfg,
+        enable_generation=enable_generation,
+        analysis=analysis,
+        deadline=deadline,
+        log=log,
+        exact_match=exact_match,
+    )
+    if tenant:
+        sel["meta"]["tenant"] = catalog_name
+    if rerank_info.get("applied"):
+        sel["meta"]["rerank"] = rerank_info
+    return sel
+
+
+def responder_compartido(
+    query: str,
+    top_k: int = 5,
+    enable_generation: bool = True,
+    cfg: Optional[SelectorConfig] = None,
+    tenant: Optional[str] = None,
+    profile: bool = False,
+) -> Dict[str, Any]:
+    """
+    Igual que `responder`, pero los requests idénticos concurrentes
+    (consulta normalizada, top_k, enable_generation, cfg, tenant) comparten resultado.
+    Si el líder tarda más que SINGLEFLIGHT_TIMEOUT_S, el seguidor responde por su
+    cuenta sin LLM (extractivo / desambiguación), para no quedar colgado.
+    Con `profile` (o por PROFILE_SAMPLE_RATE) el request se perfila y meta lleva `profile_id`.
+    """
+    if wants_profile(profile):
+        sel, profile_id = run_profiled(query, responder, query, top_k, enable_generation, cfg, tenant)
+        if profile_id:
+            sel["meta"]["profile_id"] = profile_id
+        return sel
+
+    key = (tenant or "", analyze_query(query).normalized, top_k, bool(enable_generation), cfg)
+    sel, shared = inflight.do(
+        key,
+        lambda: responder(query, top_k, enable_generation, cfg, tenant),
+        timeout=SINGLEFLIGHT_TIMEOUT_S,
+        on_timeout=lambda: responder(query, top_k, False, cfg, tenant),
+    )
+    if shared:
+        # Copia superficial: cada request arma su propia respuesta sin pisar la del líder
+        sel = {**sel, "meta": {**sel["meta"], "coalesced": True}}
+    return sel
+
+
+def responder_sesion(
+    query: str,
+    session_id: Optional[str] = None,
+    top_k: int = 5,
+    enable_generation: bool = True,
+    cfg: Optional[SelectorConfig] = None,
+    tenant: Optional[str] = None,
+    profile: bool = False,
+    user_key: Optional[str] = None,
+    client_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    `responder_compartido` con memoria de aclaraciones por sesión: si el turno
+    anterior ofreció opciones y `query` elige una, se responde directo.
+    Cada request se cobra al presupuesto de `user_key` (por defecto, `session_id`;
+    sin sesión, `client_key`) y al de la dirección `client_key` (ver
+    app/rate_limit.py): sin fichas se responde sin LLM y, agotada la deuda,
+    lanza RateLimited. El pipeline completo entra por la cola justa por usuario.
+    """
+    user_key = user_key or session_id or client_key
+    admission = admit(user_key, client_key)  # RateLimited si ya no tiene presupuesto
+    degraded = admission is not None and admission.degraded
+    if session_id:
+        sel = resolve_clarification(session_id, query, tenant)
+        if sel is not None:
+            # al log como el resto de las decisiones (decision="clarification"); sin
+            # modo sombra: no hubo recuperación que comparar
+            registrar_respuesta(query, sel)
+            return sel
+    with fair_slot(user_key, degraded):
+        sel = responder_compartido(query, top_k, enable_generation and not degraded, cfg, tenant, profile=profile)
+    if degraded:
+        sel = {**sel, "meta": {**sel["meta"], "rate_limit": "degraded"}}
+    # Modo sombra (app/shadow.py): muestreo + cola acotada, fuera del camino de la respuesta
+    shadow_enqueue(query, tenant, sel, cfg)
+    if session_id:
+        remember_options(session_id, sel, tenant, show_k=(cfg or SelectorConfig()).show_k)
+    return sel
@@ -0,0 +1,114 @@
+# app/profiling.py
+"""
+Perfilado opcional de requests (cProfile) para investigar consultas lentas.
+
+Un request se perfila si lo pide explícitamente (header `X-Profile` en /chat,
+modo /debug en Telegram) o, con PROFILE_SAMPLE_RATE > 0, por muestreo. El
+header solo vale con PROFILE_HEADER_TOKEN definido y `X-Profile: <token>`: sin
+token, un cliente cualquiera no puede forzar perfiles. El perfil del pipeline
+completo se guarda en `PROFILE_DIR/<profile_id>.prof` (formato pstats) y se
+agrega una línea a `PROFILE_DIR/index.jsonl` con la consulta, el modo y el
+tiempo total; se conservan los PROFILE_MAX_FILES más recientes.
+scripts/profile_report.py los agrega.
+
+Desactivado (sin header/debug y tasa 0) no hay costo: el llamador solo evalúa
+`wants_profile()` y corre el pipeline como siempre.
+
+cProfile mide el hilo que corre el pipeline: las llamadas al LLM en hilos de
+hedging aparecen como espera. Se perfila un request a la vez; si ya hay uno en
+curso, el siguiente corre sin perfilar.
+"""
+import cProfile
+import hmac
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "logs/profiles"))
+# Valor que tiene que traer el header X-Profile (vacío = header ignorado)
+PROFILE_HEADER_TOKEN = os.getenv("PROFILE_HEADER_TOKEN", "")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+
+_profile_lock = threading.Lock()  # un perfilador activo por proceso
+_index_lock = threading.Lock()
+
+
+def wants_profile(forced: bool = False) -> bool:
+    return forced or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def header_allows(value: Optional[str]) -> bool:
+    """True si el header X-Profile trae el PROFILE_HEADER_TOKEN configurado."""
+    if not PROFILE_HEADER_TOKEN or not value:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), PROFILE_HEADER_TOKEN.encode("utf-8"))
+
+
+def _prune(max_files: int = PROFILE_MAX_FILES) -> None:
+    """Borra los perfiles más viejos (y sus líneas del índice) por encima de `max_files`."""
+    files = sorted(PROFILE_DIR.glob("*.prof"), key=lambda f: f.stat().st_mtime_ns)
+    if len(files) <= max_files:
+        return
+    for f in files[:len(files) - max_files]:
+        f.unlink(missing_ok=True)
+    kept = {f.stem for f in files[len(files) - max_files:]}
+    index = PROFILE_DIR / "index.jsonl"
+    lines = index.read_text(encoding="utf-8").splitlines(keepends=True)
+    index.write_text("".join(l for l in lines if _entry_id(l) in kept), encoding="utf-8")
+
+
+def _entry_id(line: str) -> Optional[str]:
+    try:
+        return json.loads(line).get("profile_id")
+    except ValueError:
+        return None
+
+
+def new_profile_id() -> str:
+    return time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+def run_profiled(query: str, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, Optional[str]]:
+    """
+    Corre fn(*args, **kwargs) bajo cProfile y guarda el perfil.
+    Retorna (resultado, profile_id); profile_id es None si había otro perfil en curso.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return fn(*args, **kwargs), None
+    try:
+        prof = cProfile.Profile()
+        t0 = time.perf_counter()
+        prof.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            prof.disable()
+        wall_ms = (time.perf_counter() - t0) * 1000
+    finally:
+        _profile_lock.release()
+
+    profile_id = new_profile_id()
+    try:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        prof.dump_stats(str(PROFILE_DIR / f"{profile_id}.prof"))
+        entry = {
+            "profile_id": profile_id,
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "query": query,
+            "mode": result.get("mode") if isinstance(result, dict) else None,
+            "wall_ms": round(wall_ms, 2),
+        }
+        with _index_lock:
+            with (PROFILE_DIR / "index.jsonl").open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            _prune()
+    except Exception as e:
+        print(f"[PROFILE] No se pudo guardar el perfil {profile_id}: {e}")
+        return result, None
+    return result, profile_id
@@ -0,0 +1,102 @@
+# app/query_analysis.py
+"""
+Análisis de la consulta en una sola pasada, compartido por retriever,
+selector y gestor de diálogo.
+
+Antes cada módulo volvía a tokenizar la consulta y a recorrer sus propias
+listas de palabras clave; acá todo se precompila al importar y el resultado
+se cachea por consulta normalizada.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import FrozenSet, Tuple
+
+# Stopwords mínimas en español (sin tildes, se comparan contra texto plegado)
+STOP_ES = frozenset({
+    "de", "la", "el", "los", "las", "y", "o", "u", "en", "del", "al", "para", "por",
+    "con", "un", "una", "que", "es", "son", "se", "a", "lo",
+})
+
+# Referencias implícitas a una respuesta anterior ("eso", "lo anterior", "repetí"...).
+# Se escriben sin tildes porque se evalúan sobre el texto plegado.
+_REFERENCE_PATTERNS = [
+    r"eso",
+    r"lo anterior",
+    r"repeti",
+    r"cuales eran",
+    r"me lo podes repetir",
+    r"la info",
+    r"ese dato",
+]
+
+# Pistas de consulta "laboral" (salida laboral, ámbitos de trabajo, etc.).
+# Coincidencia por subcadena, igual que el `any(k in q_lower ...)` original.
+LABORAL_KEYWORDS = [
+    "salida", "salidas", "laboral", "trabajo", "trabajar",
+    "areas", "ambitos", "egresad", "oportunidades",
+    "campos", "campo laboral", "puestos", "empleo", "empleabilidad",
+    "recursos humanos", "rrhh",
+]
+
+_REFERENCE_RE = re.compile(r"\b(?:" + "|".join(_REFERENCE_PATTERNS) + r")\b")
+_LABORAL_RE = re.compile("|".join(re.escape(k) for k in sorted(LABORAL_KEYWORDS, key=len, reverse=True)))
+_TOKEN_RE = re.compile(r"\w+", flags=re.UNICODE)
+_NON_WORD_RE = re.compile(r"[^\w\s]+", flags=re.UNICODE)
+_SPACES_RE = re.compile(r"\s+")
+
+
+def fold_accents(text: str) -> str:
+    """Quita tildes/diacríticos (á → a, ñ → n) conservando el resto del texto."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas + sin tildes + sin puntuación + espacios colapsados."""
+    folded = fold_accents((text or "").lower())
+    return _SPACES_RE.sub(" ", _NON_WORD_RE.sub(" ", folded)).strip()
+
+
+@dataclass(frozen=True)
+class QueryAnalysis:
+    normalized: str                  # texto plegado y sin puntuación
+    tokens: Tuple[str, ...]          # tokens plegados, en orden
+    content_tokens: FrozenSet[str]   # tokens sin stopwords ni monosílabos
+    is_reference: bool               # referencia implícita a un turno anterior
+    laboral_hint: bool               # consulta sobre salida laboral / ámbitos de trabajo
+
+    @property
+    def hints(self) -> FrozenSet[str]:
+        """Nombres de las pistas activas (útil para reglas declarativas)."""
+        active = set()
+        if self.laboral_hint:
+            active.add("laboral")
+        if self.is_reference:
+            active.add("reference")
+        return frozenset(active)
+
+
+@lru_cache(maxsize=4096)
+def _analyze_normalized(normalized: str) -> QueryAnalysis:
+    tokens = tuple(_TOKEN_RE.findall(normalized))
+    return QueryAnalysis(
+        normalized=normalized,
+        tokens=tokens,
+        content_tokens=frozenset(t for t in tokens if t not in STOP_ES and len(t) > 1),
+        is_reference=_REFERENCE_RE.search(normalized) is not None,
+        laboral_hint=_LABORAL_RE.search(normalized) is not None,
+    )
+
+
+def analyze_query(text: str) -> QueryAnalysis:
+    """
+    Calcula (o recupera de caché) todas las pistas de la consulta en una pasada.
+    """
+    return _analyze_normalized(normalize_text(text))
+
+
+def content_tokens(text: str) -> FrozenSet[str]:
+    """Conjunto de tokens sin stopwords (cacheado; sirve también para títulos de FAQ)."""
+    return _analyze_normalized(normalize_text(text)).content_tokens
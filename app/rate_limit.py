@@ -0,0 +1,254 @@
+# app/rate_limit.py
+"""
+Presupuesto por usuario y reparto justo del pipeline entre usuarios.
+
+Un solo chat que manda mensajes sin parar puede acaparar el encoder y el LLM.
+Dos piezas, aplicadas en app/pipeline.responder_sesion (API y bot):
+
+1) Token bucket por usuario (session_id de la API o "tg:<tenant>:<chat_id>";
+   sin session_id, la dirección del cliente): RATE_BURST fichas, se repone
+   RATE_PER_MIN por minuto y cada request cuesta una.
+   - con fichas               → request normal
+   - sin fichas, con deuda    → se degrada a extractivo (enable_generation=False)
+     hasta RATE_DEGRADE_DEBT requests "fiados"
+   - más allá de la deuda     → RateLimited (429 en la API, aviso en el bot)
+   En la API cada request se cobra además a la dirección del cliente (IP de la
+   conexión o RATE_CLIENT_IP_HEADER detrás de un proxy de confianza), con
+   RATE_CLIENT_MULTIPLIER veces el presupuesto de un usuario: omitir o rotar el
+   session_id no esquiva el límite, y varios usuarios detrás de un mismo NAT
+   no comparten el presupuesto de uno solo.
+   Estado acotado: a lo sumo RATE_MAX_KEYS buckets (LRU); un bucket desalojado
+   vuelve lleno, lo mismo que tendría tras un rato sin mensajes.
+
+2) Cola justa ponderada (WFQ) para entrar al pipeline: como mucho
+   PIPELINE_MAX_CONCURRENCY requests a la vez; el resto espera ordenado por
+   tiempo virtual de fin por usuario (start = max(V, fin anterior del usuario),
+   fin = start + 1/peso; usuario = el del bucket, así los anónimos no comparten
+   un único flujo). Quien ya tiene muchos pedidos encadenados queda
+   detrás de los que llegan por primera vez; los usuarios degradados pesan
+   RATE_HEAVY_WEIGHT. La espera máxima es PIPELINE_MAX_WAIT_MS (después, 503
+   en la API).
+
+Contadores en /metrics ("rate_limit").
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_PER_MIN = float(os.getenv("RATE_PER_MIN", 20))
+RATE_BURST = float(os.getenv("RATE_BURST", 10))
+RATE_DEGRADE_DEBT = float(os.getenv("RATE_DEGRADE_DEBT", 10))
+RATE_MAX_KEYS = int(os.getenv("RATE_MAX_KEYS", 50000))
+RATE_HEAVY_WEIGHT = float(os.getenv("RATE_HEAVY_WEIGHT", 0.5))
+# Cabecera con la IP real del cliente puesta por un proxy de confianza (ej. X-Forwarded-For);
+# vacío = dirección de la conexión. Solo configurarla si el proxy la pisa siempre.
+RATE_CLIENT_IP_HEADER = os.getenv("RATE_CLIENT_IP_HEADER", "").strip()
+RATE_CLIENT_MULTIPLIER = float(os.getenv("RATE_CLIENT_MULTIPLIER", 5))
+PIPELINE_MAX_CONCURRENCY = int(os.getenv("PIPELINE_MAX_CONCURRENCY", 8))   # 0 = sin cola justa
+PIPELINE_MAX_WAIT_MS = float(os.getenv("PIPELINE_MAX_WAIT_MS", 5000))
+
+
+class RateLimited(Exception):
+    """Request rechazado por presupuesto del usuario o por espera vencida en la cola."""
+
+    def __init__(self, reason: str, retry_after_s: float = 1.0, notify: bool = True):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+        self.notify = notify  # primer rechazo de la racha (el bot avisa una sola vez)
+
+
+@dataclass(frozen=True)
+class Admission:
+    decision: str       # ok | degraded
+    tokens: float       # fichas que quedan (negativo = deuda)
+
+    @property
+    def degraded(self) -> bool:
+        return self.decision == "degraded"
+
+
+class TokenBuckets:
+    def __init__(self, per_min: float = RATE_PER_MIN, burst: float = RATE_BURST,
+                 debt: float = RATE_DEGRADE_DEBT, max_keys: int = RATE_MAX_KEYS):
+        self.rate = per_min / 60.0
+        self.burst = burst
+        self.debt = debt
+        self.max_keys = max(1, max_keys)
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()   # key -> [fichas, último refill, rechazado]
+        self._lock = threading.Lock()
+        self._stats = {"ok": 0, "degraded": 0, "rejected": 0, "evicted": 0}
+
+    def admit(self, key: str) -> Admission:
+        """Cobra una ficha a `key`. Lanza RateLimited si ya no le queda ni deuda."""
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [self.burst, now, False]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self._stats["evicted"] += 1
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+                b[1] = now
+            if b[0] >= 1.0:
+                decision = "ok"
+            elif b[0] - 1.0 >= -self.debt:
+                decision = "degraded"
+            else:
+                retry = (1.0 - self.debt - b[0]) / self.rate if self.rate > 0 else 60.0
+                notify, b[2] = not b[2], True
+                self._stats["rejected"] += 1
+                raise RateLimited("rate", retry_after_s=max(1.0, retry), notify=notify)
+            b[0] -= 1.0
+            b[2] = False
+            self._stats[decision] += 1
+            return Admission(decision, b[0])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "tracked_keys": len(self._buckets)}
+
+
+class FairGate:
+    """Semáforo con cola WFQ por usuario (menor tiempo virtual de fin primero)."""
+
+    def __init__(self, max_concurrency: int = PIPELINE_MAX_CONCURRENCY, max_flows: int = RATE_MAX_KEYS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_flows = max(1, max_flows)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._vtime = 0.0
+        self._last_finish: "OrderedDict[str, float]" = OrderedDict()
+        self._heap: list = []           # [fin, seq, inicio, vivo]
+        self._seq = itertools.count()
+        self._stats = {"admitted": 0, "queued": 0, "queue_timeout": 0}
+
+    def _pop_dead(self) -> None:
+        while self._heap and not self._heap[0][3]:
+            heapq.heappop(self._heap)
+
+    def acquire(self, flow: str, weight: float = 1.0, timeout: float = PIPELINE_MAX_WAIT_MS / 1000.0) -> float:
+        """Espera turno. Retorna la espera en ms; RateLimited("queue_timeout") si se vence (503 en la API)."""
+        t0 = time.monotonic()
+        with self._cond:
+            start = max(self._vtime, self._last_finish.get(flow, 0.0))
+            finish = start + 1.0 / max(weight, 1e-3)
+            self._last_finish[flow] = finish
+            self._last_finish.move_to_end(flow)
+            while len(self._last_finish) > self.max_flows:
+                self._last_finish.popitem(last=False)
+
+            self._pop_dead()
+            if self._active < self.max_concurrency and not self._heap:
+                self._active += 1
+                self._vtime = max(self._vtime, start)
+                self._stats["admitted"] += 1
+                return 0.0
+
+            entry = [finish, next(self._seq), start, True]
+            heapq.heappush(self._heap, entry)
+            self._stats["queued"] += 1
+            deadline = t0 + max(0.0, timeout)
+            while True:
+                self._pop_dead()
+                if self._heap and self._heap[0] is entry and self._active < self.max_concurrency:
+                    heapq.heappop(self._heap)
+                    self._active += 1
+                    self._vtime = max(self._vtime, start)
+                    self._stats["admitted"] += 1
+                    self._cond.notify_all()
+                    return (time.monotonic() - t0) * 1000.0
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    entry[3] = False
+                    self._stats["queue_timeout"] += 1
+                    self._cond.notify_all()
+                    raise RateLimited("queue_timeout", retry_after_s=1.0)
+                self._cond.wait(remaining)
+
+    def release(self) -> None:
+        with self._cond:
+            self._active = max(0, self._active - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, flow: str, weight: float = 1.0):
+        waited_ms = self.acquire(flow, weight)
+        try:
+            yield waited_ms
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._stats,
+                "active": self._active,
+                "waiting": sum(1 for e in self._heap if e[3]),
+                "max_concurrency": self.max_concurrency,
+            }
+
+
+buckets = TokenBuckets()
+client_buckets = TokenBuckets(RATE_PER_MIN * RATE_CLIENT_MULTIPLIER, RATE_BURST * RATE_CLIENT_MULTIPLIER,
+                              RATE_DEGRADE_DEBT * RATE_CLIENT_MULTIPLIER)
+gate = FairGate() if PIPELINE_MAX_CONCURRENCY > 0 else None
+
+
+def client_key(peer: Optional[str], headers: Optional[Mapping[str, str]] = None) -> Optional[str]:
+    """
+    "ip:<dirección>" del cliente. Con RATE_CLIENT_IP_HEADER se toma el último
+    salto de la cabecera (el que agregó el proxy de confianza); si no, `peer`.
+    """
+    if RATE_CLIENT_IP_HEADER and headers is not None:
+        hops = [h.strip() for h in (headers.get(RATE_CLIENT_IP_HEADER) or "").split(",") if h.strip()]
+        if hops:
+            return f"ip:{hops[-1]}"
+    return f"ip:{peer}" if peer else None
+
+
+def admit(user_key: Optional[str], client: Optional[str] = None) -> Optional[Admission]:
+    """
+    Cobra el request a `user_key` (o a `client` si no hay usuario) y, si hay
+    ambos, también al bucket ampliado de `client`. Gana la decisión más dura.
+    Sin ninguno de los dos (no identificado) no se limita.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+    key = user_key or client
+    if not key:
+        return None
+    admission = buckets.admit(key)
+    if client and client != key:
+        by_client = client_buckets.admit(client)
+        if by_client.degraded:
+            admission = by_client
+    return admission
+
+
+@contextmanager
+def fair_slot(user_key: Optional[str], degraded: bool = False):
+    """Turno en la cola justa del pipeline (no-op si PIPELINE_MAX_CONCURRENCY=0)."""
+    if gate is None:
+        yield 0.0
+        return
+    with gate.slot(user_key or "anon", RATE_HEAVY_WEIGHT if degraded else 1.0) as waited_ms:
+        yield waited_ms
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {"enabled": RATE_LIMIT_ENABLED, "buckets": buckets.stats(),
+                           "client_buckets": client_buckets.stats()}
+    if gate is not None:
+        out["fair_queue"] = gate.stats()
+    return out
@@ -0,0 +1,138 @@
+# app/rerank_rules.py
+"""
+Reglas declarativas de re-ranking post-fusión (antes: cadenas de `if` en retriever).
+
+Cada regla dice: "si la consulta tiene la pista X y el campo Y de la FAQ contiene
+alguna de estas palabras, sumar `delta` al score fusionado".
+
+Al cargar se compilan contra el catálogo de FAQs:
+- una columna booleana por regla (¿la FAQ cumple el predicado?)
+- un vector de pesos (delta de cada regla)
+- y, por cada pista, el producto columnas·pesos ya resuelto → un delta por FAQ.
+
+Así, aplicar TODAS las reglas a una consulta es un único gather vectorizado sobre
+los ids candidatos, sin importar cuántas reglas haya.
+"""
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+RULES_PATH = "data/rerank_rules.json"
+
+# Pista que aplica siempre, sin importar la consulta
+ALWAYS = "always"
+
+# Campos de la FAQ sobre los que se evalúan los predicados (en minúsculas)
+_FIELDS = {
+    "title": lambda f: f["pregunta_faq"].lower(),
+    "text": lambda f: (f["pregunta_faq"] + " " + f["respuesta"]).lower(),
+    "answer": lambda f: f["respuesta"].lower(),
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    when: str                      # pista de la consulta: "laboral", "reference", "always"
+    field: str                     # "title" | "text" | "answer"
+    contains_any: Tuple[str, ...]  # subcadenas (se comparan en minúsculas)
+    delta: float                   # ajuste al score fusionado
+
+    @staticmethod
+    def from_dict(d: Dict) -> "Rule":
+        field = d.get("field", "title")
+        if field not in _FIELDS:
+            raise ValueError(f"Regla '{d.get('name')}': campo desconocido '{field}'")
+        words = d.get("contains_any") or []
+        if isinstance(words, str):
+            words = [words]
+        return Rule(
+            name=str(d.get("name", "")),
+            when=str(d.get("when", ALWAYS)),
+            field=field,
+            contains_any=tuple(w.lower() for w in words),
+            delta=float(d.get("delta", 0.0)),
+        )
+
+
+def load_rules(path: str = RULES_PATH) -> List[Rule]:
+    """
+    Lee reglas desde JSON (o YAML si la extensión es .yml/.yaml y PyYAML está instalado).
+    Formato: {"rules": [{"name", "when", "field", "contains_any", "delta"}, ...]}
+    Si el archivo no existe, devuelve [] (sin ajustes).
+    """
+    p = Path(path)
+    if not p.exists():
+        return []
+    raw = p.read_text(encoding="utf-8")
+    if p.suffix.lower() in (".yml", ".yaml"):
+        try:
+            import yaml
+        except Exception as e:
+            raise RuntimeError(f"Para leer {path} hace falta PyYAML: {e}")
+        data = yaml.safe_load(raw) or {}
+    else:
+        data = json.loads(raw)
+    items = data.get("rules", []) if isinstance(data, dict) else data
+    return [Rule.from_dict(d) for d in items]
+
+
+class CompiledRules:
+    """Reglas compiladas contra un catálogo de FAQs concreto."""
+
+    def __init__(self, rules: List[Rule], faqs_list: List[Dict]):
+        self.rules = list(rules)
+        n, r = len(faqs_list), len(self.rules)
+
+        # Columnas booleanas: features[i, j] = la FAQ i cumple el predicado de la regla j
+        self.features = np.zeros((n, r), dtype=bool)
+        field_cache: Dict[str, List[str]] = {}
+        for j, rule in enumerate(self.rules):
+            if rule.field not in field_cache:
+                field_cache[rule.field] = [_FIELDS[rule.field](f) for f in faqs_list]
+            texts = field_cache[rule.field]
+            self.features[:, j] = [any(w in t for w in rule.contains_any) for t in texts]
+
+        self.weights = np.array([rule.delta for rule in self.rules], dtype=np.float64)
+
+        # Por pista: delta total por FAQ (features de esas reglas · pesos)
+        self.delta_by_hint: Dict[str, np.ndarray] = {}
+        for hint in {rule.when for rule in self.rules}:
+            mask = np.array([rule.when == hint for rule in self.rules], dtype=bool)
+            self.delta_by_hint[hint] = self.features[:, mask].astype(np.float64) @ self.weights[mask]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def deltas(self, ids: np.ndarray, hints: FrozenSet[str]) -> Optional[np.ndarray]:
+        """Delta total por candidato para las pistas activas (None si ninguna regla aplica)."""
+        active = [h for h in self.delta_by_hint if h == ALWAYS or h in hints]
+        if not active:
+            return None
+        total = self.delta_by_hint[active[0]][ids]
+        for h in active[1:]:
+            total = total + self.delta_by_hint[h][ids]
+        return total
+
+    def apply(self, fused: List[Tuple[int, float]], hints: FrozenSet[str]) -> List[Tuple[int, float]]:
+        """
+        Ajusta y reordena una lista fusionada [(idx, score)].
+        Si ninguna regla se activa con estas pistas, la devuelve tal cual.
+        """
+        if not fused:
+            return fused
+        ids = np.fromiter((i for i, _ in fused), dtype=np.int64, count=len(fused))
+        delta = self.deltas(ids, hints)
+        if delta is None:
+            return fused
+        scores = np.fromiter((s for _, s in fused), dtype=np.float64, count=len(fused)) + delta
+        order = np.argsort(-scores, kind="stable")
+        return [(int(ids[k]), float(scores[k])) for k in order]
+
+
+def compile_rules(faqs_list: List[Dict], path: str = RULES_PATH) -> CompiledRules:
+    """Carga y compila las reglas del archivo contra `faqs_list`."""
+    return CompiledRules(load_rules(path), faqs_list)
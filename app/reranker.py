@@ -0,0 +1,210 @@
+# app/reranker.py
+"""
+Re-ranking opcional con cross-encoder sobre el top-N fusionado.
+
+Se ubica entre `buscar_similares` y `seleccionar_respuesta`:
+- Un único forward batcheado sobre los pares (consulta, FAQ) del top-N.
+- Presupuesto de latencia por request: si el costo estimado no entra, se
+  reordena solo el prefijo que sí entra, nunca menos de 2 pares (así la
+  estimación del costo se sigue midiendo y se recupera de una inferencia lenta).
+- Caché por par (consulta normalizada, faq_id), separada por catálogo.
+- Se saltea si la consulta ya es claramente extractiva (score_dense >= tau_high
+  del SelectorConfig con el que se va a seleccionar).
+
+Corre en CPU con un modelo cargado desde una ruta local (RERANK_MODEL_PATH).
+Si la variable no está definida, la etapa queda desactivada.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.candidates import CandidateSet, as_candidate_set
+from app.query_analysis import QueryAnalysis, analyze_query
+from app.response_selector import SelectorConfig
+
+RERANK_MODEL_PATH = os.getenv("RERANK_MODEL_PATH", "").strip()
+
+
+@dataclass(frozen=True)
+class RerankConfig:
+    top_n: int = int(os.getenv("RERANK_TOP_N", 10))              # candidatos a re-puntuar
+    budget_ms: float = float(os.getenv("RERANK_BUDGET_MS", 150))  # presupuesto por request
+    max_length: int = 256         # tokens por par (consulta + FAQ)
+    cache_size: int = 20000       # pares (consulta, faq_id) cacheados
+
+
+_model = None
+_model_lock = threading.Lock()
+
+_cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Estimación móvil del costo por par (ms), para respetar el presupuesto. La primera
+# inferencia (modelo/tokenizer en frío) no entra en la estimación.
+_ms_per_pair: Optional[float] = None
+_cold_call_done = False
+_EWMA = 0.3
+# Siempre se re-puntúan al menos estos pares: si la estimación quedó alta por una
+# inferencia lenta aislada, las siguientes mediciones la corrigen
+_MIN_PROBE_PAIRS = 2
+
+_stats = {
+    "calls": 0,
+    "skipped_disabled": 0,
+    "skipped_extractive": 0,
+    "skipped_budget": 0,
+    "cache_hits": 0,
+    "pairs_scored": 0,
+    "over_budget": 0,
+}
+_stats_lock = threading.Lock()
+
+
+def _bump(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += n
+
+
+def is_enabled() -> bool:
+    return bool(RERANK_MODEL_PATH)
+
+
+def fetch_k(top_k: int, cfg: Optional[RerankConfig] = None) -> int:
+    """Cuántos candidatos pedirle a `buscar_similares` para que el re-ranker tenga su top-N."""
+    if not is_enabled():
+        return top_k
+    cfg = cfg or RerankConfig()
+    return max(top_k, cfg.top_n)
+
+
+def get_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out = dict(_stats)
+    return {**out, "enabled": is_enabled(), "ms_per_pair": _ms_per_pair, "cache_size": len(_cache)}
+
+
+def _get_model(cfg: RerankConfig):
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(RERANK_MODEL_PATH, device="cpu", max_length=cfg.max_length)
+    return _model
+
+
+def _pair_text(c: Dict[str, Any]) -> str:
+    return f'{c.get("pregunta_faq", "")} {c.get("respuesta", "")}'
+
+
+def rerank(
+    query: str,
+    candidatos: CandidateSet,
+    top_k: int = 5,
+    cfg: Optional[RerankConfig] = None,
+    analysis: Optional[QueryAnalysis] = None,
+    namespace: str = "",
+    selector_cfg: Optional[SelectorConfig] = None,
+) -> Tuple[CandidateSet, Dict[str, Any]]:
+    """
+    Reordena el top-N de `candidatos` con el cross-encoder y devuelve (top_k, info).
+    `score`/`score_dense` no se tocan (el selector sigue decidiendo con coseno denso);
+    se agrega `score_rerank` a los candidatos re-puntuados.
+    `namespace` separa la caché entre catálogos (los faq_id se repiten entre tenants).
+    `selector_cfg` es la config del selector que decide después (su tau_high).
+    """
+    global _ms_per_pair, _cold_call_done
+    cfg = cfg or RerankConfig()
+    candidatos = as_candidate_set(candidatos)
+    _bump("calls")
+
+    if not is_enabled():
+        _bump("skipped_disabled")
+        return candidatos[:top_k], {"applied": False, "reason": "disabled"}
+    if len(candidatos) < 2:
+        return candidatos[:top_k], {"applied": False, "reason": "few_candidates"}
+
+    best_dense = float(candidatos[0].get("score_dense", candidatos[0].get("score", 0.0)))
+    if best_dense >= (selector_cfg or SelectorConfig()).tau_high:
+        _bump("skipped_extractive")
+        return candidatos[:top_k], {"applied": False, "reason": "extractive"}
+
+    t0 = time.perf_counter()
+    if analysis is None:
+        analysis = analyze_query(query)
+    qkey = analysis.normalized
+
+    pool = candidatos[: cfg.top_n]
+    cached: Dict[str, float] = {}
+    with _cache_lock:
+        for c in pool:
+            key = (namespace, qkey, c["faq_id"])
+            if key in _cache:
+                _cache.move_to_end(key)
+                cached[c["faq_id"]] = _cache[key]
+    _bump("cache_hits", len(cached))
+
+    # Presupuesto: achicamos el prefijo hasta que los pares sin caché entren
+    if _ms_per_pair is not None:
+        missing = 0
+        limit = 0
+        for c in pool:
+            extra = 0 if c["faq_id"] in cached else 1
+            if limit >= _MIN_PROBE_PAIRS and (missing + extra) * _ms_per_pair > cfg.budget_ms:
+                break
+            missing += extra
+            limit += 1
+        pool = pool[:limit]
+    if len(pool) < 2:
+        _bump("skipped_budget")
+        return candidatos[:top_k], {"applied": False, "reason": "budget"}
+
+    to_score = [c for c in pool if c["faq_id"] not in cached]
+    if to_score:
+        model = _get_model(cfg)
+        t_inf = time.perf_counter()
+        raw = model.predict(
+            [(query, _pair_text(c)) for c in to_score],
+            batch_size=len(to_score),
+            show_progress_bar=False,
+        )
+        inf_ms = (time.perf_counter() - t_inf) * 1000.0
+        per_pair = inf_ms / len(to_score)
+        with _stats_lock:
+            if not _cold_call_done:
+                _cold_call_done = True
+            elif _ms_per_pair is None:
+                _ms_per_pair = per_pair
+            else:
+                _ms_per_pair = (1 - _EWMA) * _ms_per_pair + _EWMA * per_pair
+            _stats["pairs_scored"] += len(to_score)
+
+        with _cache_lock:
+            for c, s in zip(to_score, raw):
+                cached[c["faq_id"]] = float(s)
+                _cache[(namespace, qkey, c["faq_id"])] = float(s)
+            while len(_cache) > cfg.cache_size:
+                _cache.popitem(last=False)
+
+    # Reordenamos el prefijo re-puntuado; el resto conserva su orden (y el store compartido)
+    n_pool = len(pool)
+    rerank_scores = np.full(len(candidatos), np.nan)
+    rerank_scores[:n_pool] = [cached[c["faq_id"]] for c in pool]
+    order = np.concatenate([np.argsort(-rerank_scores[:n_pool], kind="stable"), np.arange(n_pool, len(candidatos))])
+    out = candidatos.take(order, score_rerank=rerank_scores[order])
+
+    elapsed_ms = (time.perf_counter() - t0) * 1000.0
+    if elapsed_ms > cfg.budget_ms:
+        _bump("over_budget")
+    info = {
+        "applied": True,
+        "reranked": len(pool),
+        "scored": len(to_score),
+        "elapsed_ms": round(elapsed_ms, 2),
+    }
+    return out[:top_k], info
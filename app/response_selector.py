@@ -1,21 +1,18 @@
-from dataclasses import dataclass
+from collections.abc import Mapping
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
-import math
 import json
+import os
 from pathlib import Path
 from datetime import datetime
+from app.candidates import CandidateSet, as_candidate_set, to_jsonable
 from app.generator import get_backend_name
-import re
-
-_STOP_ES = {"de","la","el","los","las","y","o","u","en","del","al","para","por","con","un","una","que","es","son","se","a","lo"}
-
-def _token_set(s: str):
-    toks = re.findall(r"\w+", s.lower(), flags=re.UNICODE)
-    return {t for t in toks if t not in _STOP_ES and len(t) > 1}
+from app.query_analysis import QueryAnalysis, analyze_query, content_tokens
 
 def jaccard(a: str, b: str) -> float:
-    A = _token_set(a)
-    B = _token_set(b)
+    A = content_tokens(a)
+    B = content_tokens(b)
     if not A or not B:
         return 0.0
     inter = len(A & B)
@@ -24,12 +21,19 @@ def jaccard(a: str, b: str) -> float:
 
 # Si querés desactivar la rama generativa mientras probamos:
 try:
-    from app.generator import rewrite_answer  # función opcional
+    from app.generator import Deadline, rewrite_with_meta  # función opcional
     HAS_GENERATOR = True
 except Exception:
+    Deadline = None
     HAS_GENERATOR = False
 
 LOG_PATH = Path("logs/chat_logs.json")
+# Umbrales calibrados offline (scripts/calibrate_thresholds.py --write)
+SELECTOR_CONFIG_PATH = os.getenv("SELECTOR_CONFIG_PATH", "models/selector_config.json")
+
+# Gate léxico del modo polish y margen del "generative borderline" (laboral)
+MIN_JACCARD = 0.22  # ajustar 0.20–0.25 si hace falta
+BORDERLINE_MARGIN = 0.05
 
 
 @dataclass(frozen=True)
@@ -51,25 +55,43 @@ class SelectorConfig:
     tie_option_format: str = "- {i}. {pregunta}"
 
 
-def _safe_score(x: Any) -> float:
-    try:
-        v = float(x)
-        if math.isnan(v) or math.isinf(v):
-            return -1.0
-        return v
-    except Exception:
-        return -1.0
+# Umbrales que usan la API y el bot si no hay archivo calibrado
+SERVING_DEFAULTS = {"tau_high": 0.80, "tau_low": 0.55, "near_tie_delta": 0.05, "show_k": 3}
+
+
+@lru_cache(maxsize=4)
+def load_selector_config(path: str = SELECTOR_CONFIG_PATH) -> SelectorConfig:
+    """
+    Config del selector para la API y el bot: SERVING_DEFAULTS pisados por los
+    campos de `path` (JSON) si existe. Claves desconocidas se ignoran.
+    """
+    values = dict(SERVING_DEFAULTS)
+    p = Path(path)
+    if p.exists():
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+            known = {f.name for f in fields(SelectorConfig)}
+            values.update({k: v for k, v in data.items() if k in known})
+        except Exception as e:
+            print(f"[SELECTOR] No se pudo leer {path}: {e}. Uso los umbrales por defecto.")
+    return SelectorConfig(**values)
 
 
 def _append_log(payload: Dict[str, Any]) -> None:
     try:
         LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
-        payload = {**payload, "ts": datetime.utcnow().isoformat() + "Z"}
+        # El ranking se loguea sin el texto de las respuestas (faq_id + pregunta + scores)
+        payload = {**to_jsonable(payload, texts=False), "ts": datetime.utcnow().isoformat() + "Z"}
         with LOG_PATH.open("a", encoding="utf-8") as f:
             f.write(json.dumps(payload, ensure_ascii=False) + "\n")
     except Exception:
         pass
 
+
+def registrar_respuesta(query: str, sel: Dict[str, Any]) -> None:
+    """Loguea en LOG_PATH una respuesta que no pasó por seleccionar_respuesta (ej. aclaraciones)."""
+    _append_log({"query": query, "mode": sel["mode"], "meta": sel["meta"]})
+
 def _build_disambiguation_message(cands, cfg):
     """
     Fallback de tie-break SIN LLM:
@@ -81,7 +103,7 @@ def _build_disambiguation_message(cands, cfg):
     opts = "\n".join(
         f"- {c.get('pregunta_faq','')}"
         for c in opts_src
-        if isinstance(c, dict) and c.get("pregunta_faq")
+        if isinstance(c, Mapping) and c.get("pregunta_faq")
     )
     return (
         "¿Podrías aclarar tu consulta?\n\n"
@@ -89,7 +111,18 @@ def _build_disambiguation_message(cands, cfg):
         f"{opts}"
     )
 
-def _build_fallback_message(cands: List[Dict[str, Any]], cfg: SelectorConfig) -> str:
+def _rewrite(gen_meta: Dict[str, Any], deadline, **kwargs) -> str:
+    """
+    Llama al LLM a través de la capa de resiliencia (presupuesto + circuit breaker).
+    Vuelca backend/estado del breaker/tiempo en `gen_meta` y devuelve "" si no hubo
+    texto generado (timeout, error o circuito abierto) para caer en el camino extractivo.
+    """
+    text, info = rewrite_with_meta(deadline=deadline, **kwargs)
+    gen_meta.update(info)
+    return text if info.get("outcome") == "ok" else ""
+
+
+def _build_fallback_message(cands: CandidateSet, cfg: SelectorConfig) -> str:
     sugerencias = []
     limit = min(len(cands), cfg.show_k)
     for i in range(limit):
@@ -101,21 +134,38 @@ def _build_fallback_message(cands: List[Dict[str, Any]], cfg: SelectorConfig) ->
 
 def seleccionar_respuesta(
     query: str,
-    candidatos: List[Dict[str, Any]],
+    candidatos: CandidateSet,
     cfg: Optional[SelectorConfig] = None,
     enable_generation: bool = True,
+    analysis: Optional[QueryAnalysis] = None,
+    deadline: Optional["Deadline"] = None,
+    log: bool = True,
+    exact_match: bool = False,
 ) -> Dict[str, Any]:
     """
     Decide el modo de respuesta en base a los scores de recuperación semántica (coseno).
     Respeta el ORDEN híbrido (RRF) que trae retriever y toma decisiones con coseno denso.
+    `analysis` es el análisis compartido de la consulta (app.query_analysis).
+    `deadline` es el plazo del request (app.generator.Deadline) que acota al LLM.
+    `candidatos` es un CandidateSet (también acepta la lista de dicts de antes);
+    meta["ranking"] queda como CandidateSet: materializar con app.candidates.to_jsonable.
+    `log=False` no escribe en LOG_PATH (tráfico interno, p. ej. el warm-up).
+    `exact_match` marca meta (y el log) cuando los candidatos salen del atajo exacto:
+    su best_dense es EXACT_MATCH_SCORE, no un coseno medido.
     """
     cfg = cfg or SelectorConfig()
 
-    # Normalizamos/validamos scores
-    cands = [
-        {**c, "score": _safe_score(c.get("score", -1))}
-        for c in candidatos if "respuesta" in c and "pregunta_faq" in c
-    ]
+    def _log(payload: Dict[str, Any]) -> None:
+        if exact_match:
+            payload["meta"]["exact_match"] = True
+        if log:
+            _append_log(payload)
+
+    if analysis is None:
+        analysis = analyze_query(query)
+
+    # Normalizamos/validamos scores (sin copiar textos: vistas sobre el store de FAQs)
+    cands = as_candidate_set(candidatos).sanitized()
     # 🚫 NO reordenar por score: ya vienen en orden híbrido (RRF)
     # cands = sorted(cands, key=lambda x: x["score"], reverse=True)
 
@@ -126,7 +176,7 @@ def seleccionar_respuesta(
         answer = _build_fallback_message(cands, cfg)
         meta = {"decision": "fallback", "reason": "no_candidates",
                 "tau_low": cfg.tau_low, "tau_high": cfg.tau_high}
-        _append_log({"query": query, "mode": "fallback", "meta": meta})
+        _log({"query": query, "mode": "fallback", "meta": meta})
         return {"mode": "fallback", "answer": answer, "meta": meta}
 
     # Primer candidato según RRF
@@ -153,7 +203,7 @@ def seleccionar_respuesta(
             "tau_high": cfg.tau_high,
             "ranking": top_k,
         }
-        _append_log({"query": query, "mode": "extractive", "meta": meta})
+        _log({"query": query, "mode": "extractive", "meta": meta})
         return {"mode": "extractive", "answer": answer, "meta": meta}
 
     # 2) Tie-break (empate cercano) — SOLO CLARIFY
@@ -163,11 +213,11 @@ def seleccionar_respuesta(
         and (best_dense - second_dense) < cfg.near_tie_delta
     ):
         used_gen = False
+        gen_meta: Dict[str, Any] = {}
         if enable_generation and HAS_GENERATOR:
-            contexto = [{"pregunta_faq": c["pregunta_faq"], "respuesta": c["respuesta"]} for c in top_k]
             try:
-                clarify_ctx = json.dumps(contexto, ensure_ascii=False)
-                gen_answer = rewrite_answer(query=query, base_answer="", context=clarify_ctx, mode="clarify")
+                # Los candidatos van directo al generador (sin ida y vuelta por JSON)
+                gen_answer = _rewrite(gen_meta, deadline, query=query, base_answer="", context=top_k, mode="clarify")
                 answer = gen_answer.strip() if gen_answer and gen_answer.strip() else _build_disambiguation_message(top_k, cfg)
                 used_gen = bool(gen_answer and gen_answer.strip())
             except Exception:
@@ -185,36 +235,34 @@ def seleccionar_respuesta(
             "tau_low": cfg.tau_low,
             "tau_high": cfg.tau_high,
             "used_generator": used_gen,
+            "generator": gen_meta or None,
             "ranking": top_k,
             "generator_backend": get_backend_name() if used_gen else None
         }
-        _append_log({"query": query, "mode": "tie-break", "meta": meta})
+        _log({"query": query, "mode": "tie-break", "meta": meta})
         return {"mode": "tie-break", "answer": answer, "meta": meta}
 
     # 3) Generative (polish) — zona intermedia con gate léxico
     if cfg.tau_low <= best_dense < cfg.tau_high:
         # Gate léxico para evitar polish cuando la consulta y el top1 difieren demasiado
         lex_overlap = jaccard(query, top1["pregunta_faq"])
-        MIN_JACCARD = 0.22  # ajustar 0.20–0.25 si hace falta
 
         if lex_overlap < MIN_JACCARD:
             # Preferimos aclaración (tie-break) antes que pulir algo potencialmente distinto
             show_k = getattr(cfg, "show_k", 3)
             opts_src = top_k[:show_k]
-            contexto = [
-                {"pregunta_faq": c["pregunta_faq"], "respuesta": c["respuesta"]}
-                for c in opts_src
-            ]
 
             used_gen = False
+            gen_meta: Dict[str, Any] = {}
             clarify_text = None
             if enable_generation and HAS_GENERATOR:
                 try:
-                    ctx_str = json.dumps(contexto, ensure_ascii=False)
-                    clarify_text = rewrite_answer(
+                    clarify_text = _rewrite(
+                        gen_meta,
+                        deadline,
                         query=query,
                         base_answer="",
-                        context=ctx_str,
+                        context=opts_src,
                         mode="clarify",
                     )
                     used_gen = True if (clarify_text and clarify_text.strip()) else False
@@ -241,27 +289,27 @@ def seleccionar_respuesta(
                 "tau_high": cfg.tau_high,
                 "near_tie_delta": getattr(cfg, "near_tie_delta", None),
                 "used_generator": used_gen,
+                "generator": gen_meta or None,
                 "generator_backend": get_backend_name() if used_gen else None,
                 "top1_faq": top1["pregunta_faq"],
                 "top1_fused": best_fused,
                 "ranking": top_k,
             }
-            _append_log({"query": query, "mode": "tie-break", "meta": meta})
+            _log({"query": query, "mode": "tie-break", "meta": meta})
             return {"mode": "tie-break", "answer": clarify_text, "meta": meta}
 
         # Si pasa el gate, hacemos polish normal (prosa natural)
         used_gen = False
+        gen_meta: Dict[str, Any] = {}
         answer = top1["respuesta"]  # si el LLM falla, devolvemos esto
         if enable_generation and HAS_GENERATOR:
             try:
-                ctx_str = json.dumps(
-                    [{"pregunta_faq": c["pregunta_faq"], "respuesta": c["respuesta"]} for c in top_k],
-                    ensure_ascii=False
-                )
-                polished = rewrite_answer(
+                polished = _rewrite(
+                    gen_meta,
+                    deadline,
                     query=query,
                     base_answer=top1["respuesta"],
-                    context=ctx_str,
+                    context=top_k,
                     mode="polish",
                 )
                 if polished and polished.strip():
@@ -282,29 +330,23 @@ def seleccionar_respuesta(
             "tau_high": cfg.tau_high,
             "near_tie_delta": getattr(cfg, "near_tie_delta", None),
             "used_generator": used_gen,
+            "generator": gen_meta or None,
             "generator_backend": get_backend_name() if used_gen else None,
             "ranking": top_k,
         }
-        _append_log({"query": query, "mode": "generative", "meta": meta})
+        _log({"query": query, "mode": "generative", "meta": meta})
         return {"mode": "generative", "answer": answer, "meta": meta}
 
 
     # 3b) Generative borderline (laboral cercano a tau_low)
-    q_lower = (query or "").lower()
-    laboral_hint = any(k in q_lower for k in [
-        "salida", "salidas", "laboral", "trabajo", "trabajar",
-        "áreas", "ambitos", "ámbitos", "egresad", "oportunidades",
-        "campos", "campo laboral", "puestos", "empleo", "empleabilidad",
-        "recursos humanos", "rrhh"
-    ])
-    if laboral_hint and (cfg.tau_low - 0.05) <= best_dense < cfg.tau_low:
+    laboral_hint = analysis.laboral_hint
+    if laboral_hint and (cfg.tau_low - BORDERLINE_MARGIN) <= best_dense < cfg.tau_low:
         used_gen = False
+        gen_meta: Dict[str, Any] = {}
         answer = top1["respuesta"]
         if enable_generation and HAS_GENERATOR:
-            contexto = [{"pregunta_faq": c["pregunta_faq"], "respuesta": c["respuesta"]} for c in top_k]
             try:
-                ctx_str = json.dumps(contexto, ensure_ascii=False)
-                polished = rewrite_answer(query=query, base_answer=top1["respuesta"], context=ctx_str, mode="polish")
+                polished = _rewrite(gen_meta, deadline, query=query, base_answer=top1["respuesta"], context=top_k, mode="polish")
                 if polished and polished.strip():
                     answer = polished.strip()
                     used_gen = True
@@ -318,10 +360,11 @@ def seleccionar_respuesta(
             "tau_low": cfg.tau_low,
             "tau_high": cfg.tau_high,
             "used_generator": used_gen,
+            "generator": gen_meta or None,
             "ranking": top_k,
             "generator_backend": get_backend_name() if used_gen else None
         }
-        _append_log({"query": query, "mode": "generative", "meta": meta})
+        _log({"query": query, "mode": "generative", "meta": meta})
         return {"mode": "generative", "answer": answer, "meta": meta}
 
     # 4) Fallback (orden híbrido)
@@ -336,5 +379,5 @@ def seleccionar_respuesta(
         "tau_high": cfg.tau_high,
         "ranking": top_k,
     }
-    _append_log({"query": query, "mode": "fallback", "meta": meta})
+    _log({"query": query, "mode": "fallback", "meta": meta})
     return {"mode": "fallback", "answer": answer, "meta": meta}
\ No newline at end of file
@@ -0,0 +1,144 @@
+# app/retrieval_client.py
+"""
+Cliente del servicio de recuperación (app/retrieval_service.py).
+
+Mantiene un pool de conexiones al socket Unix (hasta `pool_size` pedidos en
+vuelo) y reutiliza las conexiones entre requests. Si el servicio se reinicia,
+la conexión rota se descarta y el pedido se reintenta una vez con una nueva.
+No importa app.retriever: la API y el bot no cargan modelo ni índices.
+"""
+import itertools
+import json
+import os
+import socket
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app import retrieval_protocol as proto
+from app.candidates import CandidateSet
+from app.catalogs import UnknownTenantError
+
+RETRIEVAL_POOL_SIZE = int(os.getenv("RETRIEVAL_POOL_SIZE", 8))
+RETRIEVAL_TIMEOUT_S = float(os.getenv("RETRIEVAL_TIMEOUT_S", 5))
+
+
+class RetrievalError(RuntimeError):
+    """El servicio de recuperación no respondió o devolvió un error."""
+
+
+class RetrievalClient:
+    def __init__(self, path: str, pool_size: int = RETRIEVAL_POOL_SIZE, timeout: float = RETRIEVAL_TIMEOUT_S):
+        self.path = path
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(1, pool_size))
+        self._idle: List[socket.socket] = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._stats = {"requests": 0, "connects": 0, "reconnects": 0, "errors": 0}
+
+    # ----- conexiones -----
+    def _connect(self) -> socket.socket:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(self.timeout)
+        s.connect(self.path)
+        with self._lock:
+            self._stats["connects"] += 1
+        return s
+
+    def _take(self) -> socket.socket:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _give_back(self, s: socket.socket) -> None:
+        with self._lock:
+            self._idle.append(s)
+
+    @staticmethod
+    def _recv_exact(s: socket.socket, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = s.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("el servicio cerró la conexión")
+            buf += chunk
+        return bytes(buf)
+
+    def _roundtrip(self, s: socket.socket, body: bytes, req_id: int) -> Tuple[bytes, int]:
+        s.sendall(proto.frame(body))
+        resp = self._recv_exact(s, proto.frame_length(self._recv_exact(s, proto.HEADER_SIZE)))
+        rid, status, flags, payload = proto.unpack_response(resp)
+        if rid != req_id:
+            raise ConnectionError(f"respuesta fuera de orden ({rid} != {req_id})")
+        if status == proto.ST_UNKNOWN_TENANT:
+            raise UnknownTenantError(payload.decode("utf-8"))
+        if status != proto.ST_OK:
+            raise RetrievalError(payload.decode("utf-8"))
+        return payload, flags
+
+    def _call(self, op: int, query: str = "", top_k: int = 0, tenant: Optional[str] = None,
+              flags: int = 0) -> Tuple[bytes, int]:
+        """Retorna (payload, flags de respuesta)."""
+        req_id = next(self._ids) & 0xFFFFFFFF
+        body = proto.pack_request(op, req_id, query=query, top_k=top_k, tenant=tenant, flags=flags)
+        with self._lock:
+            self._stats["requests"] += 1
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RetrievalError("pool de conexiones agotado")
+        try:
+            for attempt in range(2):
+                s = None
+                try:
+                    s = self._take()
+                    resp = self._roundtrip(s, body, req_id)
+                    self._give_back(s)
+                    return resp
+                except (ConnectionError, socket.timeout, OSError, proto.ProtocolError) as e:
+                    if s is not None:
+                        s.close()
+                    with self._lock:
+                        self._stats["reconnects" if attempt == 0 else "errors"] += 1
+                    if attempt == 1:
+                        raise RetrievalError(f"servicio de recuperación no disponible ({self.path}): {e}") from e
+                except (UnknownTenantError, RetrievalError):
+                    self._give_back(s)  # error de aplicación: la conexión sigue sana
+                    raise
+        finally:
+            self._slots.release()
+
+    # ----- API (equivalente a app.retriever) -----
+    def encode_query(self, query: str) -> np.ndarray:
+        return proto.unpack_vector(self._call(proto.OP_ENCODE, query=query)[0])
+
+    def buscar(self, query: str, top_k: int = 5, tenant: Optional[str] = None,
+               count_stats: bool = True) -> Tuple[CandidateSet, bool]:
+        """
+        encode + búsqueda híbrida en un solo viaje. Retorna (candidatos, exact_match):
+        exact_match=True si el servicio lo resolvió con el atajo exacto (como
+        app.retriever.buscar_exacta). `count_stats=False` no suma a los contadores
+        de /metrics del servicio.
+        """
+        payload, flags = self._call(proto.OP_SEARCH, query=query, top_k=top_k, tenant=tenant,
+                                    flags=0 if count_stats else proto.REQ_NO_STATS)
+        return proto.unpack_candidates(payload), bool(flags & proto.RESP_EXACT)
+
+    def buscar_similares(self, query: str, top_k: int = 5, tenant: Optional[str] = None,
+                         count_stats: bool = True) -> CandidateSet:
+        """Mismo formato que app.retriever.buscar_similares."""
+        return self.buscar(query, top_k=top_k, tenant=tenant, count_stats=count_stats)[0]
+
+    def server_stats(self) -> Dict[str, Any]:
+        return json.loads(self._call(proto.OP_STATS)[0].decode("utf-8"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "idle_connections": len(self._idle), "socket": self.path}
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for s in idle:
+            s.close()
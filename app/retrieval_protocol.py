@@ -0,0 +1,137 @@
+# app/retrieval_protocol.py
+"""
+Protocolo binario del servicio de recuperación (app/retrieval_service.py).
+
+Cada mensaje va en un frame: longitud (uint32 big-endian) + cuerpo.
+
+Request:   op (u8) | req_id (u32) | top_k (u16) | flags (u8) | tenant (str16) | query (str32)
+Response:  req_id (u32) | status (u8) | flags (u8) | payload
+
+Flags del request:  REQ_NO_STATS → no sumar a los contadores de /metrics (warm-up, tráfico interno)
+Flags de respuesta: RESP_EXACT   → OP_SEARCH resuelto por el atajo exacto (sin encoder ni búsqueda)
+
+Payload según op (status OK):
+    OP_ENCODE → dim (u16) + dim float32 little-endian
+    OP_SEARCH → n (u16) + n × [score_dense, score_lex, score_fused (3 float32)
+                                faq_id (str16), pregunta_faq (str32), respuesta (str32)]
+    OP_STATS  → JSON utf-8
+Con status != OK el payload es el mensaje de error (utf-8).
+
+str16/str32 = longitud u16/u32 + bytes utf-8.
+"""
+import struct
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.candidates import CandidateSet
+
+OP_ENCODE, OP_SEARCH, OP_STATS = 1, 2, 3
+ST_OK, ST_ERROR, ST_UNKNOWN_TENANT = 0, 1, 2
+REQ_NO_STATS = 0x01
+RESP_EXACT = 0x01
+
+MAX_FRAME = 16 * 1024 * 1024
+
+_LEN = struct.Struct("!I")
+_REQ = struct.Struct("!BIHB")
+_RESP = struct.Struct("!IBB")
+_U16 = struct.Struct("!H")
+_SCORES = struct.Struct("!fff")
+
+
+class ProtocolError(Exception):
+    """Frame mal formado o demasiado grande."""
+
+
+def _pack_str(s: str, wide: bool = False) -> bytes:
+    b = (s or "").encode("utf-8")
+    return (_LEN.pack(len(b)) if wide else _U16.pack(len(b))) + b
+
+
+def _unpack_str(buf: bytes, off: int, wide: bool = False) -> Tuple[str, int]:
+    if wide:
+        (n,), off = _LEN.unpack_from(buf, off), off + _LEN.size
+    else:
+        (n,), off = _U16.unpack_from(buf, off), off + _U16.size
+    return buf[off:off + n].decode("utf-8"), off + n
+
+
+def frame(body: bytes) -> bytes:
+    if len(body) > MAX_FRAME:
+        raise ProtocolError(f"frame de {len(body)} bytes (máx. {MAX_FRAME})")
+    return _LEN.pack(len(body)) + body
+
+
+def frame_length(header: bytes) -> int:
+    (n,) = _LEN.unpack(header)
+    if n > MAX_FRAME:
+        raise ProtocolError(f"frame de {n} bytes (máx. {MAX_FRAME})")
+    return n
+
+
+HEADER_SIZE = _LEN.size
+
+
+# ----- requests -----
+def pack_request(op: int, req_id: int, query: str = "", top_k: int = 0, tenant: Optional[str] = None,
+                 flags: int = 0) -> bytes:
+    return _REQ.pack(op, req_id, top_k, flags) + _pack_str(tenant or "") + _pack_str(query, wide=True)
+
+
+def unpack_request(body: bytes) -> Tuple[int, int, int, int, Optional[str], str]:
+    """Retorna (op, req_id, top_k, flags, tenant, query)."""
+    op, req_id, top_k, flags = _REQ.unpack_from(body, 0)
+    tenant, off = _unpack_str(body, _REQ.size)
+    query, _ = _unpack_str(body, off, wide=True)
+    return op, req_id, top_k, flags, (tenant or None), query
+
+
+# ----- responses -----
+def pack_response(req_id: int, status: int, payload: bytes, flags: int = 0) -> bytes:
+    return _RESP.pack(req_id, status, flags) + payload
+
+
+def unpack_response(body: bytes) -> Tuple[int, int, int, bytes]:
+    """Retorna (req_id, status, flags, payload)."""
+    req_id, status, flags = _RESP.unpack_from(body, 0)
+    return req_id, status, flags, body[_RESP.size:]
+
+
+def pack_vector(vec: np.ndarray) -> bytes:
+    v = np.asarray(vec, dtype="<f4").ravel()
+    return _U16.pack(len(v)) + v.tobytes()
+
+
+def unpack_vector(payload: bytes) -> np.ndarray:
+    (dim,) = _U16.unpack_from(payload, 0)
+    v = np.frombuffer(payload, dtype="<f4", count=dim, offset=_U16.size)
+    return v.astype(np.float32).reshape(1, dim)
+
+
+def pack_candidates(cands: CandidateSet) -> bytes:
+    parts = [_U16.pack(len(cands))]
+    for c in cands:
+        parts.append(_SCORES.pack(c["score_dense"], c["score_lex"], c["score_fused"]))
+        parts.append(_pack_str(str(c["faq_id"])))
+        parts.append(_pack_str(c["pregunta_faq"], wide=True))
+        parts.append(_pack_str(c["respuesta"], wide=True))
+    return b"".join(parts)
+
+
+def unpack_candidates(payload: bytes) -> CandidateSet:
+    """CandidateSet sobre un store local con los textos recibidos (mismas claves que el retriever)."""
+    (n,) = _U16.unpack_from(payload, 0)
+    off = _U16.size
+    store, dense, lex, fused = [], [], [], []
+    for _ in range(n):
+        d, s, f = _SCORES.unpack_from(payload, off)
+        off += _SCORES.size
+        faq_id, off = _unpack_str(payload, off)
+        pregunta, off = _unpack_str(payload, off, wide=True)
+        respuesta, off = _unpack_str(payload, off, wide=True)
+        store.append({"faq_id": faq_id, "pregunta_faq": pregunta, "respuesta": respuesta})
+        dense.append(d)
+        lex.append(s)
+        fused.append(f)
+    return CandidateSet(store, np.arange(n), dense, lex, fused)
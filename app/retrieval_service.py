@@ -0,0 +1,242 @@
+# app/retrieval_service.py
+"""
+Servicio de recuperación: un solo proceso dueño del modelo de embeddings,
+los índices FAISS y los TF-IDF, atendiendo a la API y al bot por un socket Unix.
+
+- El proceso principal carga el catálogo por defecto (y los tenants de
+  `--preload`) y recién después crea el pool de procesos con fork: los workers
+  comparten esas páginas de memoria (copy-on-write) en lugar de cargar cada uno
+  su copia.
+- Los pedidos que llegan juntos se agrupan en micro-lotes (hasta
+  RETRIEVAL_BATCH_MAX, esperando como mucho RETRIEVAL_BATCH_WAIT_MS) y cada lote
+  se codifica con una sola llamada al modelo en un worker.
+- Protocolo binario: ver app/retrieval_protocol.py. Cliente con pool de
+  conexiones: app/retrieval_client.py (se activa con RETRIEVAL_SOCKET).
+
+Uso:
+    python -m app.retrieval_service --socket /tmp/ies-retrieval.sock --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from app import retrieval_protocol as proto
+
+RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET", "/tmp/ies-retrieval.sock")
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+RETRIEVAL_BATCH_MAX = int(os.getenv("RETRIEVAL_BATCH_MAX", 32))
+RETRIEVAL_BATCH_WAIT_MS = float(os.getenv("RETRIEVAL_BATCH_WAIT_MS", 2))
+# Hilos de torch/FAISS por worker: el paralelismo lo dan los procesos
+RETRIEVAL_THREADS_PER_WORKER = int(os.getenv("RETRIEVAL_THREADS_PER_WORKER", 1))
+
+
+# ----- Lado worker (corre en los procesos del pool) -----
+def _init_worker(threads: int) -> None:
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(threads)
+    except Exception:
+        pass
+
+
+def _run_batch(items: List[Tuple[int, str, int, Optional[str], int]]) -> List[Tuple[int, bytes, int]]:
+    """
+    Atiende un micro-lote [(op, query, top_k, tenant, flags)] y retorna
+    [(status, payload, flags de respuesta)]. Las consultas del lote que no
+    resuelve el atajo exacto se codifican en una sola pasada del modelo.
+    """
+    from app.catalogs import UnknownTenantError, get_catalog
+    from app.response_selector import load_selector_config
+    from app.retriever import buscar_exacta, buscar_similares, encode_queries
+
+    exact = {}
+    for i, (op, query, _, tenant, flags) in enumerate(items):
+        if op == proto.OP_SEARCH:
+            try:
+                hit = buscar_exacta(query, catalog=get_catalog(tenant),
+                                    count_stats=not flags & proto.REQ_NO_STATS)
+            except Exception:
+                continue  # tenant inválido u otro error: lo informa el camino normal
+            if hit is not None:
+                exact[i] = hit
+    pending = [i for i in range(len(items)) if i not in exact]
+    vecs = encode_queries([items[i][1] for i in pending]) if pending else None
+    row_of = {i: r for r, i in enumerate(pending)}
+    # La cascada respeta el tau_high que sirve la API (mismo SELECTOR_CONFIG_PATH):
+    # se lee una vez por lote, así una recalibración llega sin reiniciar el servicio
+    tau_high = load_selector_config().tau_high if any(items[i][0] == proto.OP_SEARCH for i in pending) else None
+
+    out = []
+    for i, (op, query, top_k, tenant, flags) in enumerate(items):
+        try:
+            if i in exact:
+                out.append((proto.ST_OK, proto.pack_candidates(exact[i]), proto.RESP_EXACT))
+                continue
+            qvec = vecs[row_of[i]:row_of[i] + 1]
+            if op == proto.OP_ENCODE:
+                out.append((proto.ST_OK, proto.pack_vector(qvec), 0))
+                continue
+            catalog = get_catalog(tenant)
+            cands = buscar_similares(qvec, top_k=top_k or 5, query_text=query, catalog=catalog,
+                                     count_stats=not flags & proto.REQ_NO_STATS, tau_high=tau_high)
+            out.append((proto.ST_OK, proto.pack_candidates(cands), 0))
+        except UnknownTenantError:
+            out.append((proto.ST_UNKNOWN_TENANT, f"tenant desconocido: {tenant}".encode("utf-8"), 0))
+        except Exception as e:
+            out.append((proto.ST_ERROR, f"{type(e).__name__}: {e}".encode("utf-8"), 0))
+    return out
+
+
+def _warm(_: int) -> int:
+    return os.getpid()
+
+
+# ----- Lado servidor (proceso principal) -----
+class RetrievalServer:
+    def __init__(self, pool: ProcessPoolExecutor, batch_max: int, batch_wait_ms: float):
+        self.pool = pool
+        self.batch_max = max(1, batch_max)
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.queue: "asyncio.Queue" = None
+        self.stats = {"requests": 0, "batches": 0, "errors": 0, "connections": 0, "batch_hist": {}}
+        self.started = time.time()
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            end = loop.time() + self.batch_wait
+            while len(batch) < self.batch_max:
+                timeout = end - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.stats["batches"] += 1
+            hist = self.stats["batch_hist"]
+            hist[len(batch)] = hist.get(len(batch), 0) + 1
+            # No se espera acá: varios lotes corren en paralelo en distintos workers
+            loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch) -> None:
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        try:
+            results = await loop.run_in_executor(self.pool, _run_batch, items)
+        except Exception as e:
+            self.stats["errors"] += len(batch)
+            results = [(proto.ST_ERROR, f"{type(e).__name__}: {e}".encode("utf-8"), 0)] * len(batch)
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+    async def _handle_request(self, body: bytes, writer: asyncio.StreamWriter) -> None:
+        try:
+            op, req_id, top_k, flags, tenant, query = proto.unpack_request(body)
+        except Exception:
+            self.stats["errors"] += 1
+            return
+        self.stats["requests"] += 1
+        resp_flags = 0
+        if op == proto.OP_STATS:
+            status, payload = proto.ST_OK, json.dumps(self.get_stats()).encode("utf-8")
+        elif op in (proto.OP_ENCODE, proto.OP_SEARCH):
+            fut = asyncio.get_running_loop().create_future()
+            await self.queue.put(((op, query, top_k, tenant, flags), fut))
+            status, payload, resp_flags = await fut
+        else:
+            status, payload = proto.ST_ERROR, f"op desconocida: {op}".encode("utf-8")
+        if not writer.is_closing():
+            writer.write(proto.frame(proto.pack_response(req_id, status, payload, resp_flags)))
+
+    async def handle_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats["connections"] += 1
+        tasks = set()
+        try:
+            while True:
+                header = await reader.readexactly(proto.HEADER_SIZE)
+                body = await reader.readexactly(proto.frame_length(header))
+                # Una tarea por pedido: un cliente puede encadenar varios sin esperar
+                t = asyncio.create_task(self._handle_request(body, writer))
+                tasks.add(t)
+                t.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, proto.ProtocolError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            self.stats["connections"] -= 1
+
+    def get_stats(self):
+        batches = max(1, self.stats["batches"])
+        return {
+            **self.stats,
+            "avg_batch": round(sum(k * v for k, v in self.stats["batch_hist"].items()) / batches, 2),
+            "uptime_s": round(time.time() - self.started, 1),
+        }
+
+    async def serve(self, path: str) -> None:
+        self.queue = asyncio.Queue()
+        if os.path.exists(path):
+            os.unlink(path)  # socket viejo de una corrida anterior
+        server = await asyncio.start_unix_server(self.handle_conn, path=path)
+        os.chmod(path, 0o660)
+        asyncio.get_running_loop().create_task(self._batcher())
+        print(f"[RETRIEVAL] Escuchando en {path}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Servicio de recuperación (encode + búsqueda) por socket Unix.")
+    ap.add_argument("--socket", default=RETRIEVAL_SOCKET)
+    ap.add_argument("--workers", type=int, default=RETRIEVAL_WORKERS)
+    ap.add_argument("--batch-max", type=int, default=RETRIEVAL_BATCH_MAX)
+    ap.add_argument("--batch-wait-ms", type=float, default=RETRIEVAL_BATCH_WAIT_MS)
+    ap.add_argument("--preload", default="", help="tenants a cargar antes del fork (separados por coma)")
+    args = ap.parse_args()
+
+    # Carga en el proceso principal, antes del fork, para compartir memoria con los workers
+    t0 = time.perf_counter()
+    from app.catalogs import get_catalog
+    get_catalog(None)
+    for tenant in filter(None, (t.strip() for t in args.preload.split(","))):
+        get_catalog(tenant)
+    print(f"[RETRIEVAL] Modelo y catálogos cargados en {time.perf_counter() - t0:.1f}s")
+
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(RETRIEVAL_THREADS_PER_WORKER,),
+    )
+    # Levantar todos los workers ahora (y no a demanda con el event loop ya corriendo)
+    list(pool.map(_warm, range(args.workers * 2)))
+    print(f"[RETRIEVAL] {args.workers} worker(s) listos")
+
+    server = RetrievalServer(pool, args.batch_max, args.batch_wait_ms)
+    try:
+        asyncio.run(server.serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,58 @@
 # app/retriever.py
 
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 import faiss
 import pickle
 import numpy as np
 from typing import List, Dict, Tuple, Optional
 from sentence_transformers import SentenceTransformer
+from app.candidates import CandidateSet
+from app.pca import PCA_FILENAME, build_coarse_index, two_stage_search
+from app.query_analysis import STOP_ES, QueryAnalysis, analyze_query, normalize_text
+from app.rerank_rules import RULES_PATH, CompiledRules, compile_rules
 
-# ===== Rutas a artefactos =====
+# ===== Rutas a artefactos (catálogo por defecto) =====
 FAISS_INDEX_PATH = "models/embeddings_index.faiss"
 FAQS_PICKLE_PATH = "models/faqs.pkl"
 
-# ===== Carga de modelo denso y recursos FAISS =====
-# Modelo multilingüe (ya lo venías usando)
+# Candidatos por canal para la fusión. Con índice multi-vector (pregunta + pasajes
+# de respuesta) el canal denso ya cubre el contenido de las respuestas, así que
+# alcanza con listas más cortas y la fusión hace menos trabajo.
+DENSE_K, SPARSE_K = 50, 50
+DENSE_K_MULTI, SPARSE_K_MULTI = 20, 20
+
+# Búsqueda densa en dos etapas (si el build dejó pca.npy, ver app/pca.py): etapa gruesa
+# sobre vectores reducidos y re-puntuación exacta de DENSE_PCA_WIDTH × k candidatos.
+# Por debajo de DENSE_PCA_MIN_VECTORS el IndexFlatIP completo ya es más rápido.
+DENSE_PCA_MIN_VECTORS = int(os.getenv("DENSE_PCA_MIN_VECTORS", 10000))
+DENSE_PCA_WIDTH = int(os.getenv("DENSE_PCA_WIDTH", 4))
+
+# Cascada: si el denso ya es contundente (top-1 alto y lejos del top-2) y la consulta
+# no activa reglas de re-ranking, se devuelve el ranking denso sin TF-IDF ni fusión.
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "1") != "0"
+CASCADE_MIN_SCORE = float(os.getenv("CASCADE_MIN_SCORE", 0.90))
+CASCADE_MIN_MARGIN = float(os.getenv("CASCADE_MIN_MARGIN", 0.08))
+
+# Atajo para preguntas pegadas tal cual (o una opción copiada de una aclaración):
+# si la consulta normalizada coincide con una pregunta del catálogo, no se codifica
+# ni se busca; se devuelve esa FAQ con score sintético (el selector la responde extractiva).
+EXACT_FAST_PATH = os.getenv("EXACT_FAST_PATH", "1") != "0"
+EXACT_MATCH_SCORE = 1.0
+# Caché LRU de embeddings de consultas (texto exacto → vector); la llena el tráfico
+# y el warm-up (app/warmup.py). 0 = desactivada.
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 4096))
+# Sufijo que agrega _build_fallback_message a cada sugerencia: "- pregunta (score=0.55)"
+_SCORE_SUFFIX_RE = re.compile(r"\(score=[-\d.]+\)\s*$")
+
+# ===== Carga de modelo denso =====
+# Modelo multilingüe (ya lo venías usando). Es UNO solo por proceso y lo comparten
+# todos los catálogos (ver app/catalogs.py): solo cambian índice/FAQs/TF-IDF.
 model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
 
-# Índice FAISS (IndexFlatIP) con vectores normalizados
-index = faiss.read_index(FAISS_INDEX_PATH)
-
-# === NUEVO: extraer la matriz de embeddings del índice (IndexFlatIP) ===
-try:
-    _XB = faiss.vector_to_array(index.xb).reshape(index.ntotal, index.d).astype(np.float32, copy=False)
-except Exception:
-    _XB = None
-
-with open(FAQS_PICKLE_PATH, "rb") as f:
-    faqs: List[Dict] = pickle.load(f)
-
 # ====== TF-IDF (índice léxico) ======
 # Construimos un índice léxico sobre las preguntas, para complementar el denso
 # Requiere scikit-learn
@@ -38,68 +65,282 @@ except Exception:
     TfidfVectorizer = None
     linear_kernel = None
 
-_tfidf_vectorizer: Optional[TfidfVectorizer] = None
-_tfidf_matrix = None
-_faq_texts: Optional[List[str]] = None
-
 
-def _build_sparse_index(faqs_list: List[Dict]) -> None:
-    """Construye el índice TF-IDF sobre las preguntas de las FAQs."""
-    global _tfidf_vectorizer, _tfidf_matrix, _faq_texts
+def _build_sparse_index(faqs_list: List[Dict]):
+    """
+    Construye el índice TF-IDF sobre las preguntas (+ respuestas) de las FAQs.
+    Retorna (vectorizer, matrix) o (None, None) si sklearn no está disponible.
+    """
     if not _HAS_SK:
         # Si no está sklearn disponible, dejamos el híbrido desactivado
-        _tfidf_vectorizer = None
-        _tfidf_matrix = None
-        _faq_texts = None
-        return
+        return None, None
 
-    _faq_texts = [f'{f["pregunta_faq"]}  {f["respuesta"]}' for f in faqs_list]
-    _tfidf_vectorizer = TfidfVectorizer(
+    faq_texts = [f'{f["pregunta_faq"]}  {f["respuesta"]}' for f in faqs_list]
+    vectorizer = TfidfVectorizer(
         lowercase=True,
         stop_words=None,  # ayuda a separar bien términos como "modalidad" vs "salida laboral"
         ngram_range=(1, 2),    # capta bigramas útiles
         sublinear_tf=True,
         max_features=60000
     )
-    _tfidf_matrix = _tfidf_vectorizer.fit_transform(_faq_texts)
+    return vectorizer, vectorizer.fit_transform(faq_texts)
+
+
+def exact_key(text: str) -> str:
+    """Clave del atajo exacto: texto plegado, sin puntuación ni stopwords."""
+    text = _SCORE_SUFFIX_RE.sub("", (text or "").strip())
+    return " ".join(t for t in normalize_text(text).split() if t not in STOP_ES)
+
+
+def _build_exact_index(faqs_list: List[Dict]) -> Dict[str, int]:
+    """
+    Mapa clave exacta → posición de la FAQ. Las claves repetidas (misma pregunta
+    con respuestas distintas) se descartan: ahí tiene que decidir el pipeline completo.
+    """
+    out: Dict[str, int] = {}
+    dup = set()
+    for i, f in enumerate(faqs_list):
+        key = exact_key(f["pregunta_faq"])
+        if not key:
+            continue
+        if key in out:
+            dup.add(key)
+        out[key] = i
+    for key in dup:
+        del out[key]
+    return out
+
+
+class CatalogBundle:
+    """
+    Recursos de recuperación de UN catálogo de FAQs:
+    índice FAISS (IndexFlatIP), matriz de embeddings, FAQs, TF-IDF, reglas compiladas
+    y el mapa de preguntas exactas (atajo sin encoder).
+    Con `vector_map` el índice es multi-vector: varias filas por FAQ (pregunta y
+    pasajes de respuesta) y vector_map[fila] = posición de la FAQ.
+    Con `projection` (PCA del build) la búsqueda densa es en dos etapas.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        index,
+        faqs_list: List[Dict],
+        rules: CompiledRules,
+        vector_map: Optional[np.ndarray] = None,
+        projection: Optional[np.ndarray] = None,
+    ):
+        self.name = name
+        self.index = index
+        self.faqs = faqs_list
+
+        self.vector_map = vector_map
+        if vector_map is not None:
+            # Filas agrupadas por FAQ (estilo CSR) para el max-pooling de candidatos sueltos
+            counts = np.bincount(vector_map, minlength=len(faqs_list))
+            self._rows_by_faq = np.argsort(vector_map, kind="stable")
+            self._row_ptr = np.concatenate([[0], np.cumsum(counts)])
+            self.vectors_per_faq = index.ntotal / max(1, len(faqs_list))
+            self.dense_k, self.sparse_k = DENSE_K_MULTI, SPARSE_K_MULTI
+        else:
+            self.vectors_per_faq = 1.0
+            self.dense_k, self.sparse_k = DENSE_K, SPARSE_K
+
+        # Matriz de embeddings del índice (para el coseno real de candidatos no densos)
+        try:
+            self.xb = faiss.vector_to_array(index.xb).reshape(index.ntotal, index.d).astype(np.float32, copy=False)
+        except Exception:
+            # Versiones recientes de FAISS ya no exponen `xb` en IndexFlat
+            try:
+                self.xb = index.reconstruct_n(0, index.ntotal).astype(np.float32, copy=False)
+            except Exception:
+                self.xb = None
+
+        self.projection, self.coarse_index = None, None
+        if projection is not None and self.xb is not None and index.ntotal >= DENSE_PCA_MIN_VECTORS:
+            self.projection = projection
+            self.coarse_index = build_coarse_index(self.xb, projection)
+
+        self.tfidf_vectorizer, self.tfidf_matrix = _build_sparse_index(faqs_list)
+        self.rules = rules
+        self.exact_index = _build_exact_index(faqs_list)
+
+    @property
+    def has_sparse(self) -> bool:
+        return self.tfidf_vectorizer is not None
+
+    def search_dense(self, query_vec: np.ndarray, k: int, flat: bool = False):
+        """index.search(query_vec, k) exacto; en dos etapas si hay proyección PCA (salvo `flat`)."""
+        if self.coarse_index is not None and not flat:
+            return two_stage_search(self.coarse_index, self.projection, self.xb, query_vec, k, DENSE_PCA_WIDTH * k)
+        return self.index.search(query_vec, k)
+
+    def dense_score(self, qv: np.ndarray, idx: int) -> float:
+        """Coseno real consulta↔FAQ (máximo sobre sus vectores si es multi-vector)."""
+        if self.xb is None:
+            return 0.0
+        if self.vector_map is None:
+            return float(np.dot(qv, self.xb[idx]))
+        rows = self._rows_by_faq[self._row_ptr[idx]:self._row_ptr[idx + 1]]
+        if len(rows) == 0:
+            return 0.0
+        return float((self.xb[rows] @ qv).max())
+
+    def nbytes(self) -> int:
+        """Estimación de memoria del catálogo (para el presupuesto del registro)."""
+        total = self.index.ntotal * self.index.d * 4
+        if self.xb is not None:
+            total += self.xb.nbytes
+        if self.tfidf_matrix is not None:
+            m = self.tfidf_matrix
+            total += m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+            total += len(self.tfidf_vectorizer.vocabulary_) * 64
+        total += sum(len(f["pregunta_faq"]) + len(f["respuesta"]) for f in self.faqs) * 2
+        total += self.rules.features.nbytes
+        total += sum(len(k) + 64 for k in self.exact_index)
+        if self.vector_map is not None:
+            total += self.vector_map.nbytes * 2 + self._row_ptr.nbytes
+        if self.coarse_index is not None:
+            total += self.coarse_index.ntotal * self.coarse_index.d * 4 + self.projection.nbytes
+        return total
+
+
+def load_catalog(
+    name: str,
+    index_path: str,
+    faqs_path: str,
+    rules_path: str = RULES_PATH,
+) -> CatalogBundle:
+    """
+    Lee índice + FAQs de disco y construye TF-IDF y reglas del catálogo.
+    Si junto al índice hay un vector_map.npy (build multi-vector) o un pca.npy
+    (build con --pca-dim), se usan.
+    """
+    idx = faiss.read_index(index_path)
+    with open(faqs_path, "rb") as f:
+        faqs_list: List[Dict] = pickle.load(f)
+
+    vector_map = None
+    map_path = os.path.join(os.path.dirname(index_path), "vector_map.npy")
+    if os.path.exists(map_path):
+        vector_map = np.load(map_path).astype(np.int64, copy=False)
+        if len(vector_map) != idx.ntotal:
+            raise RuntimeError(f"{map_path} no coincide con el índice ({len(vector_map)} != {idx.ntotal}).")
 
+    projection = None
+    pca_path = os.path.join(os.path.dirname(index_path), PCA_FILENAME)
+    if os.path.exists(pca_path):
+        projection = np.load(pca_path).astype(np.float32, copy=False)
+        if projection.shape[0] != idx.d:
+            raise RuntimeError(f"{pca_path} no coincide con el índice ({projection.shape[0]} != {idx.d} dims).")
+    return CatalogBundle(name, idx, faqs_list, compile_rules(faqs_list, rules_path), vector_map, projection)
 
-# Construimos el índice léxico una sola vez al importar
-_build_sparse_index(faqs)
+
+# Catálogo por defecto (despliegue de una sola institución), cargado al importar
+default_catalog = load_catalog("default", FAISS_INDEX_PATH, FAQS_PICKLE_PATH, RULES_PATH)
+
+# Alias de compatibilidad (código que usaba los globales del módulo)
+index = default_catalog.index
+faqs: List[Dict] = default_catalog.faqs
+_XB = default_catalog.xb
 
 
 # ===== Helpers comunes =====
+_embed_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_embed_lock = threading.Lock()
+_embed_stats = {"hits": 0, "misses": 0}
+
+
+def _encode_batch(queries: List[str]) -> np.ndarray:
+    vec = model.encode(queries, batch_size=max(1, len(queries)), convert_to_numpy=True, normalize_embeddings=False)
+    vec = vec / np.linalg.norm(vec, axis=1, keepdims=True)
+    return vec.astype(np.float32, copy=False)
+
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    """
+    Codifica y normaliza un lote de consultas en una sola pasada del modelo
+    (solo las que no están en la caché de embeddings).
+    Retorna matriz (n, d) float32 con filas de norma 1.
+    """
+    if EMBED_CACHE_SIZE <= 0:
+        return _encode_batch(queries)
+    rows: List[Optional[np.ndarray]] = [None] * len(queries)
+    with _embed_lock:
+        for i, q in enumerate(queries):
+            v = _embed_cache.get(q)
+            if v is not None:
+                _embed_cache.move_to_end(q)
+                rows[i] = v
+        missing = [i for i, v in enumerate(rows) if v is None]
+        _embed_stats["hits"] += len(queries) - len(missing)
+        _embed_stats["misses"] += len(missing)
+    if missing:
+        vecs = _encode_batch([queries[i] for i in missing])
+        with _embed_lock:
+            for j, i in enumerate(missing):
+                rows[i] = _embed_cache[queries[i]] = vecs[j].copy()
+            while len(_embed_cache) > EMBED_CACHE_SIZE:
+                _embed_cache.popitem(last=False)
+    return np.vstack(rows)
+
+
+def get_embed_stats() -> Dict[str, float]:
+    with _embed_lock:
+        hits, misses, size = _embed_stats["hits"], _embed_stats["misses"], len(_embed_cache)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "size": size, "hit_ratio": round(hits / total, 4) if total else 0.0}
+
+
 def encode_query(query: str) -> np.ndarray:
     """
     Codifica y normaliza la consulta para obtener su vector de embeddings.
     Retorna float32 con norma 1 (FAISS IP ≈ coseno).
     """
-    vec = model.encode([query], convert_to_numpy=True, normalize_embeddings=False)
-    vec = vec / np.linalg.norm(vec, axis=1, keepdims=True)
-    return vec.astype(np.float32, copy=False)
+    return encode_queries([query])
 
 
-def _dense_topk(query_vec: np.ndarray, k: int = 10) -> List[Tuple[int, float]]:
+def _dense_topk(query_vec: np.ndarray, k: int = 10, catalog: Optional[CatalogBundle] = None,
+                flat: bool = False) -> List[Tuple[int, float]]:
     """
     Top-k sobre FAISS (IP con embeddings normalizados).
     Retorna lista [(idx, score_cos)] con índices de faqs.
+    En índices multi-vector agrega por FAQ con max-pooling.
     """
+    catalog = catalog or default_catalog
     if query_vec.dtype != np.float32:
         query_vec = query_vec.astype(np.float32, copy=False)
-    D, I = index.search(query_vec, k)
-    # Filtramos -1 por seguridad (no debería aparecer con IndexFlatIP)
-    return [(int(I[0][i]), float(D[0][i])) for i in range(I.shape[1]) if I[0][i] != -1]
-
 
-def _sparse_topk(query_text: str, k: int = 10) -> List[Tuple[int, float]]:
+    if catalog.vector_map is None:
+        D, I = catalog.search_dense(query_vec, k, flat)
+        # Filtramos -1 por seguridad (no debería aparecer con IndexFlatIP)
+        return [(int(I[0][i]), float(D[0][i])) for i in range(I.shape[1]) if I[0][i] != -1]
+
+    # Multi-vector: pedimos suficientes filas para cubrir k FAQs distintas
+    k_vec = min(catalog.index.ntotal, int(np.ceil(k * catalog.vectors_per_faq)) + k)
+    D, I = catalog.search_dense(query_vec, k_vec, flat)
+    best: Dict[int, float] = {}  # vienen ordenados desc: la primera fila de cada FAQ es su máximo
+    for d, i in zip(D[0], I[0]):
+        if i == -1:
+            continue
+        f = int(catalog.vector_map[i])
+        if f not in best:
+            best[f] = float(d)
+            if len(best) >= k:
+                break
+    return list(best.items())
+
+
+def _sparse_topk(query_text: str, k: int = 10, catalog: Optional[CatalogBundle] = None) -> List[Tuple[int, float]]:
     """
     Top-k TF-IDF (coseno). Retorna lista [(idx, score_lex)].
     Si sklearn no está disponible o no hay texto, retorna [].
     """
-    if not _HAS_SK or _tfidf_vectorizer is None or not query_text or not query_text.strip():
+    catalog = catalog or default_catalog
+    if not catalog.has_sparse or not query_text or not query_text.strip():
         return []
-    q = _tfidf_vectorizer.transform([query_text])
-    sims = linear_kernel(q, _tfidf_matrix).ravel()  # similitud coseno con la matriz TF-IDF
+    q = catalog.tfidf_vectorizer.transform([query_text])
+    sims = linear_kernel(q, catalog.tfidf_matrix).ravel()  # similitud coseno con la matriz TF-IDF
     top_idx = sims.argsort()[::-1][:k]
     return [(int(i), float(sims[i])) for i in top_idx]
 
@@ -171,40 +412,140 @@ def _fuse_scores(
     return fused
 
 
+# ===== Atajo de coincidencia exacta =====
+_exact_stats = {"lookups": 0, "hits": 0}
+_stats_lock = threading.Lock()  # contadores del atajo exacto y de la cascada
+
+
+def buscar_exacta(
+    query_text: str,
+    analysis: Optional[QueryAnalysis] = None,
+    catalog: Optional[CatalogBundle] = None,
+    count_stats: bool = True,
+) -> Optional[CandidateSet]:
+    """
+    Si la consulta es (normalizada) una pregunta del catálogo, retorna un
+    CandidateSet top-1 con EXACT_MATCH_SCORE sin tocar encoder, FAISS ni TF-IDF.
+    Retorna None si no hay coincidencia (o el atajo está desactivado).
+    `count_stats=False` no suma a los contadores de /metrics (tráfico interno).
+    """
+    if not EXACT_FAST_PATH or not query_text:
+        return None
+    catalog = catalog or default_catalog
+    if "(score=" in query_text:
+        key = exact_key(query_text)
+    else:
+        # reutiliza los tokens ya plegados del análisis (cacheado por consulta)
+        tokens = (analysis or analyze_query(query_text)).tokens
+        key = " ".join(t for t in tokens if t not in STOP_ES)
+    idx = catalog.exact_index.get(key) if key else None
+    if count_stats:
+        with _stats_lock:
+            _exact_stats["lookups"] += 1
+            if idx is not None:
+                _exact_stats["hits"] += 1
+    if idx is None:
+        return None
+    sc = [EXACT_MATCH_SCORE]
+    return CandidateSet(catalog.faqs, [idx], sc, sc, sc)
+
+
+def get_exact_stats() -> Dict[str, float]:
+    with _stats_lock:
+        lookups, hits = _exact_stats["lookups"], _exact_stats["hits"]
+    return {"lookups": lookups, "hits": hits, "hit_ratio": round(hits / lookups, 4) if lookups else 0.0}
+
+
+# ===== Cascada denso → léxico =====
+_cascade_stats = {"queries": 0, "dense_only": 0}
+
+
+def _dense_is_decisive(dense: List[Tuple[int, float]], tau_high: Optional[float] = None) -> bool:
+    # Nunca por debajo del tau_high servido: la premisa es que el selector responde extractivo
+    min_score = CASCADE_MIN_SCORE if tau_high is None else max(CASCADE_MIN_SCORE, tau_high)
+    if not dense or dense[0][1] < min_score:
+        return False
+    return len(dense) < 2 or dense[0][1] - dense[1][1] >= CASCADE_MIN_MARGIN
+
+
+def get_cascade_stats() -> Dict[str, float]:
+    with _stats_lock:
+        q, d = _cascade_stats["queries"], _cascade_stats["dense_only"]
+    return {"queries": q, "dense_only": d, "skip_rate": round(d / q, 4) if q else 0.0}
+
+
+# ===== Parámetros alternativos (modo sombra, ver app/shadow.py) =====
+@dataclass(frozen=True)
+class RetrievalParams:
+    fusion: str = "rrf"               # rrf | weighted (suma ponderada de scores min-max)
+    rrf_k: int = 60
+    alpha: float = 0.6                # peso del denso con fusion="weighted"
+    dense_k: Optional[int] = None     # None = el del catálogo (DENSE_K / DENSE_K_MULTI)
+    sparse_k: Optional[int] = None
+    dense_index: str = "auto"         # auto | flat (ignora la proyección PCA)
+    cascade: Optional[bool] = None    # None = CASCADE_ENABLED
+
+
+DEFAULT_PARAMS = RetrievalParams()
+
+
 # ===== API principal =====
-def buscar_similares(query_vec: np.ndarray, top_k: int = 5, query_text: Optional[str] = None) -> List[Dict]:
+def buscar_similares(
+    query_vec: np.ndarray,
+    top_k: int = 5,
+    query_text: Optional[str] = None,
+    analysis: Optional[QueryAnalysis] = None,
+    catalog: Optional[CatalogBundle] = None,
+    params: Optional[RetrievalParams] = None,
+    count_stats: bool = True,
+    tau_high: Optional[float] = None,
+) -> CandidateSet:
     """
     Recuperación híbrida: denso (FAISS) + léxico (TF-IDF).
     - query_vec: vector normalizado (norma 1, float32)
     - query_text: texto crudo de la consulta (para TF-IDF)
+    - analysis: análisis precalculado de la consulta (si no se pasa, se obtiene de la caché)
+    - catalog: catálogo a consultar (multi-tenant); por defecto, el de models/
+    Si el denso es contundente (CASCADE_MIN_SCORE / CASCADE_MIN_MARGIN) se saltean
+    léxico y fusión: score_lex = 0 y score_fused = score_dense. `tau_high` es el del
+    selector que se va a usar: el top-1 tiene que superar también ese umbral.
+    Retorna un CandidateSet (posiciones + scores sobre catalog.faqs, sin copiar textos);
+    cada candidato se lee como dict: faq_id, pregunta_faq, respuesta, score, score_dense,
+    score_lex, score_fused.
+    `params` cambia fusión/K/índice/cascada (modo sombra). `count_stats=False` no suma
+    a los contadores de /metrics (modo sombra, warm-up).
     """
+    catalog = catalog or default_catalog
+    faqs = catalog.faqs
+    p = params or DEFAULT_PARAMS
     # 1) denso (pedimos MÁS que top_k para ampliar el recall en la fusión)
-    dense_k = max(top_k, 50)  # <-- AUMENTADO (antes 10)
-    dense = _dense_topk(query_vec, k=dense_k)  # [(idx, cos_denso)]
+    dense_k = max(top_k, p.dense_k or catalog.dense_k)  # 50 (20 si el índice es multi-vector)
+    dense = _dense_topk(query_vec, k=dense_k, catalog=catalog, flat=p.dense_index == "flat")  # [(idx, cos_denso)]
 
     # Si no hay texto o no se pudo construir el índice léxico, mantenemos solo denso
-    if not query_text or not query_text.strip() or not _HAS_SK or _tfidf_vectorizer is None:
-        resultados = []
-        for idx, sc in dense[:top_k]:
-            faq = faqs[idx]
-            resultados.append({
-                "faq_id": faq["faq_id"],
-                "pregunta_faq": faq["pregunta_faq"],
-                "respuesta": faq["respuesta"],
-                "score": float(sc),
-                "score_dense": float(sc),
-                "score_lex": 0.0,
-                "score_fused": float(sc),  # para mantener estructura de debug
-            })
-        return resultados
+    if not query_text or not query_text.strip() or not catalog.has_sparse:
+        top = dense[:top_k]
+        sc = [s for _, s in top]
+        # score_fused = coseno denso, para mantener estructura de debug
+        return CandidateSet(faqs, [i for i, _ in top], sc, score_fused=sc)
+
+    if analysis is None:
+        analysis = analyze_query(query_text)
+
+    # Cascada: denso contundente y sin reglas que puedan reordenar → sin léxico ni fusión
+    cascade = CASCADE_ENABLED if p.cascade is None else p.cascade
+    decisive = cascade and not analysis.hints and _dense_is_decisive(dense, tau_high)
+    if count_stats:
+        with _stats_lock:
+            _cascade_stats["queries"] += 1
+            _cascade_stats["dense_only"] += decisive
+    if decisive:
+        top = dense[:top_k]
+        sc = [s for _, s in top]
+        return CandidateSet(faqs, [i for i, _ in top], sc, score_fused=sc)
 
     # 2) léxico (mismo K ampliado)
-    q_lower = (query_text or "").lower()
-    laboral_hint = any(k in q_lower for k in [
-    "salida", "salidas", "laboral", "trabajo", "trabajar",
-    "áreas", "ambitos", "ámbitos", "egresad", "oportunidades",
-    "campos", "campo laboral", "puestos", "empleo", "empleabilidad",
-    "recursos humanos", "rrhh"])
+    laboral_hint = analysis.laboral_hint
 
     expanded_text = query_text
     if laboral_hint:
@@ -215,58 +556,27 @@ def buscar_similares(query_vec: np.ndarray, top_k: int = 5, query_text: Optional
             "competencias perfil egreso"
         )
 
-    sparse_k = max(top_k, 50)  # <-- AUMENTADO (antes 10)
-    sparse = _sparse_topk(expanded_text, k=sparse_k)  # [(idx, cos_lex)]
+    sparse_k = max(top_k, p.sparse_k or catalog.sparse_k)
+    sparse = _sparse_topk(expanded_text, k=sparse_k, catalog=catalog)  # [(idx, cos_lex)]
 
-    # 3) fusión (RRF + penalización contextual si aplica)
-    fused = _rrf(dense, sparse, k=60)
+    # 3) fusión (RRF + reglas declarativas de re-ranking si aplican)
+    if p.fusion == "weighted":
+        fused = _fuse_scores(dense, sparse, alpha=p.alpha)
+    else:
+        fused = _rrf(dense, sparse, k=p.rrf_k)
 
-    if laboral_hint:
-        adjusted = []
-        for idx, sc in fused:
-            title = faqs[idx]["pregunta_faq"].lower()
-            text  = (faqs[idx]["pregunta_faq"] + " " + faqs[idx]["respuesta"]).lower()
-
-            if ("modalidad" in title) or ("cursar" in title):
-                sc -= 0.30
-            if ("dura" in title) or ("duración" in title):
-                sc -= 0.20
-            if ("título" in title) or ("otorga" in title):
-                sc -= 0.15
-            if ("laboratorio" in text) or ("informática" in text):
-                sc -= 0.25
-
-            if ("ámbitos" in title) or ("trabajar" in title) or ("salida laboral" in title):
-                sc += 0.15
-
-            if ("práctica" in text) or ("practica" in text) or ("profesionalizante" in text):
-                sc -= 0.20
-
-            adjusted.append((idx, sc))
-        fused = sorted(adjusted, key=lambda x: x[1], reverse=True)
+    fused = catalog.rules.apply(fused, analysis.hints)
 
     # 4) armar salida (orden híbrido) calculando siempre score_dense real
-    resultados = []
+    top = fused[:top_k]
     qv = query_vec[0]  # (d,) float32 normalizado
-    for idx, fused_sc in fused[:top_k]:
-        faq = faqs[idx]
-        d_sc_list = [s for i, s in dense if i == idx]
-        if d_sc_list:
-            d_sc = float(d_sc_list[0])
-        elif _XB is not None:
-            d_sc = float(np.dot(qv, _XB[idx]))  # coseno real
-        else:
-            d_sc = 0.0
-
-        s_sc = next((s for i, s in sparse if i == idx), 0.0)
-
-        resultados.append({
-            "faq_id": faq["faq_id"],
-            "pregunta_faq": faq["pregunta_faq"],
-            "respuesta": faq["respuesta"],
-            "score": float(d_sc),          # el selector usa este (coseno denso)
-            "score_dense": float(d_sc),
-            "score_lex": float(s_sc),
-            "score_fused": float(fused_sc)
-        })
-    return resultados
\ No newline at end of file
+    dense_by_id = dict(dense)
+    sparse_by_id = dict(sparse)
+    rows = [idx for idx, _ in top]
+    d_sc = [
+        dense_by_id[idx] if idx in dense_by_id else catalog.dense_score(qv, idx)  # coseno real
+        for idx in rows
+    ]
+    s_sc = [sparse_by_id.get(idx, 0.0) for idx in rows]
+    # `score` (= score_dense) es el que usa el selector
+    return CandidateSet(faqs, rows, d_sc, s_sc, [sc for _, sc in top])
@@ -0,0 +1,209 @@
+# app/shadow.py
+"""
+Modo sombra: configuraciones alternativas de recuperación/selector sobre tráfico real.
+
+Una fracción SHADOW_SAMPLE_RATE de los requests de /chat y del bot se encola,
+DESPUÉS de armar la respuesta, para un worker de fondo. Por cada variante de
+SHADOW_CONFIG el worker corre:
+
+    base: buscar_similares + seleccionar_respuesta con la config de serving
+    alt:  buscar_similares(params=...) + seleccionar_respuesta con el selector alternativo
+
+ambas sin LLM, sin re-ranker, sin escribir en el log de chats ni sumar a los
+contadores de /metrics, y deja una línea en SHADOW_LOG con top-1 de cada una,
+solapamiento del top-k, decisión del selector, modo servido en vivo y latencias
+por etapa (el embedding sale de la caché del retriever: el request real ya lo
+calculó). Resumen con
+`python -m scripts.shadow_report`.
+
+Nunca agrega latencia a la respuesta: encolar es put_nowait sobre una cola
+acotada (SHADOW_QUEUE_MAX) y si está llena el pedido se descarta y se cuenta.
+El worker es un único hilo con prioridad de SO baja.
+
+SHADOW_CONFIG (JSON): lista de variantes
+    [{"name": "rrf30", "retrieval": {"rrf_k": 30}, "selector": {"tau_high": 0.75}}]
+`retrieval` son campos de app.retriever.RetrievalParams y `selector` pisa los de
+la config de serving. Solo en modo local (sin RETRIEVAL_SOCKET).
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+from dataclasses import fields, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.warmup import lower_thread_priority
+
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", 0))   # 0 = apagado
+SHADOW_CONFIG = os.getenv("SHADOW_CONFIG", "data/shadow.json")
+SHADOW_QUEUE_MAX = int(os.getenv("SHADOW_QUEUE_MAX", 256))
+SHADOW_LOG = Path(os.getenv("SHADOW_LOG", "logs/shadow_logs.jsonl"))
+SHADOW_TOP_K = 5
+
+_queue: "queue.Queue" = queue.Queue(maxsize=max(1, SHADOW_QUEUE_MAX))
+_stats = {"sampled": 0, "enqueued": 0, "dropped": 0, "processed": 0, "errors": 0}
+_stats_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+_variants: Optional[List[Dict[str, Any]]] = None
+
+
+def load_variants(path: str = SHADOW_CONFIG) -> List[Dict[str, Any]]:
+    """Variantes de SHADOW_CONFIG ya validadas ({name, params, selector})."""
+    from app.response_selector import SelectorConfig
+    from app.retriever import RetrievalParams
+
+    p = Path(path)
+    if not p.exists():
+        return []
+    data = json.loads(p.read_text(encoding="utf-8"))
+    if isinstance(data, dict):
+        data = [data]
+    known = {f.name for f in fields(RetrievalParams)}
+    known_sel = {f.name for f in fields(SelectorConfig)}
+    out = []
+    for i, v in enumerate(data):
+        retrieval = v.get("retrieval") or {}
+        unknown = (set(retrieval) - known) | (set(v.get("selector") or {}) - known_sel)
+        if unknown:
+            raise ValueError(f"{path}: variante {i}: parámetros desconocidos {sorted(unknown)}")
+        out.append({
+            "name": v.get("name") or f"v{i}",
+            "params": RetrievalParams(**retrieval),
+            "selector": v.get("selector") or {},
+        })
+    return out
+
+
+def _enabled() -> bool:
+    global _variants
+    if SHADOW_SAMPLE_RATE <= 0:
+        return False
+    if _variants is None:
+        from app.pipeline import retrieval_client
+        if retrieval_client is not None:
+            print("[SHADOW] Con RETRIEVAL_SOCKET el modo sombra no corre (no hay índice local).")
+            _variants = []
+        else:
+            try:
+                _variants = load_variants()
+            except Exception as e:
+                print(f"[SHADOW] No se pudo leer {SHADOW_CONFIG}: {e}. Modo sombra apagado.")
+                _variants = []
+            if _variants:
+                print(f"[SHADOW] {len(_variants)} variante(s), muestreo {SHADOW_SAMPLE_RATE:.1%}")
+    return bool(_variants)
+
+
+def maybe_enqueue(query: str, tenant: Optional[str], sel: Dict[str, Any], cfg=None) -> bool:
+    """Muestrea el request y lo encola para el worker. Nunca bloquea."""
+    if SHADOW_SAMPLE_RATE <= 0 or random.random() >= SHADOW_SAMPLE_RATE or not _enabled():
+        return False
+    item = (query, tenant, sel.get("mode"), (sel.get("meta") or {}).get("decision"), cfg, time.time())
+    with _stats_lock:
+        _stats["sampled"] += 1
+    _ensure_worker()
+    try:
+        _queue.put_nowait(item)
+    except queue.Full:
+        with _stats_lock:
+            _stats["dropped"] += 1
+        return False
+    with _stats_lock:
+        _stats["enqueued"] += 1
+    return True
+
+
+def _ensure_worker() -> None:
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _stats_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="shadow", daemon=True)
+            _worker.start()
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 3)
+
+
+def _run_one(query: str, catalog, qvec, params, cfg) -> Dict[str, Any]:
+    from app.response_selector import seleccionar_respuesta
+    from app.retriever import buscar_similares
+
+    t0 = time.perf_counter()
+    cands = buscar_similares(qvec, top_k=SHADOW_TOP_K, query_text=query, catalog=catalog, params=params,
+                             count_stats=False, tau_high=cfg.tau_high)
+    retrieve_ms = _ms(t0)
+    t0 = time.perf_counter()
+    sel = seleccionar_respuesta(query, cands, cfg=cfg, enable_generation=False, log=False)
+    return {
+        "top": cands.faq_ids(),
+        "top1_score": round(float(cands[0]["score"]), 4) if len(cands) else None,
+        "decision": sel["meta"].get("decision"),
+        "retrieve_ms": retrieve_ms,
+        "select_ms": _ms(t0),
+    }
+
+
+def process(item) -> List[Dict[str, Any]]:
+    """Corre base y variantes para un request muestreado. Retorna las líneas del log."""
+    from app.catalogs import get_catalog
+    from app.response_selector import load_selector_config
+    from app.retriever import encode_query
+
+    query, tenant, live_mode, live_decision, cfg, ts = item
+    cfg = cfg or load_selector_config()
+    catalog = get_catalog(tenant)
+    t0 = time.perf_counter()
+    qvec = encode_query(query)  # caché del retriever: lo calculó el request real
+    encode_ms = _ms(t0)
+    base = _run_one(query, catalog, qvec, None, cfg)
+    out = []
+    for v in _variants or []:
+        alt = _run_one(query, catalog, qvec, v["params"], replace(cfg, **v["selector"]))
+        out.append({
+            "ts": datetime.utcfromtimestamp(ts).isoformat() + "Z",
+            "variant": v["name"],
+            "query": query,
+            "tenant": tenant,
+            "live_mode": live_mode,
+            "live_decision": live_decision,
+            "encode_ms": encode_ms,
+            "base": base,
+            "alt": alt,
+            "top1_agree": base["top"][:1] == alt["top"][:1],
+            "decision_changed": base["decision"] != alt["decision"],
+            "lag_ms": round((time.time() - ts) * 1000.0, 1),
+        })
+    return out
+
+
+def _run() -> None:
+    lower_thread_priority()
+    while True:
+        item = _queue.get()
+        try:
+            rows = process(item)
+            SHADOW_LOG.parent.mkdir(parents=True, exist_ok=True)
+            with SHADOW_LOG.open("a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            with _stats_lock:
+                _stats["processed"] += 1
+        except Exception as e:
+            print(f"[SHADOW] Error con {item[0]!r}: {e}", flush=True)
+            with _stats_lock:
+                _stats["errors"] += 1
+
+
+def get_shadow_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out = dict(_stats)
+    out.update(sample_rate=SHADOW_SAMPLE_RATE, queue_depth=_queue.qsize(), queue_max=_queue.maxsize,
+               variants=[v["name"] for v in _variants or []])
+    return out
@@ -0,0 +1,79 @@
+# app/singleflight.py
+"""
+Single-flight: deduplicación de requests idénticos concurrentes.
+
+Cuando llegan varias consultas iguales al mismo tiempo (ej. un link al bot
+compartido en un grupo), la primera ("líder") ejecuta el pipeline y las demás
+("seguidoras") esperan su resultado en lugar de repetir encode, retrieval y
+la llamada al LLM.
+
+Cada seguidora espera como máximo `timeout` segundos: si el líder se traba
+(ej. un LLM colgado), la seguidora corre su propio `on_timeout` y sigue.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Any],
+        timeout: Optional[float] = None,
+        on_timeout: Optional[Callable[[], Any]] = None,
+    ):
+        """
+        Ejecuta `fn` una sola vez por `key` entre llamadas concurrentes.
+        Retorna (resultado, compartido) donde `compartido` indica si vino de otro request.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["leaders"] += 1
+            else:
+                call.followers += 1
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self._stats["errors"] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+            return call.result, False
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            return (on_timeout or fn)(), False
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
@@ -0,0 +1,198 @@
+# app/suggest.py
+"""
+Autocompletado de preguntas de FAQ (GET /suggest) sin encoder ni FAISS.
+
+Por catálogo se arma, a partir de faqs.pkl:
+
+- preguntas normalizadas ordenadas → lo que ya es prefijo de una pregunta
+  (el caso típico: escribir la pregunta desde el principio) sale con bisect;
+- vocabulario ordenado de tokens normalizados (sin tildes ni puntuación) →
+  el último token de la consulta (todavía a medio escribir) se resuelve como
+  prefijo con bisect;
+- índice invertido token → preguntas, con idf por token;
+- índice de trigramas de caracteres sobre el VOCABULARIO (no sobre las
+  preguntas) para tolerar errores de tipeo: un token sin coincidencia exacta
+  se reemplaza por las palabras del vocabulario con más trigramas en común.
+
+El ranking es puramente léxico: primero las preguntas que empiezan con lo
+escrito; después, suma de idf de los tokens encontrados, con peso según el tipo
+de coincidencia (exacta > prefijo > aproximada). Las palabras muy frecuentes
+("que", "como"...) solo puntúan si la consulta no tiene otras: son las que más
+cuestan y casi no discriminan. Preguntas repetidas se sugieren una vez.
+
+El índice se reconstruye solo cuando cambia faqs.pkl (p. ej. tras
+scripts/build_index), igual que el índice principal.
+"""
+import bisect
+import heapq
+import math
+import os
+import pickle
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from app.query_analysis import STOP_ES, normalize_text
+
+SUGGEST_MAX = 10                # tope de sugerencias por llamada
+SUGGEST_MIN_CHARS = 2           # consultas más cortas no sugieren nada
+SUGGEST_COMMON_DF = 0.2         # fracción de preguntas a partir de la cual una palabra es "común"
+SUGGEST_PREFIX_WORDS = 64       # palabras del vocabulario a expandir por prefijo
+SUGGEST_FUZZY_WORDS = 3         # reemplazos por token con error de tipeo
+SUGGEST_FUZZY_MIN = 0.45        # similitud de trigramas mínima para aceptar un reemplazo
+SUGGEST_RELOAD_CHECK_S = 5.0    # cada cuánto mirar si cambió faqs.pkl
+
+# Peso de cada tipo de coincidencia del token
+_W_EXACT, _W_PREFIX = 1.0, 0.8
+
+
+def _trigrams(word: str) -> frozenset:
+    w = f"  {word} "
+    return frozenset(w[i:i + 3] for i in range(len(w) - 2))
+
+
+class Suggester:
+    def __init__(self, faqs_list: List[Dict]):
+        questions: List[str] = []
+        faq_ids: List[str] = []
+        norms: List[str] = []
+        seen = set()
+        for f in faqs_list:
+            q = (f.get("pregunta_faq") or "").strip()
+            norm = normalize_text(q)
+            if not norm or norm in seen:
+                continue
+            seen.add(norm)
+            questions.append(q)
+            faq_ids.append(str(f.get("faq_id", "")))
+            norms.append(norm)
+        self.questions, self.faq_ids, self.norms = questions, faq_ids, norms
+
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for qid, norm in enumerate(norms):
+            for tok in dict.fromkeys(norm.split()):
+                postings[tok].append(qid)
+        self.vocab: List[str] = sorted(postings)
+        self.postings: List[Tuple[int, ...]] = [tuple(postings[w]) for w in self.vocab]
+        n = max(1, len(norms))
+        self.idf: List[float] = [math.log(1 + n / len(p)) for p in self.postings]
+        self.word_id: Dict[str, int] = {w: i for i, w in enumerate(self.vocab)}
+
+        tri: Dict[str, List[int]] = defaultdict(list)
+        self._word_tri: List[frozenset] = []
+        for wid, w in enumerate(self.vocab):
+            grams = _trigrams(w)
+            self._word_tri.append(grams)
+            for g in grams:
+                tri[g].append(wid)
+        self.trigrams: Dict[str, Tuple[int, ...]] = {g: tuple(ws) for g, ws in tri.items()}
+        # longitud en tokens: desempate a favor de preguntas cortas
+        self._lengths = [len(norm.split()) for norm in norms]
+        self._common = [len(p) > SUGGEST_COMMON_DF * n for p in self.postings]
+        self._sorted_norms = sorted((norm, qid) for qid, norm in enumerate(norms))
+
+    # ----- matching por token -----
+    def _prefix_words(self, prefix: str) -> List[int]:
+        lo = bisect.bisect_left(self.vocab, prefix)
+        hi = bisect.bisect_left(self.vocab, prefix + "\uffff", lo)
+        return list(range(lo, min(hi, lo + SUGGEST_PREFIX_WORDS)))
+
+    def _fuzzy_words(self, token: str) -> List[Tuple[int, float]]:
+        grams = _trigrams(token)
+        shared: Dict[int, int] = defaultdict(int)
+        for g in grams:
+            for wid in self.trigrams.get(g, ()):
+                shared[wid] += 1
+        scored = [
+            (wid, c / (len(grams) + len(self._word_tri[wid]) - c))
+            for wid, c in shared.items()
+        ]
+        scored = [x for x in scored if x[1] >= SUGGEST_FUZZY_MIN]
+        return heapq.nlargest(SUGGEST_FUZZY_WORDS, scored, key=lambda x: x[1])
+
+    def _token_matches(self, token: str, is_prefix: bool) -> List[Tuple[int, float]]:
+        """[(word_id, peso)] para un token de la consulta."""
+        wid = self.word_id.get(token)
+        if is_prefix:
+            words = self._prefix_words(token)
+            if words:
+                return [(w, _W_EXACT if w == wid else _W_PREFIX) for w in words]
+        elif wid is not None:
+            return [(wid, _W_EXACT)]
+        if len(token) < 3:
+            return []
+        return [(w, sim * _W_PREFIX) for w, sim in self._fuzzy_words(token)]
+
+    def _startswith(self, norm: str, limit: int) -> List[int]:
+        """Preguntas que empiezan con `norm` (las más cortas primero)."""
+        arr = self._sorted_norms
+        lo = bisect.bisect_left(arr, (norm,))
+        hi = bisect.bisect_left(arr, (norm + "\uffff",), lo)
+        hits = [qid for _, qid in arr[lo:min(hi, lo + 4 * SUGGEST_MAX)]]
+        return sorted(hits, key=self._lengths.__getitem__)[:limit]
+
+    # ----- API -----
+    def suggest(self, query: str, limit: int = 5) -> List[Dict[str, str]]:
+        norm = normalize_text(query)
+        if len(norm) < SUGGEST_MIN_CHARS:
+            return []
+        limit = max(1, min(limit, SUGGEST_MAX))
+        top = self._startswith(norm, limit)
+        if len(top) < limit:
+            top += self._score_tokens(norm, query, limit - len(top), exclude=set(top))
+        return [{"faq_id": self.faq_ids[q], "pregunta": self.questions[q]} for q in top]
+
+    def _score_tokens(self, norm: str, query: str, limit: int, exclude) -> List[int]:
+        tokens = norm.split()
+        last_is_prefix = not query[-1:].isspace()
+        matches = []
+        for pos, tok in enumerate(tokens):
+            is_prefix = last_is_prefix and pos == len(tokens) - 1
+            if tok in STOP_ES and not is_prefix and len(tokens) > 1:
+                continue
+            matches.append(self._token_matches(tok, is_prefix))
+        # Palabras comunes fuera, salvo que no quede otra cosa
+        rare = [[(w, x) for w, x in m if not self._common[w]] for m in matches]
+        if any(rare):
+            matches = rare
+
+        scores: Dict[int, float] = defaultdict(float)
+        for m in matches:
+            best: Dict[int, float] = {}
+            for wid, w in m:
+                weight = w * self.idf[wid]
+                for qid in self.postings[wid]:
+                    if weight > best.get(qid, 0.0):
+                        best[qid] = weight
+            for qid, weight in best.items():
+                scores[qid] += weight
+        for qid in exclude:
+            scores.pop(qid, None)
+        return heapq.nlargest(limit, scores, key=lambda q: (scores[q], -self._lengths[q]))
+
+
+# ----- caché por archivo de FAQs (se reconstruye si cambia) -----
+_cache: Dict[str, Tuple[float, float, Suggester]] = {}   # path -> (mtime, último chequeo, suggester)
+_cache_lock = threading.Lock()
+
+
+def get_suggester(faqs_path: str) -> Suggester:
+    now = time.monotonic()
+    entry = _cache.get(faqs_path)
+    if entry is not None and now - entry[1] < SUGGEST_RELOAD_CHECK_S:
+        return entry[2]
+    with _cache_lock:
+        entry = _cache.get(faqs_path)
+        mtime = os.path.getmtime(faqs_path)
+        if entry is not None and entry[0] == mtime:
+            _cache[faqs_path] = (mtime, now, entry[2])
+            return entry[2]
+        with open(faqs_path, "rb") as f:
+            faqs_list = pickle.load(f)
+        t0 = time.perf_counter()
+        sug = Suggester(faqs_list)
+        print(f"[SUGGEST] Índice de {faqs_path}: {len(sug.questions)} preguntas, "
+              f"{len(sug.vocab)} tokens en {(time.perf_counter() - t0) * 1000:.0f} ms")
+        _cache[faqs_path] = (mtime, now, sug)
+        return sug
@@ -2,23 +2,41 @@
 import pandas as pd
 import csv
 
-def load_faqs(path):
-    faqs = []
+def _iter_faqs(path):
+    """FAQs válidas del CSV, una por vez (faq_id = n° de fila de la que salen)."""
     with open(path, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for i, row in enumerate(reader):
-            pregunta = row.get('pregunta_faq', '').strip()
-            respuesta = row.get('respuesta', '').strip()
+            pregunta = (row.get('pregunta_faq') or '').strip()
+            respuesta = (row.get('respuesta') or '').strip()
 
             if pregunta and respuesta and len(pregunta) > 5:
-                faqs.append({
+                yield {
                     'faq_id': str(i),
                     'pregunta_faq': pregunta,
                     'respuesta': respuesta
-                })
+                }
             else:
                 print(f"[LÍNEA OMITIDA] {i}: Pregunta o respuesta vacía")
-    
+
+def load_faqs(path):
+    faqs = list(_iter_faqs(path))
     print(f"Se cargaron {len(faqs)} FAQs.")
     return faqs
 
+
+
+def iter_faq_chunks(path, chunk_rows=1000):
+    """
+    Lee el CSV en streaming y devuelve bloques de hasta `chunk_rows` FAQs válidas.
+    Comparte filtro y faq_id (n° de fila) con `load_faqs`, sin cargar el archivo
+    completo en memoria.
+    """
+    chunk = []
+    for faq in _iter_faqs(path):
+        chunk.append(faq)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,189 @@
+# app/warmup.py
+"""
+Warm-up de cachés con las consultas más frecuentes del historial.
+
+Tras un deploy o reinicio las cachés arrancan vacías aunque unas pocas
+preguntas concentren el tráfico. El warm-up lee la cola de logs/chat_logs.json,
+agrupa por consulta normalizada (y tenant), y corre el pipeline para las
+WARMUP_TOP_N más frecuentes en un hilo de fondo. Eso deja cargados:
+
+- catálogos de los tenants que aparecen en el historial;
+- análisis de la consulta (lru de app/query_analysis.py);
+- embeddings (EMBED_CACHE_SIZE en app/retriever.py);
+- scores del cross-encoder (caché del re-ranker, si está activo);
+- reescrituras del LLM (GEN_CACHE_SIZE en app/generator.py) y el modelo del
+  backend cargado.
+
+No demora el arranque ni compite con el tráfico real:
+
+- corre en un hilo daemon con prioridad de SO baja (nice) y se detiene al
+  agotar WARMUP_BUDGET_S;
+- ciclo de trabajo: tras cada consulta duerme lo necesario para que el trabajo
+  local (sin contar la espera al LLM) no pase de WARMUP_CPU_FRACTION;
+- las llamadas al LLM son de fondo (app/gen_scheduler.py): no hacen cola y solo
+  entran si quedan lugares libres para los requests reales;
+- va directo a `responder` (sin single-flight, para que un request real nunca
+  quede esperando a un líder de warm-up) y no escribe en el log de chats.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.gen_scheduler import background_calls
+from app.query_analysis import analyze_query
+from app.response_selector import LOG_PATH
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 200))
+WARMUP_BUDGET_S = float(os.getenv("WARMUP_BUDGET_S", 120))
+WARMUP_CPU_FRACTION = float(os.getenv("WARMUP_CPU_FRACTION", 0.25))
+WARMUP_GENERATION = os.getenv("WARMUP_GENERATION", "1") != "0"
+# Solo se lee la cola del log (el tráfico reciente es el que importa)
+WARMUP_LOG_TAIL_MB = float(os.getenv("WARMUP_LOG_TAIL_MB", 32))
+# Demora antes de arrancar, para no pisar la carga de modelos/índices del proceso
+WARMUP_START_DELAY_S = float(os.getenv("WARMUP_START_DELAY_S", 2))
+
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_stats: Dict[str, Any] = {
+    "state": "idle",       # idle | running | done
+    "runs": 0,
+    "planned": 0,
+    "warmed": 0,
+    "errors": 0,
+    "llm_skipped": 0,      # reescrituras no hechas por falta de lugar libre en el LLM
+    "stopped_by": None,    # None | budget
+    "elapsed_s": 0.0,
+}
+
+
+def top_queries(path=LOG_PATH, n: int = WARMUP_TOP_N,
+                tail_mb: float = WARMUP_LOG_TAIL_MB) -> List[Tuple[Optional[str], str, int]]:
+    """
+    [(tenant, consulta, frecuencia)] de las `n` consultas normalizadas más frecuentes.
+    Como texto se usa la forma cruda más común de cada consulta normalizada.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return []
+    counts: Counter = Counter()
+    raw_forms: Dict[Tuple[Optional[str], str], Counter] = defaultdict(Counter)
+    with open(path, "rb") as f:
+        start = max(0, size - int(tail_mb * 1024 * 1024))
+        f.seek(start)
+        if start:
+            f.readline()  # línea cortada
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if (rec.get("meta") or {}).get("decision") == "clarification":
+                continue  # "2", "la primera": respuestas a una aclaración, no consultas
+            query = (rec.get("query") or "").strip()
+            norm = analyze_query(query).normalized if query else ""
+            if len(norm) < 3:
+                continue
+            key = ((rec.get("meta") or {}).get("tenant"), norm)
+            counts[key] += 1
+            raw_forms[key][query] += 1
+    return [(tenant, raw_forms[(tenant, norm)].most_common(1)[0][0], c)
+            for (tenant, norm), c in counts.most_common(n)]
+
+
+def lower_thread_priority() -> None:
+    # En Linux setpriority sobre el id nativo afecta solo a este hilo
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+def run_warmup(top_n: int = WARMUP_TOP_N, budget_s: float = WARMUP_BUDGET_S,
+               generation: bool = WARMUP_GENERATION, cpu_fraction: float = WARMUP_CPU_FRACTION) -> Dict[str, Any]:
+    """Corre el warm-up en el hilo actual (bloquea hasta terminar o agotar el presupuesto)."""
+    from app.catalogs import UnknownTenantError
+    from app.pipeline import responder
+    from app.response_selector import load_selector_config
+
+    t0 = time.monotonic()
+    plan = top_queries(n=top_n)
+    with _lock:
+        _stats.update(state="running", planned=len(plan), warmed=0, errors=0, llm_skipped=0,
+                      stopped_by=None, elapsed_s=0.0)
+        _stats["runs"] += 1
+    print(f"[WARMUP] {len(plan)} consultas frecuentes, presupuesto {budget_s:.0f} s", flush=True)
+
+    cfg = load_selector_config()
+    fraction = min(1.0, max(0.01, cpu_fraction))
+    for tenant, query, _ in plan:
+        if time.monotonic() - t0 >= budget_s:
+            with _lock:
+                _stats["stopped_by"] = "budget"
+            break
+        step0 = time.monotonic()
+        llm_ms = 0.0
+        try:
+            with background_calls():
+                sel = responder(query, enable_generation=generation, cfg=cfg, tenant=tenant, log=False)
+            gen = sel["meta"].get("generator") or {}
+            llm_ms = gen.get("elapsed_ms", 0.0) if not gen.get("cached") else 0.0
+            with _lock:
+                _stats["warmed"] += 1
+                _stats["llm_skipped"] += gen.get("outcome") == "shed_background"
+        except UnknownTenantError:
+            with _lock:
+                _stats["errors"] += 1
+        except Exception as e:
+            print(f"[WARMUP] Error con {query!r}: {e}", flush=True)
+            with _lock:
+                _stats["errors"] += 1
+        # Ciclo de trabajo: la espera al LLM no cuenta como CPU local
+        local_s = max(0.0, time.monotonic() - step0 - llm_ms / 1000.0)
+        time.sleep(min(local_s * (1.0 - fraction) / fraction, max(0.0, budget_s - (time.monotonic() - t0))))
+
+    with _lock:
+        _stats.update(state="done", elapsed_s=round(time.monotonic() - t0, 2))
+        out = dict(_stats)
+    print(f"[WARMUP] {out['warmed']}/{out['planned']} consultas en {out['elapsed_s']} s "
+          f"(errores {out['errors']}, LLM salteado {out['llm_skipped']}"
+          f"{', corte por presupuesto' if out['stopped_by'] else ''})", flush=True)
+    return out
+
+
+def start_warmup(top_n: Optional[int] = None, budget_s: Optional[float] = None,
+                 generation: Optional[bool] = None, delay_s: float = 0.0) -> bool:
+    """Lanza el warm-up en un hilo de fondo. False si ya hay uno corriendo."""
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        _stats["state"] = "running"
+
+        def _target():
+            lower_thread_priority()
+            if delay_s:
+                time.sleep(delay_s)
+            try:
+                run_warmup(
+                    WARMUP_TOP_N if top_n is None else top_n,
+                    WARMUP_BUDGET_S if budget_s is None else budget_s,
+                    WARMUP_GENERATION if generation is None else generation,
+                )
+            except Exception as e:
+                print(f"[WARMUP] Abortado: {e}", flush=True)
+                with _lock:
+                    _stats["state"] = "done"
+
+        _thread = threading.Thread(target=_target, name="warmup", daemon=True)
+        _thread.start()
+    return True
+
+
+def get_warmup_stats() -> Dict[str, Any]:
+    with _lock:
+        return dict(_stats)
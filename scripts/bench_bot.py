@@ -0,0 +1,254 @@
+# scripts/bench_bot.py
+"""
+Benchmark del bot de Telegram contra una API de Telegram falsa (local).
+
+Levanta un servidor HTTP que imita los métodos del Bot API que usa el bot
+(getMe, deleteWebhook, getUpdates, sendMessage, sendChatAction), encola N
+mensajes de C chats distintos y mide mensajes/segundo y latencia por mensaje
+(desde que el bot recibe el update hasta que envía la respuesta).
+
+Por defecto el pipeline se reemplaza por una espera bloqueante de
+`--pipeline-ms` (simula encode + FAISS + LLM) para medir solo la capa del bot;
+con `--real` usa el pipeline de verdad (requiere índice y modelo).
+
+Uso:
+    python -m scripts.bench_bot
+    python -m scripts.bench_bot --messages 200 --chats 50 --pipeline-ms 150 --configs 1x1,8x4,32x8
+    python -m scripts.bench_bot --real --messages 50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import scripts.bot_telegram as bot
+
+TOKEN = "123456:BENCH"
+
+
+class FakeTelegram:
+    """Estado de la API falsa: cola de updates y respuestas enviadas por el bot."""
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.updates = []
+        self.served_at = {}   # chat_id -> [t de entrega de cada mensaje]
+        self.replies = {}     # chat_id -> [t de cada respuesta]
+        self.typing = 0
+        self.generation = 0
+        self._next_msg = 1
+
+    def reset(self):
+        with self.lock:
+            self.updates, self.served_at, self.replies, self.typing = [], {}, {}, 0
+            # un long polling colgado del bot anterior no debe llevarse los updates nuevos
+            self.generation += 1
+            self.lock.notify_all()
+
+    def push(self, chat_id: int, text: str, update_id: int):
+        with self.lock:
+            self.updates.append({
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": f"u{chat_id}"},
+                    "text": text,
+                },
+            })
+            self.lock.notify_all()
+
+    def get_updates(self, offset: int, timeout: float):
+        end = time.monotonic() + min(timeout, 1.0)
+        with self.lock:
+            gen = self.generation
+            while True:
+                if gen != self.generation:
+                    return []
+                self.updates = [u for u in self.updates if u["update_id"] >= offset]
+                if self.updates:
+                    batch = self.updates[:100]
+                    now = time.perf_counter()
+                    for u in batch:
+                        chat = u["message"]["chat"]["id"]
+                        self.served_at.setdefault(chat, []).append(now)
+                    # se entregan una sola vez: el bot confirma con offset en el próximo pedido
+                    self.updates = self.updates[len(batch):]
+                    return batch
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.lock.wait(remaining)
+
+    def send_message(self, chat_id: int, text: str):
+        with self.lock:
+            self.replies.setdefault(chat_id, []).append(time.perf_counter())
+            self._next_msg += 1
+            self.lock.notify_all()
+            return {
+                "message_id": self._next_msg,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "bench"},
+                "text": text,
+            }
+
+    def wait_replies(self, total: int, timeout: float) -> bool:
+        end = time.monotonic() + timeout
+        with self.lock:
+            while sum(len(v) for v in self.replies.values()) < total:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.lock.wait(remaining)
+            return True
+
+
+def _make_handler(api: FakeTelegram):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _params(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            ctype = self.headers.get("Content-Type", "")
+            if "json" in ctype:
+                return json.loads(raw or b"{}")
+            out = {}
+            for k, v in parse_qs(raw.decode("utf-8")).items():
+                try:
+                    out[k] = json.loads(v[0])
+                except ValueError:
+                    out[k] = v[0]
+            return out
+
+        def do_POST(self):
+            method = self.path.rsplit("/", 1)[-1]
+            p = self._params()
+            if method == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+            elif method == "getUpdates":
+                result = api.get_updates(int(p.get("offset") or 0), float(p.get("timeout") or 0))
+            elif method == "sendMessage":
+                result = api.send_message(int(p["chat_id"]), str(p.get("text", "")))
+            elif method == "sendChatAction":
+                with api.lock:
+                    api.typing += 1
+                result = True
+            else:  # deleteWebhook, close, etc.
+                result = True
+            body = json.dumps({"ok": True, "result": result}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # el bot cortó su long polling al apagarse
+
+    return Handler
+
+
+def _fake_pipeline(ms: float):
+    def responder(text, **kwargs):
+        time.sleep(ms / 1000.0)  # bloqueante, como encode/FAISS/HTTP al LLM
+        return {"mode": "extractive", "answer": f"respuesta a: {text}", "meta": {}}
+    return responder
+
+
+def _queries(n: int, real: bool):
+    if real:
+        from app.utils import load_faqs
+        faqs = load_faqs("data/faqs.csv")
+        return [faqs[i % len(faqs)]["pregunta_faq"] for i in range(n)]
+    return [f"consulta de prueba {i}" for i in range(n)]
+
+
+async def _run_config(api, base_url, queries, chats, concurrency, workers, timeout):
+    bot.BOT_CONCURRENT_UPDATES = concurrency
+    bot._pipeline_pool = bot.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bot-pipeline")
+    api.reset()
+
+    app = bot._build_app(TOKEN, None, base_url=base_url)
+    await app.initialize()
+    await app.start()
+    await app.updater.start_polling(poll_interval=0.0, timeout=1)
+    try:
+        t0 = time.perf_counter()
+        for i, q in enumerate(queries):
+            api.push(chat_id=1000 + i % chats, text=q, update_id=i + 1)
+        ok = await asyncio.get_running_loop().run_in_executor(None, api.wait_replies, len(queries), timeout)
+        elapsed = time.perf_counter() - t0
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        bot._pipeline_pool.shutdown(wait=False)
+
+    lat = []
+    with api.lock:
+        for chat, served in api.served_at.items():
+            # cada chat se responde en orden: i-ésima respuesta ↔ i-ésimo mensaje
+            lat += [(r - s) * 1000 for s, r in zip(served, api.replies.get(chat, []))]
+        done = sum(len(v) for v in api.replies.values())
+        typing = api.typing
+    lat.sort()
+    return {
+        "ok": ok,
+        "done": done,
+        "elapsed": elapsed,
+        "msg_s": done / max(elapsed, 1e-9),
+        "p50": statistics.median(lat) if lat else float("nan"),
+        "p95": lat[int(0.95 * (len(lat) - 1))] if lat else float("nan"),
+        "typing": typing,
+    }
+
+
+async def _main_async(args):
+    api = FakeTelegram()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), _make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/bot"
+
+    if not args.real:
+        bot.responder_compartido = _fake_pipeline(args.pipeline_ms)
+    queries = _queries(args.messages, args.real)
+    pipeline = "real" if args.real else f"falso {args.pipeline_ms:.0f} ms"
+    print(f"{args.messages} mensajes, {args.chats} chats, pipeline {pipeline}")
+    print(f"{'updates x hilos':>16} {'msgs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'typing':>7}")
+
+    try:
+        for conf in args.configs.split(","):
+            concurrency, workers = (int(x) for x in conf.lower().split("x"))
+            r = await _run_config(api, base_url, queries, args.chats, concurrency, workers, args.timeout)
+            flag = "" if r["ok"] else f"  (timeout: {r['done']}/{args.messages})"
+            print(f"{conf:>16} {r['msg_s']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['typing']:>7}{flag}")
+    finally:
+        server.shutdown()
+
+
+def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("telegram").setLevel(logging.WARNING)
+    ap = argparse.ArgumentParser(description="Mide mensajes/s del bot contra una API de Telegram falsa.")
+    ap.add_argument("--messages", type=int, default=100)
+    ap.add_argument("--chats", type=int, default=25, help="chats distintos (cada chat se responde en orden)")
+    ap.add_argument("--pipeline-ms", type=float, default=200.0, help="latencia simulada del pipeline")
+    ap.add_argument("--real", action="store_true", help="usa el pipeline real en lugar del simulado")
+    ap.add_argument("--configs", default="1x1,8x4,32x8",
+                    help="lista de <updates concurrentes>x<hilos de pipeline>")
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--timeout", type=float, default=120.0, help="espera máxima por configuración (s)")
+    asyncio.run(_main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# scripts/bench_candidates.py
+"""
+Memoria asignada por request en el tramo post-encode del pipeline:
+
+    buscar_similares → rerank → seleccionar_respuesta (+ log) → borde de la respuesta
+
+Los vectores de consulta se codifican antes de medir, así el costo del encoder
+no tapa lo que cambia al representar los candidatos. Con tracemalloc se mide,
+etapa y por request, el pico de memoria asignada (recuperación por un lado;
+selector + log + materialización de la respuesta por otro), más el tiempo y
+los bytes de log por request.
+
+Usar GEN_BACKEND=mock para incluir el paso del contexto al generador sin red.
+
+Uso:
+    GEN_BACKEND=mock python -m scripts.bench_candidates --queries 300
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import app.response_selector as selector
+from app.reranker import fetch_k, rerank
+from app.retriever import buscar_similares, default_catalog, encode_queries
+from app.utils import load_faqs
+
+try:  # borde de la respuesta (materializar candidatos como dicts)
+    from app.candidates import to_jsonable
+except ImportError:  # árbol anterior: meta ya eran dicts
+    def to_jsonable(obj, texts=True):
+        return obj
+
+
+def _queries(n: int, seed: int = 7):
+    """Consultas parecidas a las reales: subconjuntos desordenados de preguntas del CSV."""
+    rnd = random.Random(seed)
+    faqs = load_faqs("data/faqs.csv")
+    out = []
+    for i in range(n):
+        words = faqs[i % len(faqs)]["pregunta_faq"].split()
+        rnd.shuffle(words)
+        out.append(" ".join(words[:max(2, len(words) // 2)]))
+    return out
+
+
+def _retrieve(q, qvec, top_k, cfg):
+    cands = buscar_similares(qvec, top_k=fetch_k(top_k), query_text=q, catalog=default_catalog)
+    cands, _ = rerank(q, cands, top_k=top_k, namespace=default_catalog.name, selector_cfg=cfg)
+    return cands
+
+
+def _select(q, cands, cfg):
+    sel = selector.seleccionar_respuesta(q, cands, cfg=cfg, enable_generation=True)
+    return json.dumps(to_jsonable(sel), ensure_ascii=False)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Asignaciones por request del tramo recuperación → selector.")
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--top-k", type=int, default=5)
+    args = ap.parse_args()
+
+    queries = _queries(args.queries)
+    vecs = encode_queries(queries)
+    cfg = selector.load_selector_config()
+
+    log_path = Path(tempfile.mkdtemp()) / "chat_logs.json"
+    selector.LOG_PATH = log_path
+
+    # Calentamiento (caches de análisis, imports perezosos)
+    for i, q in enumerate(queries[:20]):
+        _select(q, _retrieve(q, vecs[i:i + 1], args.top_k, cfg), cfg)
+    log_path.unlink(missing_ok=True)
+
+    stats = {"recuperación": ([], []), "selector + respuesta": ([], [])}
+    tracemalloc.start()
+    for i, q in enumerate(queries):
+        for stage, fn in (("recuperación", lambda: _retrieve(q, vecs[i:i + 1], args.top_k, cfg)),
+                          ("selector + respuesta", lambda: _select(q, cands, cfg))):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            t0 = time.perf_counter()
+            out = fn()
+            stats[stage][1].append((time.perf_counter() - t0) * 1e6)
+            stats[stage][0].append(tracemalloc.get_traced_memory()[1] - before)
+            if stage == "recuperación":
+                cands = out
+    tracemalloc.stop()
+
+    log_bytes = os.path.getsize(log_path) if log_path.exists() else 0
+    n = len(queries)
+    print(f"{n} requests (post-encode, GEN_BACKEND={os.getenv('GEN_BACKEND', 'ollama')})")
+    for stage, (peaks, times) in stats.items():
+        print(f"  {stage:<22} pico mediana {statistics.median(peaks) / 1024:7.1f} KiB  "
+              f"p95 {sorted(peaks)[int(0.95 * (n - 1))] / 1024:7.1f} KiB  "
+              f"tiempo mediana {statistics.median(times):7.0f} µs")
+    print(f"  log: {log_bytes / n:.0f} bytes/request")
+
+
+if __name__ == "__main__":
+    main()
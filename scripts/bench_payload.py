@@ -0,0 +1,95 @@
+# scripts/bench_payload.py
+"""
+Tamaño y costo de serialización de la respuesta de /chat por nivel de verbosity.
+
+Corre el pipeline real sobre consultas armadas con preguntas del CSV (sin LLM)
+y, para cada respuesta y cada nivel (minimal / ids / full), mide:
+
+  - bytes del JSON y bytes con gzip / brotli (si el paquete está instalado)
+  - tiempo de serialización con el camino anterior (modelo Pydantic +
+    jsonable_encoder + json.dumps, como hace FastAPI con response_model) y con
+    el actual (shape_meta + FastJSONResponse.render)
+  - tiempo de compresión
+
+Uso:
+    python -m scripts.bench_payload --queries 200
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app.compression import BROTLI_QUALITY, GZIP_LEVEL, HAS_BROTLI, compress
+from app.main import ChatResponse, FastJSONResponse, shape_meta
+from app.pipeline import responder_compartido
+from app.response_selector import load_selector_config
+from app.utils import load_faqs
+
+LEVELS = ("minimal", "ids", "full")
+
+
+def _queries(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    faqs = load_faqs("data/faqs.csv")
+    out = []
+    for i in range(n):
+        words = faqs[i % len(faqs)]["pregunta_faq"].split()
+        rnd.shuffle(words)
+        out.append(" ".join(words[:max(2, len(words) // 2)]))
+    return out
+
+
+def _timeit(fn, reps: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1e6
+
+
+def _pydantic_path(sel, level):
+    meta = shape_meta(sel["meta"], level)
+    model = ChatResponse(mode=sel["mode"], answer=sel["answer"], meta=meta)
+    return json.dumps(jsonable_encoder(model), ensure_ascii=False).encode("utf-8")
+
+
+def _fast_path(sel, level):
+    meta = shape_meta(sel["meta"], level)
+    return FastJSONResponse(None).render({"mode": sel["mode"], "answer": sel["answer"], "meta": meta})
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tamaño/serialización de /chat por verbosity.")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--reps", type=int, default=20, help="repeticiones por medición de tiempo")
+    args = ap.parse_args()
+
+    cfg = load_selector_config()
+    sels = [responder_compartido(q, top_k=5, enable_generation=False, cfg=cfg) for q in _queries(args.queries)]
+
+    encodings = ["gzip"] + (["br"] if HAS_BROTLI else [])
+    print(f"{len(sels)} respuestas · gzip nivel {GZIP_LEVEL}"
+          + (f" · brotli q{BROTLI_QUALITY}" if HAS_BROTLI else " · brotli no instalado"))
+    print(f"{'verbosity':<9} {'bytes':>7} " + " ".join(f"{e + ' bytes':>10} {e + ' µs':>8}" for e in encodings)
+          + f" {'pydantic µs':>12} {'rápido µs':>10}")
+    for level in LEVELS:
+        raw, comp, comp_t, slow_t, fast_t = [], {e: [] for e in encodings}, {e: [] for e in encodings}, [], []
+        for sel in sels:
+            body = _fast_path(sel, level)
+            assert json.loads(body) == json.loads(_pydantic_path(sel, level))
+            raw.append(len(body))
+            for e in encodings:
+                comp[e].append(len(compress(body, e)))
+                comp_t[e].append(_timeit(lambda: compress(body, e), args.reps))
+            slow_t.append(_timeit(lambda: _pydantic_path(sel, level), args.reps))
+            fast_t.append(_timeit(lambda: _fast_path(sel, level), args.reps))
+        med = statistics.median
+        print(f"{level:<9} {med(raw):>7.0f} "
+              + " ".join(f"{med(comp[e]):>10.0f} {med(comp_t[e]):>8.1f}" for e in encodings)
+              + f" {med(slow_t):>12.1f} {med(fast_t):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# scripts/bench_pca.py
+"""
+Búsqueda densa en dos etapas (PCA + re-puntuación exacta) vs IndexFlatIP.
+
+El catálogo real es chico, así que se escala sintéticamente: cada vector del
+corpus es una mezcla de dos vectores reales del índice más ruido, normalizada;
+las consultas son vectores del corpus con ruido (paráfrasis). Para cada tamaño
+de catálogo y cada dimensión reducida se mide, consulta por consulta (como en
+serving):
+
+  - tiempo por consulta de la búsqueda exacta y de la de dos etapas
+  - recall@k del top-k de dos etapas contra el exacto (los scores que devuelve
+    son exactos: solo puede faltar algún candidato, nunca cambiar un score)
+
+Uso:
+    python -m scripts.bench_pca --sizes 10000,50000,200000 --dims 64,128 --k 50
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from app.pca import build_coarse_index, explained_ratio, fit_projection, two_stage_search
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _synthetic(base: np.ndarray, n: int, rng) -> np.ndarray:
+    i = rng.integers(0, len(base), n)
+    j = rng.integers(0, len(base), n)
+    noise = rng.standard_normal((n, base.shape[1])).astype(np.float32) / np.sqrt(base.shape[1])
+    return _normalize(0.7 * base[i] + 0.3 * base[j] + 0.5 * noise)
+
+
+def _per_query(fn, queries) -> float:
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) / len(queries) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Speedup y recall de la búsqueda densa PCA + re-puntuación.")
+    ap.add_argument("--sizes", default="10000,50000,200000")
+    ap.add_argument("--dims", default="64,128")
+    ap.add_argument("--k", type=int, default=50, help="candidatos densos por consulta (DENSE_K)")
+    ap.add_argument("--width", type=int, default=4, help="candidatos de la etapa gruesa = width × k")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--index", default="models/embeddings_index.faiss", help="índice real del que salen los vectores base")
+    args = ap.parse_args()
+
+    base_index = faiss.read_index(args.index)
+    base = base_index.reconstruct_n(0, base_index.ntotal).astype(np.float32)
+    rng = np.random.default_rng(args.seed)
+    dims = [int(d) for d in args.dims.split(",")]
+    k = args.k
+
+    print(f"k={k}, etapa gruesa={args.width}×k, {args.queries} consultas, d={base.shape[1]}")
+    print(f"{'N':>8} {'exacto µs':>10} " + " ".join(f"{f'pca{d} µs':>9} {'speedup':>7} {'recall@k':>8} {'rec@10':>6}" for d in dims))
+    for n in (int(s) for s in args.sizes.split(",")):
+        xb = _synthetic(base, n, rng)
+        qi = rng.integers(0, n, args.queries)
+        noise = rng.standard_normal((args.queries, xb.shape[1])).astype(np.float32) / np.sqrt(xb.shape[1])
+        queries = _normalize(xb[qi] + 0.4 * noise)
+        queries = [queries[i:i + 1] for i in range(len(queries))]
+
+        flat = faiss.IndexFlatIP(xb.shape[1])
+        flat.add(xb)
+        exact_ids = [flat.search(q, k)[1][0] for q in queries]
+        t_exact = _per_query(lambda q: flat.search(q, k), queries)
+
+        row = f"{n:>8} {t_exact:>10.0f} "
+        for d in dims:
+            proj = fit_projection(xb, d)
+            coarse = build_coarse_index(xb, proj)
+            width = args.width * k
+            got = [two_stage_search(coarse, proj, xb, q, k, width)[1][0] for q in queries]
+            t_two = _per_query(lambda q: two_stage_search(coarse, proj, xb, q, k, width), queries)
+            rec = np.mean([len(set(g) & set(e)) / k for g, e in zip(got, exact_ids)])
+            rec10 = np.mean([len(set(g[:10]) & set(e[:10])) / 10 for g, e in zip(got, exact_ids)])
+            row += f"{t_two:>9.0f} {t_exact / t_two:>6.1f}x {rec:>8.3f} {rec10:>6.3f} "
+            if n == int(args.sizes.split(",")[0]):
+                print(f"{'':>8} (pca{d} conserva {explained_ratio(xb[:5000], proj):.1%} de la energía)")
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
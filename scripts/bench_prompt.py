@@ -0,0 +1,172 @@
+# scripts/bench_prompt.py
+"""
+Tokens de prompt y time-to-first-token (TTFT): armado anterior vs build_messages.
+
+Antes: SYSTEM_RULES como system y de nuevo al comienzo del user, seguido de la
+consulta, los 3 pares Q/A completos y la tarea del modo al final (num_ctx 2048).
+Ahora: system fijo por modo (reglas + tarea) y user con contexto recortado al
+presupuesto, consulta y respuesta base (app/generator.build_messages).
+
+Los requests salen del catálogo sin pasar por el retriever: por FAQ muestreada,
+la consulta es su pregunta, la respuesta base su respuesta y el contexto ella
+más las dos FAQs vecinas. Se alternan polish y clarify (--clarify-ratio).
+
+Sin --host se levanta un Ollama falso (stdlib) que simula el prefill: cobra
+--prefill-ms por cada token NO compartido con el prompt anterior (como el
+KV-cache de un slot de llama.cpp) y devuelve prompt_eval_count. Con --host se
+mide contra un Ollama real (stream=True, TTFT = primer chunk con texto).
+
+Uso:
+    python -m scripts.bench_prompt --n 40
+    python -m scripts.bench_prompt --host http://127.0.0.1:11434 --n 20
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+from app.catalogs import get_catalog
+from app.generator import SYSTEM_RULES, OllamaBackend, build_messages, estimate_tokens, system_prompt
+
+
+def _legacy_payload(model: str, query: str, base_answer: str, ctx, mode: str) -> dict:
+    """Prompt tal como se armaba antes de build_messages."""
+    ctx_str = "\n\n".join(f"Q: {c.get('pregunta_faq','')}\nA: {c.get('respuesta','')}" for c in ctx[:3]).strip()
+    head = f"{SYSTEM_RULES}\n\nConsulta del usuario:\n{query}\n\nContexto (pares Q/A):\n{ctx_str}\n\n"
+    task = system_prompt(mode).split("\n\n", 1)[1]
+    prompt = head + task + ("" if mode == "clarify" else f"\n\nRespuesta base:\n{base_answer}\n")
+    return {
+        "model": model,
+        "messages": [{"role": "system", "content": SYSTEM_RULES}, {"role": "user", "content": prompt}],
+        "options": {"temperature": 0.2, "num_ctx": 2048},
+        "stream": True,
+    }
+
+
+# ---------- Ollama falso ----------
+def _flat(payload: dict) -> str:
+    return "".join(f"<|{m['role']}|>{m['content']}" for m in payload["messages"])
+
+
+class FakeOllama:
+    """Un slot con KV-cache: reutiliza el prefijo común con el prompt anterior."""
+
+    def __init__(self, prefill_ms: float, decode_ms: float):
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.prev = ""
+        self.lock = threading.Lock()
+
+    def prefill(self, text: str):
+        with self.lock:  # un solo slot: los requests se serializan
+            shared = 0
+            for a, b in zip(self.prev, text):
+                if a != b:
+                    break
+                shared += 1
+            self.prev = text
+            total = estimate_tokens(text)
+            new = total - estimate_tokens(text[:shared])
+            time.sleep(new * self.prefill_ms / 1000.0)
+        return total, new
+
+
+def _make_handler(fake: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            total, new = fake.prefill(_flat(payload))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for word in ("Respuesta", " de", " prueba."):
+                self.wfile.write(json.dumps({"message": {"content": word}, "done": False}).encode() + b"\n")
+                self.wfile.flush()
+                time.sleep(fake.decode_ms / 1000.0)
+            done = {"message": {"content": ""}, "done": True, "prompt_eval_count": new, "prompt_tokens": total}
+            self.wfile.write(json.dumps(done).encode() + b"\n")
+
+    return Handler
+
+
+# ---------- medición ----------
+def _measure(host: str, payload: dict):
+    """(ttft_ms, prompt_eval_count) de una llamada en streaming."""
+    t0 = time.perf_counter()
+    ttft, evals = None, None
+    with requests.post(f"{host}/api/chat", json=payload, stream=True, timeout=300) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if ttft is None and (chunk.get("message") or {}).get("content"):
+                ttft = (time.perf_counter() - t0) * 1000.0
+            if chunk.get("done"):
+                evals = chunk.get("prompt_eval_count")
+    return ttft or (time.perf_counter() - t0) * 1000.0, evals
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tokens de prompt y TTFT: armado anterior vs build_messages.")
+    ap.add_argument("--host", default=None, help="Ollama real (por defecto: servidor falso local)")
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--tenant", default=None)
+    ap.add_argument("--n", type=int, default=40)
+    ap.add_argument("--clarify-ratio", type=float, default=0.3)
+    ap.add_argument("--prefill-ms", type=float, default=1.0, help="servidor falso: ms por token de prefill")
+    ap.add_argument("--decode-ms", type=float, default=2.0, help="servidor falso: ms por token generado")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    host = args.host
+    if host is None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(FakeOllama(args.prefill_ms, args.decode_ms)))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host = f"http://127.0.0.1:{server.server_address[1]}"
+    backend = OllamaBackend(model=args.model, host=host)
+
+    faqs = get_catalog(args.tenant).faqs
+    rnd = random.Random(args.seed)
+    cases = []
+    for i in rnd.sample(range(len(faqs)), min(args.n, len(faqs))):
+        ctx = [faqs[i], faqs[(i + 1) % len(faqs)], faqs[(i + 2) % len(faqs)]]
+        mode = "clarify" if rnd.random() < args.clarify_ratio else "polish"
+        cases.append((faqs[i]["pregunta_faq"], faqs[i]["respuesta"], ctx, mode))
+
+    results = {}
+    for label in ("antes", "ahora"):
+        toks, evals, ttfts = [], [], []
+        for query, base, ctx, mode in cases:
+            if label == "antes":
+                payload = _legacy_payload(backend.model, query, base, ctx, mode)
+            else:
+                payload = backend.payload(build_messages(query, base, ctx, mode), stream=True)
+            toks.append(estimate_tokens(_flat(payload)))
+            ttft, ev = _measure(host, payload)
+            ttfts.append(ttft)
+            if ev is not None:
+                evals.append(ev)
+        results[label] = (toks, evals, ttfts, payload["options"]["num_ctx"])
+
+    print(f"{len(cases)} requests ({sum(c[3] == 'clarify' for c in cases)} clarify) contra {host}")
+    print(f"{'':6} {'tokens p50':>10} {'máx':>5} {'prefill p50':>11} {'TTFT p50':>9} {'p95':>7} {'num_ctx':>7}")
+    for label, (toks, evals, ttfts, num_ctx) in results.items():
+        ev = f"{np.percentile(evals, 50):11.0f}" if evals else f"{'-':>11}"
+        print(f"{label:6} {np.percentile(toks, 50):10.0f} {max(toks):5d} {ev} "
+              f"{np.percentile(ttfts, 50):7.1f}ms {np.percentile(ttfts, 95):5.1f}ms {num_ctx:7d}")
+    print("(prefill = tokens evaluados, sin los reutilizados del KV-cache; tokens estimados a "
+          "GEN_CHARS_PER_TOKEN)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# scripts/bench_rerank_rules.py
+"""
+Benchmark del motor de reglas de re-ranking (app/rerank_rules.py).
+
+Mide el costo por consulta de aplicar N reglas sobre una lista fusionada de
+candidatos, comparando:
+- "legacy": cadena de `if palabra in texto` por candidato (como el código anterior)
+- "compiled": reglas compiladas (un gather vectorizado por pista activa)
+
+Uso:
+    python -m scripts.bench_rerank_rules --faqs 2000 --cands 100 --rules 6 60 600 3000
+"""
+import argparse
+import random
+import time
+
+from app.rerank_rules import CompiledRules, Rule
+
+_VOCAB = [
+    "modalidad", "cursar", "duración", "título", "otorga", "laboratorio", "informática",
+    "ámbitos", "trabajar", "salida laboral", "práctica", "profesionalizante", "inscripción",
+    "beca", "horario", "sede", "materias", "correlativas", "pasantía", "equivalencias",
+]
+
+
+def _synthetic_faqs(n: int, rnd: random.Random):
+    faqs = []
+    for i in range(n):
+        q = " ".join(rnd.choices(_VOCAB, k=4)) + f" pregunta {i}"
+        a = " ".join(rnd.choices(_VOCAB, k=12)) + f" respuesta {i}"
+        faqs.append({"faq_id": str(i), "pregunta_faq": q, "respuesta": a})
+    return faqs
+
+
+def _synthetic_rules(n: int, rnd: random.Random):
+    rules = []
+    for j in range(n):
+        rules.append(Rule(
+            name=f"r{j}",
+            when="laboral",
+            field=rnd.choice(["title", "text"]),
+            contains_any=tuple(rnd.sample(_VOCAB, k=2)),
+            delta=rnd.uniform(-0.3, 0.3),
+        ))
+    return rules
+
+
+def _legacy_apply(fused, rules, faqs):
+    adjusted = []
+    for idx, sc in fused:
+        title = faqs[idx]["pregunta_faq"].lower()
+        text = (faqs[idx]["pregunta_faq"] + " " + faqs[idx]["respuesta"]).lower()
+        for r in rules:
+            hay = title if r.field == "title" else text
+            if any(w in hay for w in r.contains_any):
+                sc += r.delta
+        adjusted.append((idx, sc))
+    return sorted(adjusted, key=lambda x: x[1], reverse=True)
+
+
+def _time_per_query(fn, repeats: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - t0) / repeats * 1e6  # µs
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--faqs", type=int, default=2000)
+    ap.add_argument("--cands", type=int, default=100, help="candidatos fusionados por consulta")
+    ap.add_argument("--rules", type=int, nargs="+", default=[6, 60, 600, 3000])
+    ap.add_argument("--repeats", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=13)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    faqs = _synthetic_faqs(args.faqs, rnd)
+    fused = [(i, rnd.random()) for i in rnd.sample(range(args.faqs), k=min(args.cands, args.faqs))]
+    hints = frozenset({"laboral"})
+
+    print(f"FAQs={args.faqs}  candidatos/consulta={len(fused)}  repeticiones={args.repeats}\n")
+    print(f"{'reglas':>7} | {'compilar (ms)':>13} | {'compiled (µs/q)':>15} | {'legacy (µs/q)':>13}")
+    print("-" * 58)
+    for n_rules in args.rules:
+        rules = _synthetic_rules(n_rules, rnd)
+
+        t0 = time.perf_counter()
+        compiled = CompiledRules(rules, faqs)
+        compile_ms = (time.perf_counter() - t0) * 1e3
+
+        fast = _time_per_query(lambda: compiled.apply(fused, hints), args.repeats)
+        # El legacy crece linealmente con las reglas: limitamos repeticiones
+        slow_reps = max(3, args.repeats // max(1, n_rules // 6))
+        slow = _time_per_query(lambda: _legacy_apply(fused, rules, faqs), slow_reps)
+
+        print(f"{n_rules:>7} | {compile_ms:>13.1f} | {fast:>15.1f} | {slow:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# scripts/bench_suggest.py
+"""
+Latencia y acierto del autocompletado (app/suggest.py) simulando tecleo.
+
+Para una muestra de preguntas del catálogo se llama a `suggest` con cada
+prefijo (carácter a carácter, como el widget en cada keystroke) y se mide:
+
+  - latencia por llamada (p50 / p99 / máx, en µs)
+  - acierto@k: la pregunta buscada aparece entre las sugerencias con la mitad
+    de la pregunta escrita, y con la pregunta completa con un error de tipeo
+    (dos letras intercambiadas en una palabra)
+
+Uso:
+    python -m scripts.bench_suggest --sample 200 --limit 5
+"""
+import argparse
+import random
+import time
+
+from app.catalogs import registry
+from app.suggest import get_suggester
+
+
+def _typo(text: str, rnd: random.Random) -> str:
+    words = text.split()
+    long_words = [i for i, w in enumerate(words) if len(w) >= 5]
+    if not long_words:
+        return text
+    i = rnd.choice(long_words)
+    w = words[i]
+    j = rnd.randrange(1, len(w) - 2)
+    words[i] = w[:j] + w[j + 1] + w[j] + w[j + 2:]
+    return " ".join(words)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Latencia/acierto de /suggest simulando tecleo.")
+    ap.add_argument("--tenant", default=None)
+    ap.add_argument("--sample", type=int, default=200)
+    ap.add_argument("--limit", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    sug = get_suggester(registry.faqs_path(args.tenant))
+    print(f"build: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    rnd = random.Random(args.seed)
+    qids = rnd.sample(range(len(sug.questions)), min(args.sample, len(sug.questions)))
+    times, hit_half, hit_typo = [], 0, 0
+    for qid in qids:
+        target = sug.questions[qid]
+        text = target.lstrip("¿¡")
+        for n in range(1, len(text) + 1):
+            t = time.perf_counter()
+            sug.suggest(text[:n], args.limit)
+            times.append((time.perf_counter() - t) * 1e6)
+        half = [s["pregunta"] for s in sug.suggest(text[: len(text) // 2], args.limit)]
+        hit_half += target in half
+        typo = [s["pregunta"] for s in sug.suggest(_typo(text, rnd), args.limit)]
+        hit_typo += target in typo
+
+    times.sort()
+    n = len(times)
+    print(f"{n} llamadas (keystrokes) sobre {len(qids)} preguntas")
+    print(f"  latencia µs: p50 {times[n // 2]:.1f} · p99 {times[int(0.99 * (n - 1))]:.1f} · máx {times[-1]:.1f}")
+    print(f"  acierto@{args.limit} con media pregunta escrita: {hit_half / len(qids):.1%}")
+    print(f"  acierto@{args.limit} con un error de tipeo:       {hit_typo / len(qids):.1%}")
+
+
+if __name__ == "__main__":
+    main()
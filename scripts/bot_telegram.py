@@ -4,6 +4,9 @@
 import os
 import logging
 import asyncio
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Dict
 
 from telegram import Update
@@ -11,8 +14,11 @@ from telegram.constants import ChatAction, ParseMode
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
 
 # Integramos directamente con tus módulos
-from app.retriever import encode_query, buscar_similares
-from app.response_selector import seleccionar_respuesta, SelectorConfig
+from app.catalogs import registry
+from app.pipeline import responder_sesion
+from app.rate_limit import RateLimited
+from app.warmup import WARMUP_ON_STARTUP, WARMUP_START_DELAY_S, start_warmup
+from app.response_selector import SelectorConfig, load_selector_config
 
 # ---------------- Logging ----------------
 logging.basicConfig(
@@ -21,27 +27,59 @@ logging.basicConfig(
 )
 log = logging.getLogger("ies-bot")
 
+# ---------------- Ejecución ----------------
+# Updates procesados en paralelo por el Application (comandos, mensajes de distintos chats)
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", 32))
+# Hilos para el pipeline (encode, FAISS, LLM por HTTP): nunca corre en el event loop
+BOT_PIPELINE_WORKERS = int(os.getenv("BOT_PIPELINE_WORKERS", 8))
+# Telegram muestra "typing..." ~5 s; se reenvía mientras el pipeline trabaja
+TYPING_INTERVAL_S = 4.0
+
+_pipeline_pool = ThreadPoolExecutor(max_workers=BOT_PIPELINE_WORKERS, thread_name_prefix="bot-pipeline")
+
 # ---------------- Estado por chat ----------------
 DEBUG_CHATS: Dict[int, bool] = {}  # chat_id -> debug_enabled
+# Los chats distintos corren en paralelo, pero cada chat se responde en orden
+_CHAT_LOCKS: Dict[int, asyncio.Lock] = {}
+_CHAT_WAITERS: Dict[int, int] = {}
 
 
 # --------------- Helpers ---------------
 def _selector_cfg() -> SelectorConfig:
-    # Usa los mismos umbrales que ya calibraste
-    return SelectorConfig(
-        tau_high=0.80,
-        tau_low=0.55,
-        near_tie_delta=0.05,
-        show_k=3,
-    )
+    # Mismos umbrales que la API (calibrados con scripts/calibrate_thresholds.py)
+    return load_selector_config()
 
-async def _send_typing(context: ContextTypes.DEFAULT_TYPE, chat_id: int, seconds: float = 0.4):
-    """Muestra 'typing...' un ratito (cosmético)."""
+async def _keep_typing(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    """Muestra 'typing...' mientras dure la tarea (se cancela al tener la respuesta)."""
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
-        await asyncio.sleep(seconds)
+        while True:
+            await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+            await asyncio.sleep(TYPING_INTERVAL_S)
+    except asyncio.CancelledError:
+        raise
     except Exception:
-        pass
+        pass  # cosmético: un fallo acá no debe afectar la respuesta
+
+
+@contextlib.asynccontextmanager
+async def _chat_turn(chat_id: int):
+    """Serializa los mensajes de un mismo chat (se libera el lock al quedar sin uso)."""
+    lock = _CHAT_LOCKS.setdefault(chat_id, asyncio.Lock())
+    _CHAT_WAITERS[chat_id] = _CHAT_WAITERS.get(chat_id, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _CHAT_WAITERS[chat_id] -= 1
+        if not _CHAT_WAITERS[chat_id]:
+            _CHAT_WAITERS.pop(chat_id, None)
+            _CHAT_LOCKS.pop(chat_id, None)
+
+
+async def _run_pipeline(fn, *args, **kwargs):
+    """Corre el pipeline (bloqueante) en el pool de hilos sin frenar el event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pipeline_pool, partial(fn, *args, **kwargs))
 
 
 # --------------- Handlers ---------------
@@ -61,7 +99,8 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Ayuda – Chatbot IES\n\n"
         "• Escribí tu pregunta tal como la harías en el sitio (ej: “¿En qué ámbitos puede trabajar un Técnico Superior en RRHH?”).\n"
         "• El bot combina búsqueda semántica y léxica, y puede pedir aclaraciones si detecta empate.\n"
-        "• /debug – alterna modo debug por chat para ver puntajes y modo del selector.\n"
+        "• /debug – alterna modo debug por chat para ver puntajes y modo del selector "
+        "(y guarda un perfil de cada consulta en logs/profiles/).\n"
     )
     await update.message.reply_text(msg)
 
@@ -82,22 +121,43 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Decime tu consulta y te doy una mano.")
         return
 
-    # Muestra "typing..." mientras trabaja
-    await _send_typing(context, chat_id, seconds=0.3)
+    async with _chat_turn(chat_id):
+        await _answer(update, context, chat_id, text)
+
+
+async def _answer(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str):
+    # "typing..." en paralelo con el pipeline, no antes
+    typing_task = asyncio.create_task(_keep_typing(context, chat_id))
 
     try:
-        # 1) encode + recuperación híbrida (IMPORTANTE: pasar query_text para híbrido)
-        qvec = encode_query(text)
-        cands = buscar_similares(qvec, top_k=5, query_text=text)
-
-        # 2) selección (extractive / generative / tie-break / fallback)
-        cfg = _selector_cfg()
-        sel = seleccionar_respuesta(
-            query=text,
-            candidatos=cands,
-            cfg=cfg,
-            enable_generation=True,  # usa GEN_BACKEND (ollama/openai/mock)
-        )
+        # encode + recuperación híbrida + re-rank + selección (ver app/pipeline.py),
+        # fuera del event loop; mensajes idénticos simultáneos comparten una sola ejecución.
+        # Si el turno anterior fue una aclaración, "la primera" / "2" se resuelve por chat.
+        # El chat_id de un usuario es el mismo en todos los bots: la sesión (aclaraciones
+        # pendientes, límite por usuario) se separa por tenant.
+        tenant = context.bot_data.get("tenant")  # catálogo según el token del bot
+        try:
+            sel = await _run_pipeline(
+                responder_sesion,
+                text,
+                session_id=f"tg:{tenant or 'default'}:{chat_id}",
+                top_k=5,
+                enable_generation=True,  # usa GEN_BACKEND (ollama/openai/mock)
+                cfg=_selector_cfg(),
+                tenant=tenant,
+                profile=DEBUG_CHATS.get(chat_id, False),  # en debug se guarda el perfil del request
+            )
+        except RateLimited as e:
+            wait_s = int(e.retry_after_s + 0.999)
+            if e.reason == "queue_timeout":
+                # Sobrecarga del servidor: no es culpa del usuario
+                await update.message.reply_text(f"Estoy con mucha demanda. Probá de nuevo en {wait_s} s.")
+            elif e.notify:
+                # Un solo aviso por racha de rechazos: el resto de los mensajes se ignora
+                await update.message.reply_text(f"Estás enviando muchos mensajes seguidos. Probá de nuevo en {wait_s} s.")
+            return
+        finally:
+            typing_task.cancel()
 
         answer = sel.get("answer", "").strip()
         mode = sel.get("mode", "extractive")
@@ -119,6 +179,8 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"*best_dense*: `{best_dense}`\n"
                 f"*gen_backend*: `{backend}`  *used_gen*: `{used_gen}`"
             )
+            if meta.get("profile_id"):
+                dbg += f"\n*perfil*: `{meta['profile_id']}`"
             await update.message.reply_text(dbg, parse_mode=ParseMode.MARKDOWN)
 
     except Exception as e:
@@ -129,21 +191,58 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # --------------- Main ---------------
-def main():
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        raise RuntimeError("Falta TELEGRAM_BOT_TOKEN en el entorno.")
-
-    app = ApplicationBuilder().token(token).build()
+def _build_app(token: str, tenant, base_url: str = None):
+    builder = ApplicationBuilder().token(token).concurrent_updates(BOT_CONCURRENT_UPDATES)
+    if base_url:
+        builder = builder.base_url(base_url)  # ej. API falsa de scripts/bench_bot.py
+    app = builder.build()
+    app.bot_data["tenant"] = tenant  # cada bot (token) atiende un catálogo
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("debug", debug_cmd))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    return app
+
+
+async def _run_many(apps):
+    """Long polling de varios bots (uno por tenant) en el mismo loop y proceso."""
+    for app in apps:
+        await app.initialize()
+        await app.start()
+        await app.updater.start_polling()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for app in apps:
+            await app.updater.stop()
+            await app.stop()
+            await app.shutdown()
+
+
+def main():
+    # {token: tenant}: el token por defecto usa el catálogo por defecto (o el tenant
+    # al que esté asociado en data/catalogs.json) y se suman los tokens por tenant.
+    bots = {tok: tenant for tenant, tok in registry.telegram_tokens().items()}
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if token and token not in bots:
+        bots[token] = registry.tenant_for_token(token)
+    if not bots:
+        raise RuntimeError("Falta TELEGRAM_BOT_TOKEN en el entorno.")
+
+    apps = [_build_app(tok, tenant) for tok, tenant in bots.items()]
 
-    log.info("Iniciando bot de Telegram (long polling)…")
-    app.run_polling(close_loop=False)
+    log.info("Iniciando %d bot(s) de Telegram (long polling)…", len(apps))
+    if WARMUP_ON_STARTUP:
+        start_warmup(delay_s=WARMUP_START_DELAY_S)  # cachés en segundo plano (app/warmup.py)
+    if len(apps) == 1:
+        apps[0].run_polling(close_loop=False)
+    else:
+        try:
+            asyncio.run(_run_many(apps))
+        except KeyboardInterrupt:
+            pass
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
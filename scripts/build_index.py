@@ -1,47 +1,273 @@
 # scripts/build_index.py
+"""
+Construcción del índice FAISS en streaming, por lotes y reanudable.
 
+1. Lee el CSV por bloques (`--chunk-rows`), sin cargarlo entero en memoria.
+2. Codifica cada bloque con tamaño de batch configurable y, opcionalmente,
+   un pool de procesos en CPU (`--workers`).
+3. Guarda cada bloque como shard en disco (embeddings normalizados + FAQs).
+   Si el proceso se corta, la próxima corrida saltea los shards ya escritos.
+4. Une los shards en el índice final (IndexFlatIP) y en faqs.pkl.
+
+Multi-vector (`--fields`): además del vector de la pregunta ("q"), cada FAQ
+puede aportar vectores de pasajes de su respuesta ("a") o de pregunta + pasaje
+("qa"). Todos van al mismo índice y `vector_map.npy` indica a qué FAQ
+pertenece cada vector (el retriever agrega por FAQ con max-pooling).
+El max-pooling solo puede subir `score_dense` respecto del índice de preguntas,
+y los umbrales del selector (tau_high, tau_low, near_tie_delta) están ajustados
+sobre ese coseno: por eso el default es "q", y un índice multi-vector necesita
+su propia calibración (`python -m scripts.calibrate_thresholds`).
+
+PCA (`--pca-dim`): entrena una proyección a menos dimensiones y la guarda como
+`pca.npy` junto al índice; el retriever busca primero sobre los vectores
+reducidos y re-puntúa los candidatos con los vectores completos (app/pca.py).
+
+Uso:
+    python -m scripts.build_index
+    python -m scripts.build_index --csv data/faqs.csv --batch-size 128 --workers 4
+    python -m scripts.build_index --pca-dim 64
+    python -m scripts.build_index --fields q,qa   # + recalibrar umbrales
+"""
+import argparse
+import json
 import os
 import pickle
+import re
+import shutil
+import time
+
 import faiss
 import numpy as np
-from app.utils import load_faqs
+from app.pca import PCA_FILENAME, explained_ratio, fit_projection
+from app.utils import iter_faq_chunks
 from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
 
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 # Ruta del archivo CSV de FAQs
 FAQ_PATH = "data/faqs.csv"
 # Directorio de salida
 MODEL_DIR = "models"
-os.makedirs(MODEL_DIR, exist_ok=True)
-
-# 1. Cargar FAQs
-faqs = load_faqs(FAQ_PATH)
-print(f"Se cargaron {len(faqs)} FAQs.")
-faq_texts = [faq["pregunta_faq"] for faq in faqs]
-print(f"Se cargaron {len(faq_texts)} preguntas para indexar.")
-
-# 2. Generar embeddings
-print("Cargando modelo de embeddings...")
-model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-embeddings = model.encode(
-    faq_texts,
-    show_progress_bar=True,
-    convert_to_numpy=True,
-    normalize_embeddings=False  # ← Normalización manual más abajo
-)
-
-# 3. Normalizar embeddings (para similitud coseno con IP)
-embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-
-# 4. Crear índice FAISS con similitud coseno
-dim = embeddings.shape[1]
-index = faiss.IndexFlatIP(dim)  # IP = inner product (para similitud coseno si los vectores están normalizados)
-index.add(embeddings)
-print(f"Índice FAISS creado con {index.ntotal} vectores.")
-
-# 5. Guardar índice y preguntas
-faiss.write_index(index, os.path.join(MODEL_DIR, "embeddings_index.faiss"))
-with open(os.path.join(MODEL_DIR, "faqs.pkl"), "wb") as f:
-    pickle.dump(faqs, f)
-
-print("Embeddings e índice FAISS guardados con éxito.")
\ No newline at end of file
+
+_SENT_SPLIT = re.compile(r"(?<=[.!?;])\s+")
+
+
+def _answer_passages(answer: str, max_words: int):
+    """Parte la respuesta en pasajes de oraciones completas de hasta ~max_words palabras."""
+    passages, cur, n = [], [], 0
+    for sent in _SENT_SPLIT.split(answer.strip()):
+        words = len(sent.split())
+        if cur and n + words > max_words:
+            passages.append(" ".join(cur))
+            cur, n = [], 0
+        cur.append(sent)
+        n += words
+    if cur:
+        passages.append(" ".join(cur))
+    return passages
+
+
+def _faq_texts(chunk, fields, max_words: int):
+    """
+    Textos a codificar para un bloque de FAQs y, para cada uno, la posición
+    (dentro del bloque) de la FAQ a la que pertenece.
+    """
+    texts, rows = [], []
+    for j, faq in enumerate(chunk):
+        q = faq["pregunta_faq"]
+        if "q" in fields:
+            texts.append(q)
+            rows.append(j)
+        if "a" in fields or "qa" in fields:
+            for passage in _answer_passages(faq["respuesta"], max_words):
+                if "a" in fields:
+                    texts.append(passage)
+                    rows.append(j)
+                if "qa" in fields:
+                    texts.append(f"{q} {passage}")
+                    rows.append(j)
+    return texts, np.asarray(rows, dtype=np.int32)
+
+
+def _fingerprint(csv_path: str, args) -> dict:
+    """Identifica la corrida: si cambia el CSV o los parámetros, los shards no sirven."""
+    st = os.stat(csv_path)
+    return {
+        "source": os.path.abspath(csv_path),
+        "size": st.st_size,
+        "mtime": int(st.st_mtime),
+        "model": MODEL_NAME,
+        "chunk_rows": args.chunk_rows,
+        "fields": sorted(args.fields),
+        "passage_words": args.passage_words,
+    }
+
+
+def _prepare_shard_dir(shard_dir: str, fingerprint: dict, fresh: bool) -> None:
+    manifest = os.path.join(shard_dir, "manifest.json")
+    if os.path.isdir(shard_dir) and not fresh and os.path.exists(manifest):
+        with open(manifest, "r", encoding="utf-8") as f:
+            if json.load(f) == fingerprint:
+                return  # reanudamos
+        print("[BUILD] El CSV o los parámetros cambiaron: descartando shards previos.")
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.makedirs(shard_dir, exist_ok=True)
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump(fingerprint, f)
+
+
+def _shard_paths(shard_dir: str, k: int):
+    base = os.path.join(shard_dir, f"shard_{k:05d}")
+    return base + ".pkl", base + ".npy"
+
+
+def _atomic_write(path: str, writer) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        writer(f)
+    os.replace(tmp, path)
+
+
+def _encode(model, texts, batch_size: int, pool):
+    if pool is not None:
+        emb = model.encode_multi_process(texts, pool, batch_size=batch_size)
+    else:
+        emb = model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=False,  # ← Normalización manual más abajo
+        )
+    # Normalizar embeddings (para similitud coseno con IP)
+    emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+    return emb.astype(np.float32, copy=False)
+
+
+def build_shards(args) -> int:
+    """Codifica el CSV por bloques y escribe los shards faltantes. Retorna cantidad de shards."""
+    model = None
+    pool = None
+    n_shards = 0
+    rows_done = 0
+    t_start = time.perf_counter()
+
+    try:
+        for k, chunk in enumerate(iter_faq_chunks(args.csv, args.chunk_rows)):
+            n_shards = k + 1
+            faqs_path, emb_path = _shard_paths(args.shard_dir, k)
+            if os.path.exists(emb_path):
+                continue  # shard completo de una corrida anterior
+
+            if model is None:
+                print("Cargando modelo de embeddings...")
+                model = SentenceTransformer(MODEL_NAME, device="cpu")
+                if args.workers > 1:
+                    pool = model.start_multi_process_pool(target_devices=["cpu"] * args.workers)
+
+            t0 = time.perf_counter()
+            texts, rows = _faq_texts(chunk, args.fields, args.passage_words)
+            emb = _encode(model, texts, args.batch_size, pool)
+
+            # Primero las FAQs y al final los embeddings: el .npy marca el shard como completo
+            _atomic_write(faqs_path, lambda f: pickle.dump({"faqs": chunk, "rows": rows}, f))
+            _atomic_write(emb_path, lambda f: np.save(f, emb))
+
+            dt = time.perf_counter() - t0
+            rows_done += len(chunk)
+            elapsed = time.perf_counter() - t_start
+            print(
+                f"[BUILD] shard {k:05d}: {len(chunk)} filas / {len(texts)} vectores en {dt:.1f}s "
+                f"({len(chunk) / max(dt, 1e-9):.1f} filas/s) — acumulado {rows_done / max(elapsed, 1e-9):.1f} filas/s"
+            )
+    finally:
+        if pool is not None:
+            SentenceTransformer.stop_multi_process_pool(pool)
+
+    if rows_done:
+        elapsed = time.perf_counter() - t_start
+        print(f"[BUILD] Codificadas {rows_done} filas nuevas en {elapsed:.1f}s ({rows_done / elapsed:.1f} filas/s).")
+    else:
+        print("[BUILD] Nada nuevo para codificar (todos los shards ya estaban en disco).")
+    return n_shards
+
+
+def merge_shards(args, n_shards: int) -> None:
+    """Une los shards (en orden) en el índice FAISS final y en faqs.pkl."""
+    index = None
+    faqs = []
+    vector_map = []
+    for k in range(n_shards):
+        faqs_path, emb_path = _shard_paths(args.shard_dir, k)
+        emb = np.load(emb_path)
+        with open(faqs_path, "rb") as f:
+            shard = pickle.load(f)
+        vector_map.append(shard["rows"] + len(faqs))  # posición global de la FAQ
+        faqs.extend(shard["faqs"])
+        if index is None:
+            # IP = inner product (para similitud coseno si los vectores están normalizados)
+            index = faiss.IndexFlatIP(emb.shape[1])
+        index.add(emb)
+
+    if index is None:
+        raise RuntimeError(f"No hay FAQs válidas en {args.csv}.")
+    print(f"Índice FAISS creado con {index.ntotal} vectores ({len(faqs)} FAQs).")
+    vector_map = np.concatenate(vector_map).astype(np.int32)
+
+    os.makedirs(args.out, exist_ok=True)
+    index_path = os.path.join(args.out, "embeddings_index.faiss")
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    _atomic_write(os.path.join(args.out, "faqs.pkl"), lambda f: pickle.dump(faqs, f))
+
+    # Mapa vector → FAQ (solo hace falta si hay más de un vector por FAQ)
+    map_path = os.path.join(args.out, "vector_map.npy")
+    if len(vector_map) != len(faqs) or not np.array_equal(vector_map, np.arange(len(faqs))):
+        _atomic_write(map_path, lambda f: np.save(f, vector_map))
+    elif os.path.exists(map_path):
+        os.remove(map_path)
+
+    # Proyección PCA para la búsqueda en dos etapas (un pca.npy viejo no sirve para el índice nuevo)
+    pca_path = os.path.join(args.out, PCA_FILENAME)
+    if args.pca_dim:
+        xb = index.reconstruct_n(0, index.ntotal)
+        proj = fit_projection(xb, args.pca_dim)
+        _atomic_write(pca_path, lambda f: np.save(f, proj))
+        print(f"[BUILD] PCA {index.d} → {args.pca_dim} dims (conserva {explained_ratio(xb[:50000], proj):.1%} de la energía).")
+    elif os.path.exists(pca_path):
+        os.remove(pca_path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Construye el índice FAISS de FAQs (streaming y reanudable).")
+    ap.add_argument("--csv", default=FAQ_PATH)
+    ap.add_argument("--out", default=MODEL_DIR, help="directorio de salida (índice + faqs.pkl)")
+    ap.add_argument("--chunk-rows", type=int, default=2048, help="filas del CSV por shard")
+    ap.add_argument("--batch-size", type=int, default=64, help="batch de model.encode")
+    ap.add_argument("--workers", type=int, default=1, help="procesos de encode en CPU (1 = sin pool)")
+    ap.add_argument("--fields", default="q",
+                    help="vectores por FAQ: q=pregunta, a=pasajes de respuesta, qa=pregunta+pasaje "
+                         "(con a/qa recalibrar umbrales: scripts.calibrate_thresholds)")
+    ap.add_argument("--passage-words", type=int, default=60, help="tamaño aprox. de cada pasaje de respuesta")
+    ap.add_argument("--pca-dim", type=int, default=0,
+                    help="dims de la proyección PCA para búsqueda en dos etapas (0 = sin PCA; ej. 64 o 128)")
+    ap.add_argument("--shard-dir", default=None, help="por defecto <out>/build_shards")
+    ap.add_argument("--fresh", action="store_true", help="ignora shards previos y empieza de cero")
+    ap.add_argument("--keep-shards", action="store_true", help="no borra los shards al terminar")
+    args = ap.parse_args()
+    args.shard_dir = args.shard_dir or os.path.join(args.out, "build_shards")
+    args.fields = {f.strip() for f in args.fields.split(",") if f.strip()}
+    if not args.fields or not args.fields <= {"q", "a", "qa"}:
+        ap.error("--fields admite una combinación de q, a, qa")
+
+    t0 = time.perf_counter()
+    _prepare_shard_dir(args.shard_dir, _fingerprint(args.csv, args), args.fresh)
+    n_shards = build_shards(args)
+    merge_shards(args, n_shards)
+    if not args.keep_shards:
+        shutil.rmtree(args.shard_dir, ignore_errors=True)
+
+    print(f"Embeddings e índice FAISS guardados con éxito ({time.perf_counter() - t0:.1f}s en total).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# scripts/calibrate_thresholds.py
+"""
+Calibración offline de los umbrales del selector a partir de los logs.
+
+1. Lee logs/chat_logs.json y toma las consultas únicas (normalizadas) con su
+   frecuencia en el log.
+2. Las re-codifica por lotes y recupera sus candidatos UNA vez (mismo camino
+   que app/pipeline.py: atajo exacto primero, si no híbrido + re-rank si está
+   activo). De cada consulta se
+   guardan solo las señales que usa el selector: coseno del top1 y top2,
+   Jaccard consulta↔top1 y pista laboral. Se cachean en disco
+   (logs/calibration_cache.npz) y se reutilizan mientras no cambien el log ni el índice.
+3. Barre la grilla de SelectorConfig de forma vectorizada (configs × consultas
+   con numpy), sin volver a recuperar, replicando la política de
+   app.response_selector.seleccionar_respuesta.
+4. Reporta distribución de modos, llamadas al LLM estimadas y costo de latencia
+   del LLM por configuración (ms por llamada tomados de los logs o de
+   --clarify-ms/--polish-ms), ponderados por tráfico: cada consulta pesa
+   tantas veces como aparece en el log.
+
+Uso:
+    python -m scripts.calibrate_thresholds
+    python -m scripts.calibrate_thresholds --tau-high 0.70:0.90:0.02 --tau-low 0.45:0.65:0.02 --delta 0.02,0.05,0.08
+    python -m scripts.calibrate_thresholds --max-llm-rate 0.25
+    python -m scripts.calibrate_thresholds --write 0.82,0.55,0.05
+
+Sin etiquetas el barrido no mide calidad, solo volumen: la config a usar se
+elige mirando el reporte y se guarda explícitamente con --write.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.catalogs import registry
+from app.query_analysis import analyze_query
+from app.response_selector import (
+    BORDERLINE_MARGIN,
+    LOG_PATH,
+    MIN_JACCARD,
+    SELECTOR_CONFIG_PATH,
+    jaccard,
+    load_selector_config,
+)
+
+CACHE_PATH = Path("logs/calibration_cache.npz")
+MODES = ("extractive", "generative", "tie-break", "fallback")
+
+
+def _read_log(path: Path):
+    """
+    Consultas únicas (por texto normalizado), su frecuencia en el log y latencias
+    del LLM registradas por modo.
+    """
+    queries, freq = [], Counter()
+    gen_ms = {"clarify": [], "polish": []}
+    logged_modes = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if (rec.get("meta") or {}).get("decision") == "clarification":
+                continue  # respuesta a una aclaración: no pasó por los umbrales
+            q = (rec.get("query") or "").strip()
+            mode = rec.get("mode")
+            logged_modes[mode] = logged_modes.get(mode, 0) + 1
+            gen = (rec.get("meta") or {}).get("generator") or {}
+            if gen.get("outcome") == "ok" and gen.get("elapsed_ms"):
+                kind = "polish" if mode == "generative" else "clarify"
+                gen_ms[kind].append(float(gen["elapsed_ms"]))
+            key = analyze_query(q).normalized if q else ""
+            if not key:
+                continue
+            if key not in freq:
+                queries.append(q)
+            freq[key] += 1
+    weights = np.array([freq[analyze_query(q).normalized] for q in queries], dtype=np.float64)
+    return queries, weights, gen_ms, logged_modes
+
+
+def _fingerprint(log_path: Path, tenant, show_k: int) -> str:
+    # Sin importar app.retriever: con la caché vigente no hace falta cargar el modelo
+    index_path = registry.index_path(tenant)
+    parts = ["exact", str(log_path.stat().st_size), str(int(log_path.stat().st_mtime)), str(tenant), str(show_k)]
+    if os.path.exists(index_path):
+        parts.append(str(int(os.path.getmtime(index_path))))
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _signals(queries, tenant, show_k: int, batch_size: int):
+    """Recupera una vez por consulta y devuelve las señales del selector como arrays."""
+    from app.catalogs import get_catalog
+    from app.reranker import fetch_k, rerank
+    from app.retriever import buscar_exacta, buscar_similares, encode_queries
+
+    catalog = get_catalog(tenant)
+    n = len(queries)
+    d1 = np.full(n, -1.0, dtype=np.float32)
+    d2 = np.full(n, -1.0, dtype=np.float32)
+    jac = np.zeros(n, dtype=np.float32)
+    laboral = np.zeros(n, dtype=bool)
+
+    t0 = time.perf_counter()
+    exact = 0
+    for start in range(0, n, batch_size):
+        batch = queries[start:start + batch_size]
+        analyses = [analyze_query(q) for q in batch]
+        # Como en producción: una pregunta del catálogo tal cual no pasa por el encoder
+        hits = [buscar_exacta(q, analysis=a, catalog=catalog, count_stats=False) for q, a in zip(batch, analyses)]
+        todo = [j for j, hit in enumerate(hits) if hit is None]
+        vecs = encode_queries([batch[j] for j in todo]) if todo else None  # una pasada del modelo por lote
+        row_of = {j: r for r, j in enumerate(todo)}
+        exact += len(batch) - len(todo)
+        for j, q in enumerate(batch):
+            i = start + j
+            analysis = analyses[j]
+            cands = hits[j]
+            if cands is None:
+                r = row_of[j]
+                cands = buscar_similares(vecs[r:r + 1], top_k=fetch_k(show_k), query_text=q, analysis=analysis,
+                                         catalog=catalog, count_stats=False)
+            cands, _ = rerank(q, cands, top_k=show_k, analysis=analysis, namespace=catalog.name)
+            laboral[i] = analysis.laboral_hint
+            if cands:
+                d1[i] = cands[0].get("score_dense", cands[0].get("score", 0.0))
+                jac[i] = jaccard(q, cands[0]["pregunta_faq"])
+            if len(cands) > 1:
+                d2[i] = cands[1].get("score_dense", cands[1].get("score", 0.0))
+        print(f"[CALIB] {min(start + batch_size, n)}/{n} consultas recuperadas")
+    dt = time.perf_counter() - t0
+    print(f"[CALIB] Recuperación: {n} consultas en {dt:.1f}s ({n / max(dt, 1e-9):.0f} q/s), {exact} por atajo exacto")
+    return {"d1": d1, "d2": d2, "jac": jac, "laboral": laboral}
+
+
+def _load_or_build(args, queries):
+    fp = _fingerprint(args.log, args.tenant, args.show_k)
+    if args.cache.exists() and not args.refresh:
+        data = np.load(args.cache, allow_pickle=False)
+        if str(data["fingerprint"]) == fp:
+            print(f"[CALIB] Usando candidatos cacheados ({args.cache})")
+            return {k: data[k] for k in ("d1", "d2", "jac", "laboral")}
+    sig = _signals(queries, args.tenant, args.show_k, args.batch_size)
+    args.cache.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(args.cache, fingerprint=np.array(fp), **sig)
+    return sig
+
+
+def _parse_grid(spec: str):
+    """'0.7:0.9:0.02' (inicio:fin:paso, fin incluido) o '0.7,0.8'."""
+    if ":" in spec:
+        a, b, step = (float(x) for x in spec.split(":"))
+        return np.round(np.arange(a, b + step / 2, step), 4)
+    return np.array([float(x) for x in spec.split(",") if x.strip()])
+
+
+def sweep(sig, tau_high, tau_low, delta, weights=None):
+    """
+    Evalúa todas las combinaciones de una vez. Retorna (grid, conteos) donde
+    grid es (G, 3) y conteos es un dict de arrays (G,) por modo y tipo de llamada.
+    Con `weights` (frecuencia de cada consulta) los conteos son de requests, no de
+    consultas únicas. Replica la política de seleccionar_respuesta (mismo orden de reglas).
+    """
+    th, tl, dl = (g.ravel() for g in np.meshgrid(tau_high, tau_low, delta, indexing="ij"))
+    keep = tl < th
+    th, tl, dl = th[keep, None], tl[keep, None], dl[keep, None]   # (G, 1)
+    d1, d2 = sig["d1"][None, :], sig["d2"][None, :]                # (1, N)
+    low_lex = (sig["jac"] < MIN_JACCARD)[None, :]
+    laboral = sig["laboral"][None, :]
+
+    extractive = d1 >= th
+    rest = ~extractive
+    tie = rest & (d1 >= tl) & (d2 >= tl) & ((d1 - d2) < dl)
+    rest &= ~tie
+    mid = rest & (d1 >= tl) & (d1 < th)
+    clarify_gate = mid & low_lex           # tie-break por gate léxico
+    polish = mid & ~low_lex
+    rest &= ~mid
+    borderline = rest & laboral & (d1 >= tl - BORDERLINE_MARGIN) & (d1 < tl)
+    fallback = rest & ~borderline
+
+    w = np.ones(d1.shape[1]) if weights is None else np.asarray(weights, dtype=np.float64)
+    counts = {
+        "extractive": extractive @ w,
+        "generative": (polish | borderline) @ w,
+        "tie-break": (tie | clarify_gate) @ w,
+        "fallback": fallback @ w,
+        "clarify_calls": (tie | clarify_gate) @ w,
+        "polish_calls": (polish | borderline) @ w,
+    }
+    return np.hstack([th, tl, dl]), counts
+
+
+def _median(xs, default):
+    return float(np.median(xs)) if xs else default
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Barrido offline de umbrales del selector sobre los logs.")
+    ap.add_argument("--log", type=Path, default=LOG_PATH)
+    ap.add_argument("--cache", type=Path, default=CACHE_PATH)
+    ap.add_argument("--refresh", action="store_true", help="ignora la caché de candidatos")
+    ap.add_argument("--tenant", default=None)
+    ap.add_argument("--batch-size", type=int, default=256, help="consultas por pasada del encoder")
+    ap.add_argument("--tau-high", default="0.70:0.90:0.02")
+    ap.add_argument("--tau-low", default="0.45:0.65:0.02")
+    ap.add_argument("--delta", default="0.02,0.03,0.05,0.08")
+    ap.add_argument("--clarify-ms", type=float, default=None, help="latencia por llamada clarify (default: mediana del log o 1500)")
+    ap.add_argument("--polish-ms", type=float, default=None, help="latencia por llamada polish (default: mediana del log o 2500)")
+    ap.add_argument("--top", type=int, default=15, help="filas a mostrar")
+    ap.add_argument("--max-llm-rate", type=float, default=None,
+                    help="descarta configs con más de esta fracción de consultas que llaman al LLM")
+    ap.add_argument("--write", default=None, metavar="TAU_HIGH,TAU_LOW,DELTA",
+                    help=f"guarda esta config (con sus números del replay) en {SELECTOR_CONFIG_PATH}")
+    args = ap.parse_args()
+
+    if not args.log.exists():
+        raise SystemExit(f"No existe {args.log}")
+    queries, weights, gen_ms, logged_modes = _read_log(args.log)
+    if not queries:
+        raise SystemExit(f"{args.log} no tiene consultas.")
+    current = load_selector_config()
+    args.show_k = current.show_k
+    print(f"[CALIB] {len(queries)} consultas únicas ({int(weights.sum())} requests) en {args.log}. "
+          f"Modos registrados: {logged_modes}")
+
+    sig = _load_or_build(args, queries)
+    clarify_ms = args.clarify_ms or _median(gen_ms["clarify"], 1500.0)
+    polish_ms = args.polish_ms or _median(gen_ms["polish"], 2500.0)
+
+    t0 = time.perf_counter()
+    grid, c = sweep(sig, _parse_grid(args.tau_high), _parse_grid(args.tau_low), _parse_grid(args.delta), weights)
+    base_grid, base = sweep(sig, np.array([current.tau_high]), np.array([current.tau_low]),
+                            np.array([current.near_tie_delta]), weights)
+    dt = (time.perf_counter() - t0) * 1000
+    n = float(weights.sum())  # los porcentajes y el costo son por request
+    print(f"[CALIB] {len(grid)} configuraciones × {len(queries)} consultas evaluadas en {dt:.1f} ms")
+    print(f"[CALIB] Latencia LLM supuesta: clarify {clarify_ms:.0f} ms, polish {polish_ms:.0f} ms por llamada\n")
+
+    llm = c["clarify_calls"] + c["polish_calls"]
+    llm_ms = (c["clarify_calls"] * clarify_ms + c["polish_calls"] * polish_ms) / n
+    order = np.lexsort((llm, c["fallback"]))  # menos fallback primero, luego menos LLM
+    if args.max_llm_rate is not None:
+        order = order[(llm[order] / n) <= args.max_llm_rate]
+
+    header = f"{'tau_high':>8} {'tau_low':>7} {'delta':>5} | " + " ".join(f"{m:>10}" for m in MODES) + \
+             f" | {'LLM %':>6} {'LLM ms/q':>8}"
+    print(header)
+    print("-" * len(header))
+
+    def row(g, counts, i, tag=""):
+        modes = " ".join(f"{100 * counts[m][i] / n:>9.1f}%" for m in MODES)
+        calls = counts["clarify_calls"][i] + counts["polish_calls"][i]
+        ms = (counts["clarify_calls"][i] * clarify_ms + counts["polish_calls"][i] * polish_ms) / n
+        print(f"{g[i, 0]:>8.2f} {g[i, 1]:>7.2f} {g[i, 2]:>5.2f} | {modes} | {100 * calls / n:>5.1f}% {ms:>8.0f}{tag}")
+
+    row(base_grid, base, 0, "  ← actual")
+    for i in order[:args.top]:
+        row(grid, c, i)
+
+    if args.write:
+        th, tl, dl = (float(x) for x in args.write.split(","))
+        g, w = sweep(sig, np.array([th]), np.array([tl]), np.array([dl]), weights)
+        if not len(g):
+            raise SystemExit("--write: tau_low debe ser menor que tau_high.")
+        print()
+        row(g, w, 0, "  ← guardada")
+        calls = int(w["clarify_calls"][0] + w["polish_calls"][0])
+        out = {
+            "tau_high": th,
+            "tau_low": tl,
+            "near_tie_delta": dl,
+            "show_k": current.show_k,
+            "calibrated_at": datetime.utcnow().isoformat() + "Z",
+            "source": str(args.log),
+            "queries": len(queries),
+            "requests": int(n),
+            "llm_rate": round(calls / n, 4),
+            "fallback_rate": round(float(w["fallback"][0] / n), 4),
+        }
+        Path(SELECTOR_CONFIG_PATH).parent.mkdir(parents=True, exist_ok=True)
+        Path(SELECTOR_CONFIG_PATH).write_text(json.dumps(out, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[CALIB] Config guardada en {SELECTOR_CONFIG_PATH}")
+
+if __name__ == "__main__":
+    main()
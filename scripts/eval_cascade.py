@@ -0,0 +1,132 @@
+# scripts/eval_cascade.py
+"""
+Evalúa la cascada denso → léxico de app/retriever.buscar_similares.
+
+Sobre un conjunto etiquetado (consulta → faq_id) corre la recuperación con y
+sin cascada y reporta:
+
+  - tasa de consultas resueltas solo con el denso (léxico y fusión salteados)
+  - latencia de buscar_similares (p50 / p95 / p99) con y sin cascada
+  - acuerdo del top-1 con el pipeline completo y acierto@1 contra la etiqueta
+  - la misma tasa/acuerdo para otras compuertas (--grid-score / --grid-margin),
+    calculadas sin volver a recuperar
+
+Sin --labeled, el conjunto se arma con el catálogo: por FAQ, la pregunta tal
+cual, en minúsculas sin tildes ni signos, con las palabras desordenadas y solo
+su primera mitad.
+
+Sale con código 1 si el acuerdo queda por debajo de --min-agreement.
+
+Uso:
+    python -m scripts.eval_cascade --min-agreement 0.99
+    python -m scripts.eval_cascade --labeled data/eval.jsonl --grid-score 0.85,0.9,0.95
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+import app.retriever as retriever
+from app.catalogs import get_catalog
+from app.query_analysis import analyze_query, normalize_text
+
+
+def _labeled_from_catalog(faqs, seed: int = 7):
+    rnd = random.Random(seed)
+    out = []
+    for f in faqs:
+        q = f["pregunta_faq"]
+        words = normalize_text(q).split()
+        shuffled = words[:]
+        rnd.shuffle(shuffled)
+        for variant in (q, " ".join(words), " ".join(shuffled), " ".join(words[: max(2, len(words) // 2)])):
+            out.append({"query": variant, "faq_id": str(f["faq_id"])})
+    return out
+
+
+def _load_labeled(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _pct(values, p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tasa de salteo, latencia y acuerdo de la cascada de recuperación.")
+    ap.add_argument("--labeled", default=None, help="JSONL con {query, faq_id} (por defecto: derivado del catálogo)")
+    ap.add_argument("--tenant", default=None)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--min-score", type=float, default=retriever.CASCADE_MIN_SCORE)
+    ap.add_argument("--min-margin", type=float, default=retriever.CASCADE_MIN_MARGIN)
+    ap.add_argument("--grid-score", default="0.80,0.85,0.90,0.95")
+    ap.add_argument("--grid-margin", default="0.04,0.08,0.12")
+    ap.add_argument("--min-agreement", type=float, default=0.99)
+    args = ap.parse_args()
+
+    catalog = get_catalog(args.tenant)
+    data = _load_labeled(args.labeled) if args.labeled else _labeled_from_catalog(catalog.faqs)
+    queries = [d["query"] for d in data]
+    vecs = retriever.encode_queries(queries)
+    retriever.CASCADE_MIN_SCORE, retriever.CASCADE_MIN_MARGIN = args.min_score, args.min_margin
+
+    def run(enabled: bool):
+        retriever.CASCADE_ENABLED = enabled
+        tops, times, skipped = [], [], []
+        for i, q in enumerate(queries):
+            before = retriever.get_cascade_stats()["dense_only"]
+            t0 = time.perf_counter()
+            cands = retriever.buscar_similares(vecs[i:i + 1], top_k=args.top_k, query_text=q, catalog=catalog)
+            times.append((time.perf_counter() - t0) * 1e6)
+            tops.append(cands.faq_ids()[0] if len(cands) else None)
+            skipped.append(retriever.get_cascade_stats()["dense_only"] > before)
+        return tops, times, skipped
+
+    run(True)  # calentamiento (caches de análisis)
+    casc_top, casc_t, skipped = run(True)
+    full_top, full_t, _ = run(False)
+    skipped_n = sum(skipped)
+
+    labels = [str(d.get("faq_id")) for d in data]
+    n = len(queries)
+    agree = np.mean([a == b for a, b in zip(casc_top, full_top)])
+    acc_full = np.mean([str(t) == y for t, y in zip(full_top, labels)])
+    acc_casc = np.mean([str(t) == y for t, y in zip(casc_top, labels)])
+    print(f"{n} consultas · compuertas: score ≥ {args.min_score}, margen ≥ {args.min_margin}")
+    print(f"  solo denso (léxico + fusión salteados): {skipped_n / n:.1%}")
+    print(f"  latencia µs   completo p50 {_pct(full_t, 50):7.0f}  p95 {_pct(full_t, 95):7.0f}  p99 {_pct(full_t, 99):7.0f}")
+    print(f"                cascada  p50 {_pct(casc_t, 50):7.0f}  p95 {_pct(casc_t, 95):7.0f}  p99 {_pct(casc_t, 99):7.0f}")
+    if skipped_n:
+        sk_full = [t for t, sk in zip(full_t, skipped) if sk]
+        sk_casc = [t for t, sk in zip(casc_t, skipped) if sk]
+        print(f"  consultas salteadas: p50 {_pct(sk_full, 50):.0f} → {_pct(sk_casc, 50):.0f} µs")
+    print(f"  acuerdo top-1 con el completo: {agree:.2%}")
+    print(f"  acierto@1 vs etiqueta: completo {acc_full:.2%} · cascada {acc_casc:.2%}")
+
+    # Otras compuertas: decisión offline con los dos primeros scores densos
+    dense = [retriever._dense_topk(vecs[i:i + 1], k=2, catalog=catalog) for i in range(n)]
+    hinted = [bool(analyze_query(q).hints) for q in queries]
+    print("\n  score  margen  solo denso  acuerdo")
+    for s in (float(x) for x in args.grid_score.split(",")):
+        for m in (float(x) for x in args.grid_margin.split(",")):
+            skip = [
+                not h and len(d) > 0 and d[0][1] >= s and (len(d) < 2 or d[0][1] - d[1][1] >= m)
+                for d, h in zip(dense, hinted)
+            ]
+            ok = [
+                (catalog.faqs[d[0][0]]["faq_id"] == ft) if sk else True
+                for d, sk, ft in zip(dense, skip, full_top)
+            ]
+            print(f"  {s:5.2f}  {m:6.2f}  {np.mean(skip):10.1%}  {np.mean(ok):7.2%}")
+
+    if agree < args.min_agreement:
+        print(f"\n[CASCADE] Acuerdo {agree:.2%} < {args.min_agreement:.2%}: ajustar las compuertas.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
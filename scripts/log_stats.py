@@ -0,0 +1,52 @@
+# scripts/log_stats.py
+"""
+Procesa logs/chat_logs.json hacia los rollups de app/log_stats.py sin levantar la API
+(cron, o para reconstruir la base tras cambiar las dimensiones) e imprime una ventana.
+
+Uso:
+    python -m scripts.log_stats                    # ingesta incremental + resumen 24h
+    python -m scripts.log_stats --rebuild --window all
+    python -m scripts.log_stats --json --window 7d
+"""
+import argparse
+import json
+import time
+
+from app.log_stats import LOG_STATS_DB, WINDOWS, LogStats
+from app.response_selector import LOG_PATH
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rollups incrementales del log de chats (SQLite).")
+    ap.add_argument("--db", default=LOG_STATS_DB)
+    ap.add_argument("--log", default=str(LOG_PATH))
+    ap.add_argument("--window", default="24h", choices=list(WINDOWS))
+    ap.add_argument("--rebuild", action="store_true", help="borra los rollups y reprocesa el log entero")
+    ap.add_argument("--json", action="store_true", help="imprime la vista completa como JSON")
+    args = ap.parse_args()
+
+    ls = LogStats(args.db, args.log)
+    t0 = time.perf_counter()
+    n = ls.rebuild() if args.rebuild else ls.ingest()
+    print(f"[STATS] {n} líneas nuevas en {(time.perf_counter() - t0) * 1000:.0f} ms → {args.db}")
+
+    view = ls.get(args.window) or {}
+    if args.json:
+        print(json.dumps(view, ensure_ascii=False, indent=2))
+        return
+    print(f"\nVentana {args.window}: {view.get('requests', 0)} requests")
+    for dim in ("mode", "decision", "generator", "backend", "gen_outcome", "tenant"):
+        if view.get(dim):
+            print(f"  {dim:12} " + " · ".join(f"{k} {c}" for k, c in view[dim].items()))
+    if view.get("score_hist"):
+        top = max(view["score_hist"].values())
+        print("  best_dense:")
+        for b, c in view["score_hist"].items():
+            print(f"    {b}  {'█' * max(1, round(30 * c / top))} {c}")
+    for dim in ("top_query", "top_faq"):
+        if view.get(dim):
+            print(f"  {dim}: " + ", ".join(f"{e['key']} ({e['count']})" for e in view[dim][:10]))
+
+
+if __name__ == "__main__":
+    main()
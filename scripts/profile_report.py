@@ -0,0 +1,96 @@
+# scripts/profile_report.py
+"""
+Agrega los perfiles guardados en logs/profiles/ (ver app/profiling.py) y
+muestra las N funciones más calientes.
+
+Por defecto ordena por tiempo propio (tottime); con --sort cumtime muestra las
+etapas del pipeline que más tiempo acumulan (incluye lo que llaman). Los
+tiempos se informan en total y en promedio por request perfilado.
+
+Uso:
+    python -m scripts.profile_report --top 25
+    python -m scripts.profile_report --sort cumtime --since 2025-06-01
+    python -m scripts.profile_report --slowest 10 --match inscripción
+"""
+import argparse
+import json
+import os
+import pstats
+from pathlib import Path
+
+from app.profiling import PROFILE_DIR
+
+
+def _load_index(profile_dir: Path):
+    path = profile_dir / "index.jsonl"
+    if not path.exists():
+        return []
+    out = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                out.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # línea cortada por un corte abrupto
+    return out
+
+
+def _short(func) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # builtins: "<method 'encode' ...>"
+    try:
+        filename = os.path.relpath(filename)
+    except ValueError:
+        pass
+    if filename.startswith(".."):
+        parts = Path(filename).parts
+        filename = "/".join(parts[-2:])  # librerías: solo paquete/archivo
+    return f"{filename}:{line}({name})"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Funciones más calientes de los perfiles de requests.")
+    ap.add_argument("--dir", default=str(PROFILE_DIR))
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--sort", choices=["tottime", "cumtime"], default="tottime")
+    ap.add_argument("--since", default=None, help="solo perfiles desde esta fecha (YYYY-MM-DD[THH:MM:SS])")
+    ap.add_argument("--match", default=None, help="solo consultas que contengan este texto")
+    ap.add_argument("--slowest", type=int, default=5, help="listar los N requests perfilados más lentos")
+    args = ap.parse_args()
+
+    profile_dir = Path(args.dir)
+    entries = _load_index(profile_dir)
+    if args.since:
+        entries = [e for e in entries if e.get("ts", "") >= args.since]
+    if args.match:
+        entries = [e for e in entries if args.match.lower() in (e.get("query") or "").lower()]
+    files = [profile_dir / f"{e['profile_id']}.prof" for e in entries]
+    pairs = [(e, f) for e, f in zip(entries, files) if f.exists()]
+    if not pairs:
+        print(f"[PROFILE] No hay perfiles en {profile_dir} con esos filtros.")
+        return
+
+    stats = pstats.Stats(str(pairs[0][1]))
+    for _, f in pairs[1:]:
+        stats.add(str(f))
+    n = len(pairs)
+    walls = sorted(e["wall_ms"] for e, _ in pairs)
+    print(f"{n} requests perfilados · wall p50 {walls[n // 2]:.0f} ms · p95 {walls[int(0.95 * (n - 1))]:.0f} ms")
+
+    key = 2 if args.sort == "tottime" else 3  # (cc, nc, tt, ct, callers)
+    rows = sorted(stats.stats.items(), key=lambda kv: kv[1][key], reverse=True)[: args.top]
+    print(f"\nTop {args.top} por {args.sort}:")
+    print(f"{'llamadas':>10} {'tottime s':>10} {'cumtime s':>10} {'ms/request':>11}  función")
+    for func, (cc, nc, tt, ct, _) in rows:
+        per_req = (tt if key == 2 else ct) / n * 1000
+        print(f"{nc:>10} {tt:>10.3f} {ct:>10.3f} {per_req:>11.2f}  {_short(func)}")
+
+    if args.slowest:
+        print("\nRequests más lentos:")
+        for e, _ in sorted(pairs, key=lambda p: p[0]["wall_ms"], reverse=True)[: args.slowest]:
+            print(f"  {e['wall_ms']:>8.0f} ms  {e.get('mode') or '-':<11} {e['profile_id']}  {e.get('query')!r}")
+
+
+if __name__ == "__main__":
+    main()
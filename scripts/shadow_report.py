@@ -0,0 +1,85 @@
+# scripts/shadow_report.py
+"""
+Resumen del modo sombra (app/shadow.py) a partir de SHADOW_LOG.
+
+Por variante:
+  - requests evaluados y acuerdo del top-1 (base = config de serving vs alternativa)
+  - solapamiento medio del top-k
+  - matriz de cambios de decisión del selector (base → alt)
+  - latencia de recuperación y selección (p50 / p95) de base y alternativa
+  - demora entre el request real y su evaluación en sombra (cola)
+  - con --examples N, consultas donde cambió el top-1 o la decisión
+
+Uso:
+    python -m scripts.shadow_report
+    python -m scripts.shadow_report --since 2026-10-01 --examples 10
+"""
+import argparse
+import json
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from app.shadow import SHADOW_LOG
+
+
+def _pct(values, p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Diferencias entre la config de serving y las variantes en sombra.")
+    ap.add_argument("--log", default=str(SHADOW_LOG))
+    ap.add_argument("--since", default=None, help="solo filas con ts >= este prefijo ISO (ej. 2026-10-01)")
+    ap.add_argument("--variant", default=None)
+    ap.add_argument("--examples", type=int, default=0)
+    args = ap.parse_args()
+
+    rows = defaultdict(list)
+    with open(args.log, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            if args.since and r.get("ts", "") < args.since:
+                continue
+            if args.variant and r["variant"] != args.variant:
+                continue
+            rows[r["variant"]].append(r)
+    if not rows:
+        print("[SHADOW] Sin filas para resumir.")
+        return
+
+    for name, rs in rows.items():
+        n = len(rs)
+        agree = np.mean([r["top1_agree"] for r in rs])
+        overlap = np.mean([
+            len(set(r["base"]["top"]) & set(r["alt"]["top"])) / max(1, len(r["base"]["top"])) for r in rs
+        ])
+        changed = [r for r in rs if r["decision_changed"]]
+        print(f"== {name}: {n} requests ({rs[0]['ts'][:16]} → {rs[-1]['ts'][:16]})")
+        print(f"  acuerdo top-1 {agree:.2%} · solapamiento top-k {overlap:.2%} · decisión cambiada {len(changed) / n:.2%}")
+
+        matrix = Counter((r["base"]["decision"], r["alt"]["decision"]) for r in changed)
+        for (b, a), c in matrix.most_common():
+            print(f"    {b:>22} → {a:<22} {c:5d}  ({c / n:.1%})")
+
+        print(f"  {'ms':12} {'base p50':>9} {'p95':>7} {'alt p50':>9} {'p95':>7}")
+        for stage in ("retrieve_ms", "select_ms"):
+            b = [r["base"][stage] for r in rs]
+            a = [r["alt"][stage] for r in rs]
+            print(f"  {stage[:-3]:12} {_pct(b, 50):9.3f} {_pct(b, 95):7.3f} {_pct(a, 50):9.3f} {_pct(a, 95):7.3f}")
+        lag = [r["lag_ms"] for r in rs]
+        print(f"  encode (caché) p50 {_pct([r['encode_ms'] for r in rs], 50):.3f} ms · "
+              f"demora en cola p50 {_pct(lag, 50):.0f} ms, p95 {_pct(lag, 95):.0f} ms")
+
+        if args.examples:
+            diff = [r for r in rs if not r["top1_agree"] or r["decision_changed"]][: args.examples]
+            for r in diff:
+                print(f"    · {r['query']!r}: top-1 {r['base']['top'][:1]} → {r['alt']['top'][:1]}, "
+                      f"{r['base']['decision']} → {r['alt']['decision']}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
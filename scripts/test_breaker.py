@@ -0,0 +1,67 @@
+# scripts/test_breaker.py
+"""
+Regresión del circuit breaker con hedging (app/generator.rewrite_with_meta).
+
+Secuencia: el primario falla una vez (circuito abierto), tras el enfriamiento
+su prueba de half_open tarda y gana la cobertura, y después el primario vuelve
+a estar sano. La prueba abandonada tiene que registrarse al terminar: si no,
+el breaker queda en half_open con la prueba tomada y todo sale short_circuit.
+
+Backends falsos (sin red). Uso:
+    python -m scripts.test_breaker
+"""
+import os
+import time
+
+# Antes de importar el generador: los defaults del breaker se leen al cargar el módulo
+os.environ.update(GEN_BACKEND="ollama", GEN_BREAKER_FAILURES="1", GEN_BREAKER_COOLDOWN_S="0.2",
+                  GEN_CACHE_SIZE="0")
+
+from app import generator  # noqa: E402
+
+
+class FakeBackend(generator.GeneratorBackend):
+    def __init__(self, name: str):
+        self.name = name
+        self.plan = []          # acciones pendientes: "fail" o segundos de espera
+        self.default = 0.0
+
+    def rewrite(self, query, base_answer, context_pairs, mode="polish", timeout=None) -> str:
+        action = self.plan.pop(0) if self.plan else self.default
+        if action == "fail":
+            raise RuntimeError(f"{self.name} caído")
+        time.sleep(action)
+        return f"{self.name}: {query}"
+
+
+def main():
+    fakes = {"ollama": FakeBackend("ollama"), "openai": FakeBackend("openai")}
+    generator._make_backend = lambda name: fakes[name]
+    generator.GEN_HEDGE_BACKEND = "openai"
+    generator.GEN_HEDGE_DELAY_MS = 50
+    breaker = generator.get_breaker("ollama")
+
+    # 1) falla el primario → circuito abierto; contesta la cobertura
+    fakes["ollama"].plan = ["fail"]
+    _, info = generator.rewrite_with_meta("uno", "base")
+    print("1)", info["outcome"], info["winner"], breaker.state)
+    assert info["winner"] == "openai" and breaker.state == "open"
+
+    # 2) half_open: la prueba del primario tarda y gana la cobertura
+    time.sleep(0.25)
+    fakes["ollama"].plan = [0.4]
+    _, info = generator.rewrite_with_meta("dos", "base")
+    print("2)", info["outcome"], info["winner"], breaker.state)
+    assert info["winner"] == "openai"
+
+    # 3) la prueba abandonada termina bien → el primario vuelve a atender
+    time.sleep(0.5)
+    text, info = generator.rewrite_with_meta("tres", "base")
+    print("3)", info["outcome"], info["winner"], breaker.state)
+    assert info["outcome"] == "ok" and info["winner"] == "ollama", info
+    assert breaker.state == "closed" and not breaker._trial_in_flight
+    print("OK: el breaker se recupera tras una prueba de half_open abandonada")
+
+
+if __name__ == "__main__":
+    main()